@@ -0,0 +1,28 @@
+"""board revisions for conditional reads
+
+Revision ID: 3f9c2a7d1e04
+Revises: b1234567890a
+Create Date: 2026-10-19 09:12:31.402817
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f9c2a7d1e04'
+down_revision: Union[str, None] = 'b1234567890a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('boards', sa.Column('revision', sa.Integer(), server_default='0', nullable=False))
+    op.create_index('ix_board_members_board_id_user_id', 'board_members', ['board_id', 'user_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_board_members_board_id_user_id', table_name='board_members')
+    op.drop_column('boards', 'revision')
@@ -0,0 +1,41 @@
+"""board change log for delta sync
+
+Revision ID: 7a4e91c0b2d5
+Revises: 3f9c2a7d1e04
+Create Date: 2026-10-19 14:03:52.118604
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7a4e91c0b2d5'
+down_revision: Union[str, None] = '3f9c2a7d1e04'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('board_changes',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('board_id', sa.Integer(), nullable=False),
+    sa.Column('revision', sa.Integer(), nullable=False),
+    sa.Column('entity', sa.String(length=16), nullable=False),
+    sa.Column('entity_id', sa.Integer(), nullable=False),
+    sa.Column('op', sa.String(length=8), nullable=False),
+    sa.ForeignKeyConstraint(['board_id'], ['boards.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_board_changes_board_id_revision', 'board_changes', ['board_id', 'revision'], unique=False)
+    op.add_column('boards', sa.Column('change_log_floor', sa.Integer(), server_default='0', nullable=False))
+    # Nothing before this point was logged, so existing boards can only replay from here
+    op.execute('UPDATE boards SET change_log_floor = revision')
+
+
+def downgrade() -> None:
+    op.drop_column('boards', 'change_log_floor')
+    op.drop_index('ix_board_changes_board_id_revision', table_name='board_changes')
+    op.drop_table('board_changes')
@@ -0,0 +1,38 @@
+"""pg_trgm indexes for substring search
+
+Revision ID: a2c4e6f8b0d1
+Revises: e8b2d4f6a1c3
+Create Date: 2026-10-20 11:04:17.362915
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a2c4e6f8b0d1'
+down_revision: Union[str, None] = 'e8b2d4f6a1c3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Columns /search?match=substring looks in with ILIKE '%q%'. Databases built with create_all
+# already have these indexes from app.fulltext, hence IF NOT EXISTS
+COLUMNS = {
+    'boards': ('title',),
+    'lists': ('title',),
+    'cards': ('title', 'description'),
+}
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for table, columns in COLUMNS.items():
+        for column in columns:
+            op.execute(f"CREATE INDEX IF NOT EXISTS ix_{table}_{column}_trgm ON {table} USING gin ({column} gin_trgm_ops)")
+
+
+def downgrade() -> None:
+    for table, columns in COLUMNS.items():
+        for column in columns:
+            op.execute(f"DROP INDEX IF EXISTS ix_{table}_{column}_trgm")
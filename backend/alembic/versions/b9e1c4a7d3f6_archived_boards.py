@@ -0,0 +1,41 @@
+"""archived boards
+
+Revision ID: b9e1c4a7d3f6
+Revises: a7d3e5f9c2b4
+Create Date: 2026-10-19 20:48:11.730562
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b9e1c4a7d3f6'
+down_revision: Union[str, None] = 'a7d3e5f9c2b4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('boards', sa.Column('archived_at', sa.DateTime(timezone=True), nullable=True))
+    op.create_index(op.f('ix_boards_archived_at'), 'boards', ['archived_at'], unique=False)
+    op.create_table('archived_boards',
+    sa.Column('board_id', sa.Integer(), nullable=False),
+    sa.Column('data', sa.LargeBinary(), nullable=False),
+    sa.Column('row_count', sa.Integer(), nullable=False),
+    sa.Column('raw_bytes', sa.Integer(), nullable=False),
+    sa.Column('archived_at', sa.DateTime(timezone=True), nullable=False),
+    sa.ForeignKeyConstraint(['board_id'], ['boards.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('board_id')
+    )
+    # The sweeper looks up each board's latest activity
+    op.create_index('ix_activities_board_id_created_at', 'activities', ['board_id', 'created_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_activities_board_id_created_at', table_name='activities')
+    op.drop_table('archived_boards')
+    op.drop_index(op.f('ix_boards_archived_at'), table_name='boards')
+    op.drop_column('boards', 'archived_at')
@@ -0,0 +1,92 @@
+"""board label palette
+
+Revision ID: c3f6d8b2e9a1
+Revises: b9e1c4a7d3f6
+Create Date: 2026-10-19 21:36:02.914417
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3f6d8b2e9a1'
+down_revision: Union[str, None] = 'b9e1c4a7d3f6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('board_labels',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('board_id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('color', sa.String(), nullable=False),
+    sa.ForeignKeyConstraint(['board_id'], ['boards.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_board_labels_id'), 'board_labels', ['id'], unique=False)
+    op.create_index('ix_board_labels_board_id_name_color', 'board_labels', ['board_id', 'name', 'color'], unique=True)
+    op.create_table('card_labels',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('card_id', sa.Integer(), nullable=False),
+    sa.Column('label_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['card_id'], ['cards.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['label_id'], ['board_labels.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+    # One palette entry per distinct (name, color) used on each board
+    op.execute("""
+        INSERT INTO board_labels (board_id, name, color)
+        SELECT DISTINCT lists.board_id, COALESCE(labels.name, ''), COALESCE(labels.color, '')
+        FROM labels
+        JOIN cards ON cards.id = labels.card_id
+        JOIN lists ON lists.id = cards.list_id
+        WHERE lists.board_id IS NOT NULL
+    """)
+    # Card labels keep the ids of the rows they replace, which clients already hold;
+    # a label repeated on one card keeps its lowest id
+    op.execute("""
+        INSERT INTO card_labels (id, card_id, label_id)
+        SELECT MIN(labels.id), labels.card_id, board_labels.id
+        FROM labels
+        JOIN cards ON cards.id = labels.card_id
+        JOIN lists ON lists.id = cards.list_id
+        JOIN board_labels ON board_labels.board_id = lists.board_id
+            AND board_labels.name = COALESCE(labels.name, '')
+            AND board_labels.color = COALESCE(labels.color, '')
+        GROUP BY labels.card_id, board_labels.id
+    """)
+    op.execute("SELECT setval(pg_get_serial_sequence('card_labels', 'id'), COALESCE((SELECT MAX(id) FROM card_labels), 0) + 1, false)")
+
+    op.create_index('ix_card_labels_card_id_label_id', 'card_labels', ['card_id', 'label_id'], unique=True)
+    op.create_index('ix_card_labels_label_id_card_id', 'card_labels', ['label_id', 'card_id'], unique=False)
+    op.drop_index('ix_labels_id', table_name='labels')
+    op.drop_table('labels')
+
+
+def downgrade() -> None:
+    op.create_table('labels',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(), nullable=True),
+    sa.Column('color', sa.String(), nullable=True),
+    sa.Column('card_id', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['card_id'], ['cards.id'], name='labels_card_id_fkey', ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_labels_id', 'labels', ['id'], unique=False)
+    op.execute("""
+        INSERT INTO labels (id, name, color, card_id)
+        SELECT card_labels.id, board_labels.name, board_labels.color, card_labels.card_id
+        FROM card_labels JOIN board_labels ON board_labels.id = card_labels.label_id
+    """)
+    op.execute("SELECT setval(pg_get_serial_sequence('labels', 'id'), COALESCE((SELECT MAX(id) FROM labels), 0) + 1, false)")
+    op.drop_index('ix_card_labels_label_id_card_id', table_name='card_labels')
+    op.drop_index('ix_card_labels_card_id_label_id', table_name='card_labels')
+    op.drop_table('card_labels')
+    op.drop_index('ix_board_labels_board_id_name_color', table_name='board_labels')
+    op.drop_index(op.f('ix_board_labels_id'), table_name='board_labels')
+    op.drop_table('board_labels')
@@ -0,0 +1,37 @@
+"""full-text search vectors for boards, lists and cards
+
+Revision ID: d8a1f4b6c293
+Revises: c52d8e3f6a17
+Create Date: 2026-10-19 17:22:45.108314
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd8a1f4b6c293'
+down_revision: Union[str, None] = 'c52d8e3f6a17'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Generated columns keep themselves up to date; the title outweighs the description
+VECTORS = {
+    'boards': "setweight(to_tsvector('english', coalesce(title, '')), 'A')",
+    'lists': "setweight(to_tsvector('english', coalesce(title, '')), 'A')",
+    'cards': "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+             "setweight(to_tsvector('english', coalesce(description, '')), 'B')",
+}
+
+
+def upgrade() -> None:
+    for table, vector in VECTORS.items():
+        op.execute(f"ALTER TABLE {table} ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ({vector}) STORED")
+        op.execute(f"CREATE INDEX ix_{table}_search_vector ON {table} USING gin (search_vector)")
+
+
+def downgrade() -> None:
+    for table in VECTORS:
+        op.execute(f"DROP INDEX ix_{table}_search_vector")
+        op.execute(f"ALTER TABLE {table} DROP COLUMN search_vector")
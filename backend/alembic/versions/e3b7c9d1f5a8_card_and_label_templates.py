@@ -0,0 +1,50 @@
+"""card and label templates
+
+Revision ID: e3b7c9d1f5a8
+Revises: d8a1f4b6c293
+Create Date: 2026-10-19 18:05:12.402871
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e3b7c9d1f5a8'
+down_revision: Union[str, None] = 'd8a1f4b6c293'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('card_templates',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('title', sa.String(), nullable=True),
+    sa.Column('description', sa.String(), nullable=True),
+    sa.Column('list_template_id', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['list_template_id'], ['list_templates.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_card_templates_id'), 'card_templates', ['id'], unique=False)
+    op.create_index(op.f('ix_card_templates_list_template_id'), 'card_templates', ['list_template_id'], unique=False)
+    op.create_table('label_templates',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(), nullable=True),
+    sa.Column('color', sa.String(), nullable=True),
+    sa.Column('card_template_id', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['card_template_id'], ['card_templates.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_label_templates_id'), 'label_templates', ['id'], unique=False)
+    op.create_index(op.f('ix_label_templates_card_template_id'), 'label_templates', ['card_template_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_label_templates_card_template_id'), table_name='label_templates')
+    op.drop_index(op.f('ix_label_templates_id'), table_name='label_templates')
+    op.drop_table('label_templates')
+    op.drop_index(op.f('ix_card_templates_list_template_id'), table_name='card_templates')
+    op.drop_index(op.f('ix_card_templates_id'), table_name='card_templates')
+    op.drop_table('card_templates')
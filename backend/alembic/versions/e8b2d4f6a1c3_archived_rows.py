@@ -0,0 +1,50 @@
+"""archived rows
+
+Revision ID: e8b2d4f6a1c3
+Revises: d5a9c1e7f3b2
+Create Date: 2026-10-20 09:12:44.531207
+
+"""
+import json
+import zlib
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e8b2d4f6a1c3'
+down_revision: Union[str, None] = 'd5a9c1e7f3b2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('archived_rows',
+    sa.Column('table_name', sa.String(length=32), nullable=False),
+    sa.Column('row_id', sa.Integer(), nullable=False),
+    sa.Column('board_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['board_id'], ['boards.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('table_name', 'row_id')
+    )
+    op.create_index(op.f('ix_archived_rows_board_id'), 'archived_rows', ['board_id'], unique=False)
+    # Index the boards archived before this table existed, one board at a time
+    bind = op.get_bind()
+    archived_rows = sa.table('archived_rows', sa.column('table_name'), sa.column('row_id'), sa.column('board_id'))
+    for board_id, data in bind.execute(sa.text("SELECT board_id, data FROM archived_boards")).all():
+        tables = json.loads(zlib.decompress(data))["tables"]
+        rows = []
+        for name in ('lists', 'cards', 'attachments'):
+            stored = tables.get(name) or {"columns": [], "rows": []}
+            if not stored["rows"]:
+                continue
+            id_index = stored["columns"].index('id')
+            rows += [{"table_name": name, "row_id": row[id_index], "board_id": board_id} for row in stored["rows"]]
+        if rows:
+            op.bulk_insert(archived_rows, rows)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_archived_rows_board_id'), table_name='archived_rows')
+    op.drop_table('archived_rows')
@@ -0,0 +1,52 @@
+"""cascading deletes and soft-deleted boards
+
+Revision ID: f4c8a2e6b1d9
+Revises: e3b7c9d1f5a8
+Create Date: 2026-10-19 19:12:40.118305
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f4c8a2e6b1d9'
+down_revision: Union[str, None] = 'e3b7c9d1f5a8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (table, column, referenced table)
+CASCADING = [
+    ('lists', 'board_id', 'boards'),
+    ('cards', 'list_id', 'lists'),
+    ('labels', 'card_id', 'cards'),
+    ('comments', 'card_id', 'cards'),
+    ('attachments', 'card_id', 'cards'),
+    ('activities', 'board_id', 'boards'),
+    ('board_members', 'board_id', 'boards'),
+    ('board_changes', 'board_id', 'boards'),
+    ('list_templates', 'board_template_id', 'board_templates'),
+    ('card_templates', 'list_template_id', 'list_templates'),
+    ('label_templates', 'card_template_id', 'card_templates'),
+]
+
+
+def _recreate_foreign_keys(ondelete: Union[str, None]) -> None:
+    for table, column, referred in CASCADING:
+        name = f'{table}_{column}_fkey'
+        op.drop_constraint(name, table, type_='foreignkey')
+        op.create_foreign_key(name, table, referred, [column], ['id'], ondelete=ondelete)
+
+
+def upgrade() -> None:
+    _recreate_foreign_keys('CASCADE')
+    op.add_column('boards', sa.Column('deleted_at', sa.DateTime(timezone=True), nullable=True))
+    op.create_index(op.f('ix_boards_deleted_at'), 'boards', ['deleted_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_boards_deleted_at'), table_name='boards')
+    op.drop_column('boards', 'deleted_at')
+    _recreate_foreign_keys(None)
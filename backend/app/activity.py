@@ -0,0 +1,169 @@
+# app/activity.py
+import asyncio
+import logging
+import os
+import threading
+from datetime import datetime, timezone
+from typing import Optional
+import anyio
+from sqlalchemy import event, insert, select
+from sqlalchemy.orm import Session
+from . import metrics, models
+
+logger = logging.getLogger(__name__)
+
+# "transaction" writes activity rows in the request's own transaction (one multi-row
+# INSERT just before it commits); "background" hands them to ActivityBatcher after
+# the commit, trading a small delay for nothing on the request path at all
+ACTIVITY_WRITE_MODE = os.getenv("ACTIVITY_WRITE_MODE", "transaction")
+
+
+def record(db: Session, board_id: int, user_id: Optional[int], activity_type: models.ActivityType, details: str) -> None:
+    """Queue an activity row on ``db``; it is written when ``db`` commits, never on its own."""
+    db.info.setdefault("pending_activity", []).append({
+        "board_id": board_id,
+        "user_id": user_id,
+        "activity_type": activity_type.value,
+        "details": details,
+        "created_at": datetime.now(timezone.utc),
+    })
+
+
+def insert_activity(connection, rows: list) -> None:
+    connection.execute(insert(models.Activity.__table__), rows)
+
+
+def _by_board(rows: list) -> list:
+    groups = {}
+    for row in rows:
+        groups.setdefault(row["board_id"], []).append(row)
+    return list(groups.values())
+
+
+class ActivityBatcher:
+    """Writes committed activity rows from a background task in multi-row chunks.
+
+    Rows are flushed every ``interval`` seconds or as soon as ``max_batch`` are waiting,
+    and ``stop`` drains whatever is left, so a clean shutdown loses nothing. Rows for
+    boards deleted in the meantime are left out rather than failing their chunk.
+    """
+
+    def __init__(self, interval: float, max_batch: int):
+        self.interval = interval
+        self.max_batch = max_batch
+        self._pending = []  # (engine, row)
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    async def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        await anyio.to_thread.run_sync(self.flush)
+
+    def enqueue(self, engine, rows: list) -> None:
+        """Accept rows from a post-commit hook on any thread."""
+        if not self.running:
+            # Nothing to hand them to (e.g. no lifespan); write them straight away
+            with engine.begin() as connection:
+                insert_activity(connection, rows)
+            return
+        with self._lock:
+            self._pending.extend((engine, row) for row in rows)
+            full = len(self._pending) >= self.max_batch
+        if full:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def flush(self) -> int:
+        """Write everything pending; returns the number of rows written."""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        by_engine = {}
+        for engine, row in pending:
+            by_engine.setdefault(engine, []).append(row)
+        for engine, rows in by_engine.items():
+            for start in range(0, len(rows), self.max_batch):
+                chunk = rows[start:start + self.max_batch]
+                try:
+                    written = self._write(engine, chunk)
+                except Exception:
+                    # A board can still go between the check and the insert; retry board
+                    # by board so only its rows are lost
+                    written = 0
+                    for board_rows in _by_board(chunk):
+                        try:
+                            written += self._write(engine, board_rows)
+                        except Exception:
+                            logger.exception("Dropped %d activity rows after a failed write", len(board_rows))
+                metrics.increment("activity.batched_rows", written)
+                metrics.increment("activity.dropped", len(chunk) - written)
+        return len(pending)
+
+    @staticmethod
+    def _write(engine, rows: list) -> int:
+        """Insert the rows whose board still exists; returns how many that was."""
+        with engine.begin() as connection:
+            board_ids = {row["board_id"] for row in rows} - {None}
+            live = set(connection.scalars(select(models.Board.id).where(models.Board.id.in_(board_ids))))
+            rows = [row for row in rows if row["board_id"] is None or row["board_id"] in live]
+            if rows:
+                insert_activity(connection, rows)
+        return len(rows)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await anyio.to_thread.run_sync(self.flush)
+
+
+batcher = ActivityBatcher(
+    interval=float(os.getenv("ACTIVITY_FLUSH_SECONDS", "1.0")),
+    max_batch=int(os.getenv("ACTIVITY_BATCH_SIZE", "500")),
+)
+
+
+def _in_transaction(session) -> bool:
+    # An atomic /batch may still roll back after this commit, so its rows stay in it
+    return ACTIVITY_WRITE_MODE != "background" or session.info.get("hold_notifications", False)
+
+
+@event.listens_for(Session, "before_commit")
+def _write_activity(session):
+    if not _in_transaction(session):
+        return
+    rows = session.info.pop("pending_activity", None)
+    if rows:
+        insert_activity(session.connection(), rows)
+
+
+@event.listens_for(Session, "after_commit")
+def _enqueue_activity(session):
+    if _in_transaction(session):
+        return
+    rows = session.info.pop("pending_activity", None)
+    if rows:
+        batcher.enqueue(session.get_bind().engine, rows)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_activity(session):
+    session.info.pop("pending_activity", None)
@@ -0,0 +1,257 @@
+# app/archive.py
+#
+# Cold storage for inactive boards. A board nobody has touched for
+# BOARD_ARCHIVE_AFTER_DAYS has its lists, cards, label palette, card labels, comments,
+# attachment rows and activity packed into one zlib-compressed JSON blob in
+# archived_boards and deleted from the hot tables; the board row itself, its members
+# and its attachment files stay, so it is still listed and shared as before. The ids of
+# its lists, cards and attachments are kept in archived_rows, so a request naming any
+# of them finds the board. The first request that resolves the board, by its own id,
+# one of those ids or a search, puts every row back under its original id; async
+# handlers do that on a worker thread.
+import asyncio
+import json
+import logging
+import os
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+import anyio
+from sqlalchemy import DateTime, delete, func, insert, literal, select, update
+from sqlalchemy.orm import Session
+from . import metrics, models
+from .board_revisions import record_board_changes
+
+logger = logging.getLogger(__name__)
+
+# 0 turns the sweeper off
+BOARD_ARCHIVE_AFTER_DAYS = int(os.getenv("BOARD_ARCHIVE_AFTER_DAYS", "365"))
+BOARD_ARCHIVE_SWEEP_INTERVAL = float(os.getenv("BOARD_ARCHIVE_SWEEP_INTERVAL", str(24 * 60 * 60)))
+# Boards archived per sweep, each in its own transaction
+BOARD_ARCHIVE_SWEEP_LIMIT = int(os.getenv("BOARD_ARCHIVE_SWEEP_LIMIT", "100"))
+# Rows per multi-row INSERT when a board is rehydrated
+REHYDRATE_BATCH = 1000
+# Tables whose rows are looked up by id on their own, and so are listed in archived_rows
+INDEXED_TABLES = ("lists", "cards", "attachments")
+
+
+def subtree(board_id: int) -> list:
+    """(table, id SELECT) for every table under the board, parents before children."""
+    lists = select(models.List.id).where(models.List.board_id == board_id)
+    cards = select(models.Card.id).where(models.Card.list_id.in_(lists))
+    return [
+        (models.List.__table__, lists),
+        (models.Card.__table__, cards),
+        (models.BoardLabel.__table__, select(models.BoardLabel.id).where(models.BoardLabel.board_id == board_id)),
+        (models.CardLabel.__table__, select(models.CardLabel.id).where(models.CardLabel.card_id.in_(cards))),
+        (models.Comment.__table__, select(models.Comment.id).where(models.Comment.card_id.in_(cards))),
+        (models.Attachment.__table__, select(models.Attachment.id).where(models.Attachment.card_id.in_(cards))),
+        (models.Activity.__table__, select(models.Activity.id).where(models.Activity.board_id == board_id)),
+    ]
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot archive {type(value).__name__}")
+
+
+def _decode(table, columns: list, rows: list) -> list:
+    dates = [i for i, name in enumerate(columns) if isinstance(table.c[name].type, DateTime)]
+    decoded = []
+    for row in rows:
+        row = list(row)
+        for i in dates:
+            if row[i] is not None:
+                row[i] = datetime.fromisoformat(row[i])
+        decoded.append(dict(zip(columns, row)))
+    return decoded
+
+
+def last_activity():
+    """Per-board time of the latest activity, falling back to the board's own timestamps."""
+    latest = (
+        select(models.Activity.board_id, func.max(models.Activity.created_at).label("at"))
+        .group_by(models.Activity.board_id)
+        .subquery()
+    )
+    return latest, func.coalesce(latest.c.at, models.Board.updated_at, models.Board.created_at)
+
+
+def inactive_boards(db: Session, cutoff: datetime, limit: int) -> list:
+    latest, last_at = last_activity()
+    return db.scalars(
+        select(models.Board.id)
+        .outerjoin(latest, latest.c.board_id == models.Board.id)
+        .where(models.Board.archived_at.is_(None), models.Board.deleted_at.is_(None), last_at < cutoff)
+        .order_by(last_at)
+        .limit(limit)
+    ).all()
+
+
+def archive_board(db: Session, board_id: int) -> bool:
+    """Move the board's subtree into archived_boards and commit; False if it was already archived or gone."""
+    # Claims the board (and, on Postgres, locks its row against concurrent writers,
+    # whose revision bumps wait on it) before anything is read
+    claimed = db.execute(
+        update(models.Board)
+        .where(models.Board.id == board_id, models.Board.archived_at.is_(None), models.Board.deleted_at.is_(None))
+        .values(archived_at=datetime.now(timezone.utc))
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not claimed:
+        db.rollback()
+        return False
+
+    tables_and_ids = subtree(board_id)
+    tables, row_count = {}, 0
+    for table, ids in tables_and_ids:
+        result = db.execute(select(table).where(table.c.id.in_(ids)).order_by(table.c.id))
+        rows = [list(row) for row in result]
+        tables[table.name] = {"columns": list(result.keys()), "rows": rows}
+        row_count += len(rows)
+    raw = json.dumps({"version": 1, "tables": tables}, default=_encode, separators=(",", ":")).encode()
+    data = zlib.compress(raw)
+    db.execute(insert(models.ArchivedBoard).values(
+        board_id=board_id, data=data, row_count=row_count, raw_bytes=len(raw),
+        archived_at=datetime.now(timezone.utc),
+    ))
+    for table, ids in tables_and_ids:
+        if table.name in INDEXED_TABLES:
+            db.execute(insert(models.ArchivedRow).from_select(
+                ["table_name", "row_id", "board_id"],
+                select(literal(table.name), table.c.id, literal(board_id)).where(table.c.id.in_(ids)),
+            ))
+    # Children first, so this doesn't depend on ON DELETE CASCADE being enforced
+    for table, ids in reversed(tables_and_ids):
+        db.execute(delete(table).where(table.c.id.in_(ids)))
+    _restart_change_log(db, board_id)
+    db.commit()
+    metrics.increment("archive.boards")
+    metrics.increment("archive.rows", row_count)
+    metrics.increment("archive.bytes", len(data))
+    return True
+
+
+def _restart_change_log(db: Session, board_id: int) -> None:
+    # The log can't describe rows leaving or coming back wholesale: move the revision on
+    # and drop the log, so caches go stale and clients with an older revision resync
+    revision = record_board_changes(db, {board_id})[board_id]
+    db.execute(delete(models.BoardChange).where(models.BoardChange.board_id == board_id))
+    db.execute(
+        update(models.Board).where(models.Board.id == board_id)
+        .values(change_log_floor=revision)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def rehydrate(bind, board_id: int) -> bool:
+    """Put an archived board's rows back, on a session of its own; False if another request got there first."""
+    with Session(bind=bind) as db:
+        # Deleting the archive row first means only one request restores it
+        archived = db.execute(
+            delete(models.ArchivedBoard).where(models.ArchivedBoard.board_id == board_id)
+            .returning(models.ArchivedBoard.data)
+        ).first()
+        if archived is None:
+            db.rollback()
+            return False
+        tables = json.loads(zlib.decompress(archived.data))["tables"]
+        for table, _ in subtree(board_id):
+            stored = tables.get(table.name)
+            if not stored or not stored["rows"]:
+                continue
+            rows = _decode(table, stored["columns"], stored["rows"])
+            for start in range(0, len(rows), REHYDRATE_BATCH):
+                db.execute(insert(table), rows[start:start + REHYDRATE_BATCH])
+        db.execute(delete(models.ArchivedRow).where(models.ArchivedRow.board_id == board_id))
+        db.execute(
+            update(models.Board).where(models.Board.id == board_id)
+            .values(archived_at=None)
+            .execution_options(synchronize_session=False)
+        )
+        _restart_change_log(db, board_id)
+        db.commit()
+    metrics.increment("archive.rehydrated")
+    return True
+
+
+def ensure_live(db: Session, board: models.Board) -> models.Board:
+    """Rehydrate ``board`` if it is archived; called on every board read."""
+    if board.archived_at is not None:
+        rehydrate(db.get_bind(), board.id)
+        db.refresh(board)
+    return board
+
+
+def _rehydrate_all(db: Session, board_ids) -> None:
+    for board_id in board_ids:
+        rehydrate(db.get_bind(), board_id)
+    if board_ids:
+        # Objects already loaded on this session may still say the board is archived
+        db.expire_all()
+
+
+def ensure_boards_live(db: Session, board_ids) -> None:
+    """Rehydrate whichever of ``board_ids`` (ids or a SELECT of them) are archived."""
+    _rehydrate_all(db, db.scalars(
+        select(models.Board.id).where(models.Board.id.in_(board_ids), models.Board.archived_at.is_not(None))
+    ).all())
+
+
+def ensure_rows_live(db: Session, model, ids) -> None:
+    """Rehydrate the archived boards holding any of ``ids`` of ``model`` (a list, card or attachment)."""
+    _rehydrate_all(db, db.scalars(
+        select(models.ArchivedRow.board_id)
+        .where(models.ArchivedRow.table_name == model.__tablename__, models.ArchivedRow.row_id.in_(ids))
+        .distinct()
+    ).all())
+
+
+def sweep(session_factory, now: Optional[datetime] = None) -> int:
+    """Archive boards inactive for BOARD_ARCHIVE_AFTER_DAYS; returns how many were archived."""
+    cutoff = (now or datetime.now(timezone.utc)) - timedelta(days=BOARD_ARCHIVE_AFTER_DAYS)
+    archived = 0
+    with session_factory() as db:
+        board_ids = inactive_boards(db, cutoff, BOARD_ARCHIVE_SWEEP_LIMIT)
+    for board_id in board_ids:
+        with session_factory() as db:
+            try:
+                archived += archive_board(db, board_id)
+            except Exception:
+                db.rollback()
+                logger.exception("Archiving board %s failed", board_id)
+    return archived
+
+
+class ArchiveSweeper:
+    """Runs ``sweep`` every ``interval`` seconds from a background task."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, session_factory) -> None:
+        self._task = asyncio.create_task(self._run(session_factory))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    async def _run(self, session_factory) -> None:
+        while True:
+            try:
+                archived = await anyio.to_thread.run_sync(sweep, session_factory)
+                if archived:
+                    logger.info("Archived %d inactive boards", archived)
+            except Exception:
+                logger.exception("Board archive sweep failed")
+            await asyncio.sleep(self.interval)
+
+
+sweeper = ArchiveSweeper(interval=BOARD_ARCHIVE_SWEEP_INTERVAL)
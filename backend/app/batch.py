@@ -0,0 +1,178 @@
+# app/batch.py
+import asyncio
+import json
+import os
+import re
+from typing import Optional
+from fastapi import Request
+from sqlalchemy.orm import Session
+from . import models, schemas
+from .board_revisions import release_notifications
+from .exceptions import BadRequestException
+
+BATCH_MAX_REQUESTS = 50
+# Upper bound on read sub-requests in flight at once in concurrent mode
+BATCH_MAX_CONCURRENCY = 8
+# Seconds one sub-request may take before it is abandoned with a 504
+BATCH_REQUEST_TIMEOUT = float(os.getenv("BATCH_REQUEST_TIMEOUT", "30"))
+
+_READ_METHODS = {"GET", "HEAD"}
+_ALLOWED_METHODS = {"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE"}
+# Request headers that describe the outer request rather than the caller
+_DROPPED_HEADERS = {b"content-length", b"content-type", b"accept", b"accept-encoding", b"idempotency-key"}
+# Streamed responses (server-sent events never end; exports aren't JSON) can't be part of a batch
+_STREAMING_PATHS = re.compile(r"^/(boards/[^/]+/(events|export)|users/me/export)/?$")
+
+
+def validate(batch: schemas.BatchRequest) -> None:
+    if not batch.requests:
+        raise BadRequestException(detail="No requests given")
+    if len(batch.requests) > BATCH_MAX_REQUESTS:
+        raise BadRequestException(detail=f"At most {BATCH_MAX_REQUESTS} requests per batch")
+    for item in batch.requests:
+        if item.method.upper() not in _ALLOWED_METHODS:
+            raise BadRequestException(detail=f"Unsupported method: {item.method}")
+        path = item.path.split("?")[0]
+        if not item.path.startswith("/") or path.rstrip("/") == "/batch":
+            raise BadRequestException(detail=f"Invalid path: {item.path}")
+        if _STREAMING_PATHS.match(path):
+            raise BadRequestException(detail=f"Streaming responses can't be batched: {item.path}")
+
+
+async def _dispatch(request: Request, item: schemas.BatchRequestItem, state: dict) -> schemas.BatchResponseItem:
+    """Run one sub-request through the application in-process."""
+    path, _, query = item.path.partition("?")
+    body = b"" if item.body is None else json.dumps(item.body).encode()
+    headers = [(name, value) for name, value in request.scope["headers"] if name not in _DROPPED_HEADERS]
+    headers += [(b"accept", b"application/json"), (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode())]
+    scope = {
+        "type": "http",
+        "asgi": request.scope.get("asgi", {"version": "3.0"}),
+        "http_version": request.scope.get("http_version", "1.1"),
+        "method": item.method.upper(),
+        "scheme": request.scope.get("scheme", "http"),
+        "server": request.scope.get("server"),
+        "client": request.scope.get("client"),
+        "root_path": request.scope.get("root_path", ""),
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query.encode(),
+        "headers": headers,
+        "state": {**request.scope.get("state", {}), **state},
+    }
+
+    sent = False
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        # Sub-requests never disconnect on their own
+        await asyncio.Event().wait()
+
+    status, response_headers, chunks = 500, {}, []
+
+    async def send(message):
+        nonlocal status, response_headers
+        if message["type"] == "http.response.start":
+            status = message["status"]
+            response_headers = {
+                name.decode("latin-1"): value.decode("latin-1")
+                for name, value in message.get("headers", [])
+                if name.lower() != b"content-length"
+            }
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    try:
+        await asyncio.wait_for(request.app(scope, receive, send), BATCH_REQUEST_TIMEOUT)
+    except asyncio.TimeoutError:
+        return schemas.BatchResponseItem(status=504, headers={}, body={"message": "Timed out"})
+    except Exception:
+        # ServerErrorMiddleware has already sent (or tried to send) a 500
+        status = 500
+    raw = b"".join(chunks)
+    try:
+        content = json.loads(raw) if raw else None
+    except ValueError:
+        content = raw.decode("utf-8", "replace")
+    return schemas.BatchResponseItem(status=status, headers=response_headers, body=content)
+
+
+def _skipped() -> schemas.BatchResponseItem:
+    return schemas.BatchResponseItem(status=424, headers={}, body={"message": "Not run: an earlier request in the atomic batch failed"})
+
+
+async def _run_all(request: Request, batch: schemas.BatchRequest, db: Session, user: models.User) -> list:
+    results: list = [None] * len(batch.requests)
+    shared = {"batch_db": db, "batch_user": user}
+    semaphore = asyncio.Semaphore(BATCH_MAX_CONCURRENCY)
+
+    async def read_concurrently(index, item):
+        # A Session is not safe to share between threads, so each concurrent read gets
+        # its own on the same engine; the user is still authenticated once
+        async with semaphore:
+            with Session(bind=db.get_bind()) as session:
+                results[index] = await _dispatch(request, item, {"batch_db": session, "batch_user": user})
+
+    index = 0
+    while index < len(batch.requests):
+        item = batch.requests[index]
+        # Concurrent reads would not see an atomic batch's uncommitted writes
+        if batch.concurrent and not batch.atomic and item.method.upper() in _READ_METHODS:
+            # Run the whole run of consecutive reads at once; writes keep their order
+            group = []
+            while index < len(batch.requests) and batch.requests[index].method.upper() in _READ_METHODS:
+                group.append((index, batch.requests[index]))
+                index += 1
+            # The user is read from other threads; load its attributes here, on the session it belongs to
+            db.refresh(user)
+            await asyncio.gather(*(read_concurrently(i, sub) for i, sub in group))
+            continue
+        results[index] = await _dispatch(request, item, shared)
+        if results[index].status >= 400:
+            if batch.atomic:
+                results[index + 1:] = [_skipped() for _ in batch.requests[index + 1:]]
+                return results
+            # Discard the failed request's unfinished work, as closing its session would
+            db.rollback()
+        index += 1
+    return results
+
+
+async def run_batch(request: Request, batch: schemas.BatchRequest, db: Session, user: models.User) -> schemas.BatchResponse:
+    """Execute ``batch`` on one session for an already-authenticated ``user``.
+
+    In atomic mode the sub-requests' commits only end their own unit of work: the batch
+    runs in one database transaction that is committed when every sub-request
+    succeeded and rolled back otherwise.
+    """
+    validate(batch)
+    if not batch.atomic:
+        return schemas.BatchResponse(responses=await _run_all(request, batch, db, user))
+
+    connection = db.get_bind().connect()
+    transaction = connection.begin()
+    session = Session(bind=connection, join_transaction_mode="rollback_only")
+    session.info["hold_notifications"] = True
+    try:
+        results = await _run_all(request, batch, session, session.get(models.User, user.id))
+        failed: Optional[schemas.BatchResponseItem] = next((r for r in results if r.status >= 400), None)
+        if failed is None:
+            session.flush()
+            transaction.commit()
+            release_notifications(session)
+        else:
+            transaction.rollback()
+            for result in results:
+                if result.status < 400:
+                    result.body = {"message": "Rolled back: another request in the atomic batch failed"}
+                    result.status = 424
+        return schemas.BatchResponse(responses=results)
+    finally:
+        session.close()
+        if transaction.is_active:
+            transaction.rollback()
+        connection.close()
@@ -0,0 +1,276 @@
+# app/board_revisions.py
+from dataclasses import dataclass, field
+from typing import Optional
+import os
+from sqlalchemy import event, select, insert, update, delete, inspect
+from sqlalchemy.orm import Session
+from . import models
+
+# Entities whose changes show up in a board's read endpoints, with the name used
+# for them in change events
+ENTITY_NAMES = {
+    models.Board: "board",
+    models.List: "list",
+    models.Card: "card",
+    models.CardLabel: "label",
+    models.BoardLabel: "board_label",
+    models.Comment: "comment",
+    models.Attachment: "attachment",
+    models.BoardMember: "member",
+}
+_BOARD_SCOPED = tuple(ENTITY_NAMES)
+
+# Revisions of history kept per board for delta sync, and how often old rows are pruned
+CHANGE_LOG_RETENTION = int(os.getenv("CHANGE_LOG_RETENTION", "1000"))
+CHANGE_LOG_PRUNE_EVERY = int(os.getenv("CHANGE_LOG_PRUNE_EVERY", "100"))
+
+
+@dataclass
+class ChangeEvent:
+    board_id: int
+    entity: str
+    entity_id: int
+    op: str  # "created", "updated" or "deleted"
+    revision: int = 0
+    data: Optional[dict] = field(default=None)
+
+
+def _attribute_values(obj, key):
+    """Return the current value of ``key`` plus any value it replaced in this flush."""
+    history = inspect(obj).attrs[key].history
+    values = {getattr(obj, key)}
+    values.update(history.deleted or ())
+    values.discard(None)
+    return values
+
+
+def snapshot(obj) -> dict:
+    """Column values already loaded on ``obj``; nothing is fetched to build it."""
+    state = inspect(obj)
+    return {attr.key: state.dict[attr.key] for attr in state.mapper.column_attrs if attr.key in state.dict}
+
+
+class _BoardResolver:
+    """Maps changed objects to their board ids, preferring objects already in the session."""
+
+    def __init__(self, session):
+        self.session = session
+        self.list_boards = {}
+        self.card_lists = {}
+
+    def remember(self, objects):
+        for obj in objects:
+            if isinstance(obj, models.List) and obj.id is not None and obj.board_id is not None:
+                self.list_boards[obj.id] = obj.board_id
+            elif isinstance(obj, models.Card) and obj.id is not None and obj.list_id is not None:
+                self.card_lists[obj.id] = obj.list_id
+
+    def _load_card_lists(self, card_ids):
+        missing = [card_id for card_id in card_ids if card_id not in self.card_lists]
+        if missing:
+            rows = self.session.execute(
+                select(models.Card.id, models.Card.list_id).where(models.Card.id.in_(missing))
+            )
+            self.card_lists.update({row.id: row.list_id for row in rows})
+
+    def _load_list_boards(self, list_ids):
+        missing = [list_id for list_id in list_ids if list_id not in self.list_boards]
+        if missing:
+            rows = self.session.execute(
+                select(models.List.id, models.List.board_id).where(models.List.id.in_(missing))
+            )
+            self.list_boards.update({row.id: row.board_id for row in rows})
+
+    def boards_for_lists(self, list_ids):
+        return {self.list_boards[list_id] for list_id in list_ids if self.list_boards.get(list_id) is not None}
+
+    def boards_for_cards(self, card_ids):
+        list_ids = {self.card_lists[card_id] for card_id in card_ids if self.card_lists.get(card_id) is not None}
+        return self.boards_for_lists(list_ids)
+
+    def resolve(self, objects) -> dict:
+        """Return ``{obj: board_ids}`` with at most one lookup query per parent table."""
+        parents = {}
+        with self.session.no_autoflush:
+            self.remember(objects)
+            for obj in objects:
+                if isinstance(obj, models.Board):
+                    parents[obj] = ("board", {obj.id} - {None})
+                elif isinstance(obj, (models.List, models.BoardMember, models.BoardLabel)):
+                    parents[obj] = ("board", _attribute_values(obj, "board_id"))
+                elif isinstance(obj, models.Card):
+                    parents[obj] = ("list", _attribute_values(obj, "list_id"))
+                else:
+                    parents[obj] = ("card", _attribute_values(obj, "card_id"))
+
+            card_ids = set().union(*(ids for kind, ids in parents.values() if kind == "card"))
+            self._load_card_lists(card_ids)
+            list_ids = set().union(*(ids for kind, ids in parents.values() if kind == "list"))
+            list_ids |= {self.card_lists.get(card_id) for card_id in card_ids} - {None}
+            self._load_list_boards(list_ids)
+
+        resolved = {}
+        for obj, (kind, ids) in parents.items():
+            if kind == "board":
+                resolved[obj] = set(ids)
+            elif kind == "list":
+                resolved[obj] = self.boards_for_lists(ids)
+            else:
+                resolved[obj] = self.boards_for_cards(ids)
+        return resolved
+
+
+def touched_board_ids(session, objects):
+    """Return the ids of every board affected by changes to ``objects``."""
+    return set().union(*_BoardResolver(session).resolve(objects).values())
+
+
+def bump_board_revisions(session, board_ids) -> dict:
+    """Advance the revision (and ``updated_at``) of the given boards in the current transaction.
+
+    Returns ``{board_id: new_revision}``.
+    """
+    if not board_ids:
+        return {}
+    boards = models.Board.__table__
+    rows = session.connection().execute(
+        update(boards)
+        .where(boards.c.id.in_(sorted(board_ids)))
+        .values(revision=boards.c.revision + 1)
+        .returning(boards.c.id, boards.c.revision)
+    )
+    return {row.id: row.revision for row in rows}
+
+
+def write_change_log(session, events) -> None:
+    """Append ``events`` to the board change log and prune boards whose log grew past retention."""
+    if not events:
+        return
+    session.connection().execute(
+        insert(models.BoardChange.__table__),
+        [
+            {"board_id": e.board_id, "revision": e.revision, "entity": e.entity, "entity_id": e.entity_id, "op": e.op}
+            for e in events
+        ],
+    )
+    # Pruning runs every CHANGE_LOG_PRUNE_EVERY revisions rather than on every write
+    latest = {}
+    for e in events:
+        latest[e.board_id] = max(latest.get(e.board_id, 0), e.revision)
+    for board_id, revision in latest.items():
+        floor = revision - CHANGE_LOG_RETENTION
+        if floor > 0 and revision % CHANGE_LOG_PRUNE_EVERY == 0:
+            changes = models.BoardChange.__table__
+            session.connection().execute(
+                delete(changes).where(changes.c.board_id == board_id, changes.c.revision <= floor)
+            )
+            session.connection().execute(
+                update(models.Board.__table__)
+                .where(models.Board.__table__.c.id == board_id)
+                .values(change_log_floor=floor)
+            )
+
+
+# Callbacks run once a transaction commits, with the set of changed board ids
+# and with the commit's ChangeEvents respectively
+_commit_listeners = []
+_change_listeners = []
+
+
+def on_boards_committed(callback):
+    """Register ``callback(board_ids)`` to run after any commit that changed boards."""
+    _commit_listeners.append(callback)
+    return callback
+
+
+def on_changes_committed(callback):
+    """Register ``callback(events)`` to run with the ChangeEvents of each commit."""
+    _change_listeners.append(callback)
+    return callback
+
+
+def record_board_changes(session, board_ids, events=()):
+    """Bump revisions for ``board_ids``, log ``events`` and queue both for the post-commit listeners.
+
+    Writes that bypass the unit of work (bulk or Core statements) call this directly,
+    passing the ChangeEvents they produced; their revisions are filled in here.
+    """
+    board_ids = set(board_ids) | {e.board_id for e in events}
+    revisions = bump_board_revisions(session, board_ids)
+    for e in events:
+        e.revision = revisions.get(e.board_id, e.revision)
+    write_change_log(session, events)
+    session.info.setdefault("changed_boards", set()).update(board_ids)
+    session.info.setdefault("change_events", []).extend(events)
+    return revisions
+
+
+@event.listens_for(Session, "before_flush")
+def _track_board_changes(session, flush_context, instances):
+    changed = []
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if not isinstance(obj, _BOARD_SCOPED):
+            continue
+        if obj in session.new:
+            changed.append((obj, "created"))
+        elif obj in session.deleted:
+            changed.append((obj, "deleted"))
+        elif session.is_modified(obj, include_collections=False):
+            changed.append((obj, "updated"))
+    if not changed:
+        return
+
+    # Events (and their log rows) are written after the flush, once new rows have ids
+    boards_by_object = _BoardResolver(session).resolve([obj for obj, _ in changed])
+    board_ids = set().union(*boards_by_object.values())
+    revisions = record_board_changes(session, board_ids)
+    session.info.setdefault("pending_changes", []).extend(
+        (obj, op, boards_by_object[obj], revisions) for obj, op in changed
+    )
+
+
+@event.listens_for(Session, "after_flush")
+def _build_change_events(session, flush_context):
+    # Ids of new rows are only known once the flush has run
+    events = []
+    deleted_boards = set()
+    for obj, op, board_ids, revisions in session.info.pop("pending_changes", []):
+        if isinstance(obj, models.Board):
+            board_ids = {obj.id}
+            if op == "deleted":
+                deleted_boards.add(obj.id)
+        data = None if op == "deleted" else snapshot(obj)
+        for board_id in board_ids:
+            revision = revisions.get(board_id, 0)
+            events.append(ChangeEvent(board_id, ENTITY_NAMES[type(obj)], obj.id, op, revision, data))
+    # A deleted board takes its change log with it
+    write_change_log(session, [e for e in events if e.board_id not in deleted_boards])
+    session.info.setdefault("change_events", []).extend(events)
+
+
+def release_notifications(session) -> None:
+    """Run the post-commit listeners for everything the session has committed so far.
+
+    Sessions with ``info["hold_notifications"]`` set (an atomic /batch, whose commits
+    only end a sub-request) call this once the enclosing transaction really commits.
+    """
+    board_ids = session.info.pop("changed_boards", None)
+    events = session.info.pop("change_events", None)
+    if board_ids:
+        for callback in _commit_listeners:
+            callback(board_ids)
+    if events:
+        for callback in _change_listeners:
+            callback(events)
+
+
+@event.listens_for(Session, "after_commit")
+def _notify_board_changes(session):
+    if not session.info.get("hold_notifications"):
+        release_notifications(session)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_board_changes(session):
+    for key in ("changed_boards", "change_events", "pending_changes"):
+        session.info.pop(key, None)
@@ -0,0 +1,178 @@
+# app/bulk.py
+#
+# Set-based card writes. Access is checked for all targets in one query, and every
+# operation is a single multi-row statement with RETURNING; the caller commits.
+from sqlalchemy import Integer, case, cast, column, delete, func, insert, select, update, values
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+from . import activity, models
+from . import labels as labels_catalog
+from .board_revisions import ChangeEvent, record_board_changes, snapshot
+from .exceptions import BadRequestException, NotFoundException
+from .permissions import get_writable_cards, get_writable_lists
+
+BULK_MAX_ITEMS = 1000
+_CARD_FIELDS = ("title", "description", "list_id", "due_date")
+
+
+def _check_size(items) -> None:
+    if not items:
+        raise BadRequestException(detail="No items given")
+    if len(items) > BULK_MAX_ITEMS:
+        raise BadRequestException(detail=f"At most {BULK_MAX_ITEMS} items per request")
+
+
+def _record(db: Session, entity: str, op: str, objects, board_of) -> None:
+    events = [
+        ChangeEvent(board_of(obj), entity, obj.id, op, data=None if op == "deleted" else snapshot(obj))
+        for obj in objects
+    ]
+    record_board_changes(db, {event.board_id for event in events}, events)
+
+
+def _log(db: Session, user: models.User, activity_type: models.ActivityType, objects, board_of, describe) -> None:
+    # Becomes one multi-row INSERT when the caller commits
+    for obj in objects:
+        activity.record(db, board_of(obj), user.id, activity_type, describe(obj))
+
+
+def _update_cards(db: Session, rows: list) -> list:
+    """Apply per-card changes in one UPDATE; ``None`` leaves a column unchanged."""
+    cards = models.Card.__table__
+    fields = [name for name in _CARD_FIELDS if any(row.get(name) is not None for row in rows)]
+    if not fields:
+        return db.scalars(select(models.Card).where(models.Card.id.in_([row["id"] for row in rows]))).all()
+
+    if db.get_bind().dialect.name == "postgresql":
+        # UPDATE cards SET ... FROM (VALUES ...) AS changes (id, ...) WHERE cards.id = changes.id
+        changes = values(
+            column("id", Integer),
+            *[column(name, cards.c[name].type) for name in fields],
+            name="changes",
+        ).data([(row["id"], *[row.get(name) for name in fields]) for row in rows])
+        stmt = update(models.Card).where(models.Card.id == changes.c.id).values({
+            name: func.coalesce(cast(changes.c[name], cards.c[name].type), cards.c[name])
+            for name in fields
+        })
+    else:
+        # SQLite can't name the columns of a VALUES list, so each column gets a CASE on id
+        stmt = update(models.Card).where(models.Card.id.in_([row["id"] for row in rows])).values({
+            name: case(
+                {row["id"]: row[name] for row in rows if row.get(name) is not None},
+                value=models.Card.id,
+                else_=cards.c[name],
+            )
+            for name in fields
+        })
+    stmt = stmt.returning(models.Card).execution_options(synchronize_session=False, populate_existing=True)
+    return db.scalars(stmt).all()
+
+
+def _in_order(objects, ids) -> list:
+    by_id = {obj.id: obj for obj in objects}
+    return [by_id[obj_id] for obj_id in ids]
+
+
+def create_cards(db: Session, items: list, user: models.User) -> list:
+    _check_size(items)
+    boards = get_writable_lists(db, {item.list_id for item in items}, user)
+    cards = db.scalars(
+        insert(models.Card).returning(models.Card, sort_by_parameter_order=True),
+        [item.model_dump() for item in items],
+    ).all()
+    _record(db, "card", "created", cards, lambda card: boards[card.list_id])
+    _log(db, user, models.ActivityType.CARD_CREATED, cards, lambda card: boards[card.list_id],
+         lambda card: f"Card '{card.title}' created")
+    return cards
+
+
+def move_cards(db: Session, moves: list, user: models.User) -> list:
+    _check_size(moves)
+    current = get_writable_cards(db, {move.card_id for move in moves}, user)
+    targets = get_writable_lists(db, {move.list_id for move in moves}, user)
+    # Like the single-card move, cards stay on their board
+    if any(targets[move.list_id] != current[move.card_id][1] for move in moves):
+        raise BadRequestException(detail="Invalid new list ID")
+    cards = _update_cards(db, [{"id": move.card_id, "list_id": move.list_id} for move in moves])
+    _record(db, "card", "updated", cards, lambda card: targets[card.list_id])
+    _log(db, user, models.ActivityType.CARD_MOVED, cards, lambda card: targets[card.list_id],
+         lambda card: f"Card '{card.title}' moved")
+    return _in_order(cards, [move.card_id for move in moves])
+
+
+def update_cards(db: Session, items: list, user: models.User) -> list:
+    _check_size(items)
+    current = get_writable_cards(db, {item.id for item in items}, user)
+    list_ids = {item.list_id for item in items if item.list_id is not None}
+    targets = get_writable_lists(db, list_ids, user) if list_ids else {}
+    if any(item.list_id is not None and targets[item.list_id] != current[item.id][1] for item in items):
+        raise BadRequestException(detail="Invalid new list ID")
+    cards = _update_cards(db, [item.model_dump() for item in items])
+    _record(db, "card", "updated", cards, lambda card: current[card.id][1])
+    _log(db, user, models.ActivityType.CARD_UPDATED, cards, lambda card: current[card.id][1],
+         lambda card: f"Card '{card.title}' updated")
+    return _in_order(cards, [item.id for item in items])
+
+
+def delete_cards(db: Session, card_ids: list, user: models.User) -> list:
+    _check_size(card_ids)
+    current = get_writable_cards(db, card_ids, user)
+    for dependent in (models.CardLabel, models.Comment, models.Attachment):
+        db.execute(delete(dependent).where(dependent.card_id.in_(card_ids)))
+    cards = db.scalars(
+        delete(models.Card).where(models.Card.id.in_(card_ids))
+        .returning(models.Card).execution_options(synchronize_session=False)
+    ).all()
+    _record(db, "card", "deleted", cards, lambda card: current[card.id][1])
+    _log(db, user, models.ActivityType.CARD_DELETED, cards, lambda card: current[card.id][1],
+         lambda card: f"Card '{card.title}' deleted")
+    return cards
+
+
+def _with_palette(db: Session, card_labels: list) -> list:
+    """Fill in ``label`` on card labels from RETURNING, which can't join it, with one palette query."""
+    label_ids = {card_label.label_id for card_label in card_labels}
+    palette = {label.id: label for label in db.scalars(select(models.BoardLabel).where(models.BoardLabel.id.in_(label_ids)))}
+    for card_label in card_labels:
+        set_committed_value(card_label, "label", palette[card_label.label_id])
+    return card_labels
+
+
+def add_labels(db: Session, card_ids: list, labels: list, user: models.User) -> list:
+    _check_size(card_ids)
+    current = get_writable_cards(db, card_ids, user)
+    wanted = {(card_id, label.name, label.color) for card_id in card_ids for label in labels}
+    _check_size(wanted)
+    # Names and colors go into each board's palette; cards get the palette ids
+    palette = labels_catalog.ensure_labels(db, {(current[card_id][1], name, color) for card_id, name, color in wanted})
+    pairs = {(card_id, palette[(current[card_id][1], name, color)]) for card_id, name, color in wanted}
+    # A card has each label at most once
+    pairs -= set(db.execute(
+        select(models.CardLabel.card_id, models.CardLabel.label_id).where(models.CardLabel.card_id.in_(card_ids))
+    ).tuples())
+    if not pairs:
+        return []
+    rows = [{"card_id": card_id, "label_id": label_id} for card_id, label_id in sorted(pairs)]
+    created = _with_palette(db, db.scalars(
+        insert(models.CardLabel).returning(models.CardLabel, sort_by_parameter_order=True), rows
+    ).all())
+    _record(db, "label", "created", created, lambda label: current[label.card_id][1])
+    _log(db, user, models.ActivityType.LABEL_ADDED, created, lambda label: current[label.card_id][1],
+         lambda label: f"Label '{label.name}' added to card {label.card_id}")
+    return created
+
+
+def remove_labels(db: Session, label_ids: list, user: models.User) -> list:
+    _check_size(label_ids)
+    rows = db.query(models.CardLabel.id, models.CardLabel.card_id).filter(models.CardLabel.id.in_(label_ids)).all()
+    if len(rows) != len(set(label_ids)):
+        raise NotFoundException(detail="Label not found")
+    current = get_writable_cards(db, {row.card_id for row in rows}, user)
+    removed = _with_palette(db, db.scalars(
+        delete(models.CardLabel).where(models.CardLabel.id.in_(label_ids))
+        .returning(models.CardLabel).execution_options(synchronize_session=False)
+    ).all())
+    _record(db, "label", "deleted", removed, lambda label: current[label.card_id][1])
+    _log(db, user, models.ActivityType.LABEL_REMOVED, removed, lambda label: current[label.card_id][1],
+         lambda label: f"Label '{label.name}' removed from card {label.card_id}")
+    return removed
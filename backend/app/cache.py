@@ -0,0 +1,251 @@
+# app/cache.py
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+from urllib.parse import urlencode
+from fastapi import Request
+from fastapi.concurrency import run_in_threadpool
+from redis.exceptions import RedisError
+from sqlalchemy.orm import Session
+from . import metrics, models
+from .board_revisions import on_boards_committed
+from .coalescing import coalesce_board_read
+from .database import shared_session
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = "cache:invalidate"
+
+
+class LocalLRU:
+    """Per-worker LRU with TTLs and a board tag index for invalidation.
+
+    Each entry also carries a dict of its encoded renderings (see ``encodings``), so
+    those leave together with the entry, however it leaves.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._tags = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, board_id, expires_at, _ = entry
+            if expires_at < time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, board_id: int, ttl: int) -> None:
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (value, board_id, time.monotonic() + ttl, {})
+            self._tags.setdefault(board_id, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def encodings(self, key: str) -> Optional[dict]:
+        """The live entry's dict of encoded bodies, for the compression middleware to fill."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[2] < time.monotonic():
+                return None
+            return entry[3]
+
+    def invalidate(self, board_id: int) -> int:
+        with self._lock:
+            keys = self._tags.pop(board_id, set())
+            for key in keys:
+                self._entries.pop(key, None)
+            return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            tagged = self._tags.get(entry[1])
+            if tagged is not None:
+                tagged.discard(key)
+                if not tagged:
+                    del self._tags[entry[1]]
+
+
+class ResponseCache:
+    """Read-through cache for board-scoped GET responses: a local LRU in front of Redis.
+
+    Entries are tagged with their board id. Committed writes drop the board's entries
+    locally, delete them from Redis and publish the board id so every other worker drops
+    its local copies too. Without Redis the cache runs local-only; keys include the board
+    revision, so a worker that misses an invalidation still never serves stale data.
+    """
+
+    def __init__(self, max_entries: int, ttl: int):
+        self.ttl = ttl
+        self.local = LocalLRU(max_entries)
+        self.redis = None
+        self.worker_id = uuid.uuid4().hex
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._subscriber: Optional[asyncio.Task] = None
+
+    async def start(self, redis_client) -> None:
+        self.redis = redis_client
+        self._loop = asyncio.get_running_loop()
+        self._subscriber = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self._subscriber is not None:
+            self._subscriber.cancel()
+            try:
+                await self._subscriber
+            except asyncio.CancelledError:
+                pass
+        self._subscriber = None
+        self.redis = None
+
+    async def get(self, key: str):
+        value = self.local.get(key)
+        if value is not None:
+            metrics.increment("cache.local_hits")
+            return value
+        if self.redis is not None:
+            try:
+                raw = await self.redis.get(f"cache:{key}")
+            except RedisError:
+                logger.warning("Redis cache read failed; serving from the database")
+                raw = None
+            if raw is not None:
+                metrics.increment("cache.redis_hits")
+                value = json.loads(raw)
+                self.local.set(key, value, _board_id_from_key(key), self.ttl)
+                return value
+        metrics.increment("cache.misses")
+        return None
+
+    async def set(self, key: str, value: Any, board_id: int) -> None:
+        self.local.set(key, value, board_id, self.ttl)
+        if self.redis is None:
+            return
+        tag = f"cache:tag:board:{board_id}"
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.set(f"cache:{key}", json.dumps(value, separators=(",", ":")), ex=self.ttl)
+                pipe.sadd(tag, key)
+                pipe.expire(tag, self.ttl)
+                await pipe.execute()
+        except RedisError:
+            logger.warning("Redis cache write failed; entry kept locally only")
+
+    def invalidate_boards(self, board_ids) -> None:
+        """Drop local entries now and fan the invalidation out through Redis.
+
+        Called from post-commit hooks, which may run on the event loop (async routes) or
+        in a threadpool worker (sync routes).
+        """
+        for board_id in board_ids:
+            dropped = self.local.invalidate(board_id)
+            metrics.increment("cache.invalidations")
+            if dropped:
+                metrics.increment("cache.local_evictions", dropped)
+        if self.redis is None or self._loop is None:
+            return
+        coro = self._invalidate_remote(sorted(board_ids))
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self._loop.create_task(coro)
+        else:
+            asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    async def _invalidate_remote(self, board_ids) -> None:
+        try:
+            for board_id in board_ids:
+                tag = f"cache:tag:board:{board_id}"
+                keys = await self.redis.smembers(tag)
+                await self.redis.delete(tag, *[f"cache:{key}" for key in keys])
+                await self.redis.publish(INVALIDATION_CHANNEL, json.dumps({"board_id": board_id, "origin": self.worker_id}))
+        except RedisError:
+            logger.warning("Redis cache invalidation failed for boards %s", board_ids)
+
+    async def _listen(self) -> None:
+        pubsub = self.redis.pubsub()
+        try:
+            await pubsub.subscribe(INVALIDATION_CHANNEL)
+            async for message in pubsub.listen():
+                if message["type"] != "message":
+                    continue
+                payload = json.loads(message["data"])
+                if payload.get("origin") != self.worker_id:
+                    self.local.invalidate(payload["board_id"])
+        except RedisError:
+            # Keys carry the board revision, so local-only mode stays correct
+            logger.warning("Lost the cache invalidation subscription; continuing with local-only invalidation")
+        finally:
+            await pubsub.reset()
+
+
+response_cache = ResponseCache(
+    max_entries=int(os.getenv("CACHE_LOCAL_ENTRIES", "1024")),
+    ttl=int(os.getenv("CACHE_TTL_SECONDS", "300")),
+)
+on_boards_committed(response_cache.invalidate_boards)
+
+
+def _board_id_from_key(key: str) -> int:
+    return int(key.split(":")[1])
+
+
+def board_cache_key(request: Request, board: models.Board) -> str:
+    # "board:<id>:<revision>:<digest of route and query>"
+    query = urlencode(sorted(request.query_params.multi_items()))
+    digest = hashlib.sha1(f"{request.scope['route'].path}?{query}".encode()).hexdigest()[:16]
+    return f"board:{board.id}:{board.revision or 0}:{digest}"
+
+
+async def cached_board_read(request: Request, db: Session, board: models.Board, compute: Callable[[Session], Any]) -> Any:
+    """Serve a board-scoped read from the response cache, computing it (coalesced) on a miss.
+
+    ``compute`` is given a session to query and must return JSON-compatible content; it is
+    shared with Redis as JSON. On a miss it runs on a session of its own, off the event loop.
+    Inside a /batch call it runs on the batch's session instead, so it sees the batch's
+    uncommitted writes, and the result is neither cached nor shared with other requests.
+    """
+    shared = shared_session(request)
+    if shared is not None:
+        return await run_in_threadpool(compute, shared)
+
+    def compute_on_own_session():
+        with Session(bind=db.get_bind()) as session:
+            return compute(session)
+
+    key = board_cache_key(request, board)
+    value = await response_cache.get(key)
+    if value is None:
+        value = await coalesce_board_read(request, board, compute_on_own_session)
+        await response_cache.set(key, value, board.id)
+    # Compressed renderings of the response are kept in the entry, and dropped with it
+    encoded = response_cache.local.encodings(key)
+    if encoded is not None:
+        request.state.encoded_bodies = encoded
+    return value
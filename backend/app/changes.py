@@ -0,0 +1,76 @@
+# app/changes.py
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from . import models, schemas
+
+# How to load the current state of each logged entity, restricted to one board
+_ENTITIES = {
+    "board": (models.Board, schemas.Board),
+    "list": (models.List, schemas.List),
+    "card": (models.Card, schemas.Card),
+    "label": (models.CardLabel, schemas.Label),
+    "board_label": (models.BoardLabel, schemas.BoardLabel),
+    "comment": (models.Comment, schemas.Comment),
+    "attachment": (models.Attachment, schemas.Attachment),
+    "member": (models.BoardMember, schemas.BoardMember),
+}
+
+
+def _scoped(entity: str, board_id: int, ids):
+    model, _ = _ENTITIES[entity]
+    query = select(model).where(model.id.in_(ids))
+    if entity == "board":
+        return query.where(model.id == board_id)
+    if entity in ("list", "member", "board_label"):
+        return query.where(model.board_id == board_id)
+    if entity == "card":
+        return query.join(models.List).where(models.List.board_id == board_id)
+    return query.join(models.Card).join(models.List).where(models.List.board_id == board_id)
+
+
+def changes_since(db: Session, board: models.Board, since: int) -> dict:
+    """Entities of ``board`` changed or deleted after revision ``since``.
+
+    Each entity is reported once, by its current state or as deleted. Entities that
+    were created and deleted within the window are left out, and so are entities that
+    have since moved to another board, which are reported as deleted here.
+    """
+    revision = board.revision or 0
+    if since < (board.change_log_floor or 0) or since > revision:
+        return {"revision": revision, "resync": True, "changed": {}, "deleted": {}}
+
+    rows = db.execute(
+        select(models.BoardChange.entity, models.BoardChange.entity_id, models.BoardChange.op)
+        .where(models.BoardChange.board_id == board.id, models.BoardChange.revision > since)
+        .order_by(models.BoardChange.revision, models.BoardChange.id)
+    )
+    first_ops, last_ops = {}, {}
+    for row in rows:
+        key = (row.entity, row.entity_id)
+        first_ops.setdefault(key, row.op)
+        last_ops[key] = row.op
+
+    touched, deleted = {}, {}
+    for key, op in last_ops.items():
+        if op == "deleted":
+            if first_ops[key] != "created":
+                deleted.setdefault(key[0], set()).add(key[1])
+        else:
+            touched.setdefault(key[0], set()).add(key[1])
+
+    # One query per entity type for whatever is still on the board
+    changed = {}
+    for entity, ids in touched.items():
+        _, schema = _ENTITIES[entity]
+        found = db.scalars(_scoped(entity, board.id, sorted(ids))).all()
+        changed[entity] = [schema.model_validate(obj).model_dump(mode="json") for obj in found]
+        gone = ids - {obj.id for obj in found}
+        if gone:
+            deleted.setdefault(entity, set()).update(gone)
+
+    return {
+        "revision": revision,
+        "resync": False,
+        "changed": changed,
+        "deleted": {entity: sorted(ids) for entity, ids in deleted.items()},
+    }
@@ -0,0 +1,230 @@
+# app/cloning.py
+#
+# Deep copies of boards and templates. Every level of the tree (lists, cards, the label
+# palette and card labels, optionally comments) is copied with one INSERT ... SELECT,
+# however many rows it has. Copies are inserted in the order of their source ids, so
+# they get ids in that same order; pairing the two sets by row_number() gives the
+# old -> new id map that the next level joins on. Only rows above the table's highest
+# id just before the INSERT count as copies, so lists or cards the owner added to a
+# board that is still waiting for its background fill are never paired; labels the
+# owner added to its palette are reused.
+import os
+from dataclasses import dataclass
+from typing import Optional
+from sqlalchemy import and_, exists, func, insert, literal, select
+from sqlalchemy.orm import Session
+from . import jobs, models
+from .board_revisions import record_board_changes
+
+# Boards (or templates) with more cards than this are copied by a background job
+COPY_BACKGROUND_CARDS = int(os.getenv("COPY_BACKGROUND_CARDS", "2000"))
+
+
+@dataclass(frozen=True)
+class Level:
+    model: type
+    parent: str
+    # Shared field name -> this model's column
+    fields: dict
+
+    def column(self, name: str):
+        return getattr(self.model, self.fields[name])
+
+    @property
+    def parent_column(self):
+        return getattr(self.model, self.parent)
+
+
+@dataclass(frozen=True)
+class Tree:
+    lists: Level
+    cards: Level
+
+
+BOARD = Tree(
+    lists=Level(models.List, "board_id", {"title": "title"}),
+    cards=Level(models.Card, "list_id", {"title": "title", "description": "description", "due_date": "due_date"}),
+)
+TEMPLATE = Tree(
+    lists=Level(models.ListTemplate, "board_template_id", {"title": "name"}),
+    cards=Level(models.CardTemplate, "list_template_id", {"title": "title", "description": "description"}),
+)
+# Job payloads name their trees
+TREES = {"board": BOARD, "template": TEMPLATE}
+
+
+def _id_map(source: Level, source_where, target: Level, target_where):
+    """Subquery of (old_id, new_id), pairing source and copied rows by their order of ids."""
+    def numbered(level, where):
+        return select(
+            level.model.id.label("id"), func.row_number().over(order_by=level.model.id).label("n")
+        ).where(where).subquery()
+
+    old, new = numbered(source, source_where), numbered(target, target_where)
+    return select(old.c.id.label("old_id"), new.c.id.label("new_id")).join_from(old, new, old.c.n == new.c.n).subquery()
+
+
+def _high_water_mark(db: Session, model: type) -> int:
+    return db.scalar(select(func.coalesce(func.max(model.id), 0)))
+
+
+def _copy_level(db: Session, source: Level, target: Level, parent_value, where=None, parent_map=None) -> int:
+    """INSERT INTO target (fields..., parent) SELECT ... ORDER BY source id, in one statement.
+
+    Returns the target's highest id from before the INSERT: the copies are the rows above it.
+    """
+    mark = _high_water_mark(db, target.model)
+    fields = [name for name in source.fields if name in target.fields]
+    query = select(*[source.column(name) for name in fields], parent_value).select_from(source.model)
+    if parent_map is not None:
+        query = query.join(parent_map, source.parent_column == parent_map.c.old_id)
+    if where is not None:
+        query = query.where(where)
+    db.execute(insert(target.model).from_select(
+        [target.fields[name] for name in fields] + [target.parent], query.order_by(source.model.id)
+    ))
+    return mark
+
+
+def _card_labels(tree: Tree, card_map):
+    """SELECT (name, color, new_id) of the labels on the source cards in ``card_map``."""
+    if tree is BOARD:
+        return (
+            select(models.BoardLabel.name, models.BoardLabel.color, card_map.c.new_id)
+            .select_from(models.CardLabel)
+            .join(models.BoardLabel, models.CardLabel.label_id == models.BoardLabel.id)
+            .join(card_map, models.CardLabel.card_id == card_map.c.old_id)
+            .order_by(models.CardLabel.id)
+        )
+    return (
+        select(func.coalesce(models.LabelTemplate.name, "").label("name"),
+               func.coalesce(models.LabelTemplate.color, "").label("color"), card_map.c.new_id)
+        .join(card_map, models.LabelTemplate.card_template_id == card_map.c.old_id)
+        .order_by(models.LabelTemplate.id)
+    )
+
+
+def _copy_palette(db: Session, source: Tree, source_id: int, target_id: int, source_cards) -> None:
+    """Give the new board the source board's palette, or the labels the template's cards use.
+
+    Labels the owner already added to the new board are kept and not inserted twice.
+    """
+    if source is BOARD:
+        name, color = models.BoardLabel.name, models.BoardLabel.color
+        palette = (
+            select(literal(target_id), name, color)
+            .where(models.BoardLabel.board_id == source_id)
+            .order_by(models.BoardLabel.id)
+        )
+    else:
+        name = func.coalesce(models.LabelTemplate.name, "")
+        color = func.coalesce(models.LabelTemplate.color, "")
+        palette = select(literal(target_id), name, color).where(
+            models.LabelTemplate.card_template_id.in_(select(source.cards.model.id).where(source_cards))
+        ).distinct()
+    existing = models.BoardLabel.__table__.alias("existing")
+    palette = palette.where(~exists().where(
+        existing.c.board_id == target_id, existing.c.name == name, existing.c.color == color
+    ))
+    db.execute(insert(models.BoardLabel).from_select(["board_id", "name", "color"], palette))
+
+
+def _copy_labels(db: Session, source: Tree, target: Tree, target_id: int, card_map) -> None:
+    labels = _card_labels(source, card_map)
+    if target is TEMPLATE:
+        db.execute(insert(models.LabelTemplate).from_select(["name", "color", "card_template_id"], labels))
+        return
+
+    used = labels.subquery()
+    db.execute(insert(models.CardLabel).from_select(
+        ["card_id", "label_id"],
+        select(used.c.new_id, models.BoardLabel.id)
+        .join(models.BoardLabel, and_(
+            models.BoardLabel.board_id == target_id,
+            models.BoardLabel.name == used.c.name,
+            models.BoardLabel.color == used.c.color,
+        ))
+        .distinct(),
+    ))
+
+
+def copy_tree(db: Session, source: Tree, source_id: int, target: Tree, target_id: int,
+              include_cards: bool = True, include_comments: bool = False) -> None:
+    """Copy everything under ``source_id`` to ``target_id``; the caller commits."""
+    source_lists = source.lists.parent_column == source_id
+    source_cards = source.cards.parent_column.in_(select(source.lists.model.id).where(source_lists))
+    lists_mark = _copy_level(db, source.lists, target.lists, literal(target_id), where=source_lists)
+    target_lists = and_(target.lists.parent_column == target_id, target.lists.model.id > lists_mark)
+    # A board's palette is part of the board, so it is copied with or without the cards
+    if target is BOARD:
+        _copy_palette(db, source, source_id, target_id, source_cards)
+    if not include_cards:
+        return
+
+    list_map = _id_map(source.lists, source_lists, target.lists, target_lists)
+    cards_mark = _copy_level(db, source.cards, target.cards, list_map.c.new_id, parent_map=list_map)
+
+    target_cards = and_(
+        target.cards.parent_column.in_(select(target.lists.model.id).where(target_lists)),
+        target.cards.model.id > cards_mark,
+    )
+    card_map = _id_map(source.cards, source_cards, target.cards, target_cards)
+    _copy_labels(db, source, target, target_id, card_map)
+
+    if include_comments and source is BOARD and target is BOARD:
+        db.execute(insert(models.Comment).from_select(
+            ["content", "user_id", "created_at", "card_id"],
+            select(models.Comment.content, models.Comment.user_id, models.Comment.created_at, card_map.c.new_id)
+            .join(card_map, models.Comment.card_id == card_map.c.old_id)
+            .order_by(models.Comment.id),
+        ))
+
+
+def card_count(db: Session, tree: Tree, root_id: int) -> int:
+    lists = select(tree.lists.model.id).where(tree.lists.parent_column == root_id)
+    return db.scalar(select(func.count()).select_from(tree.cards.model).where(tree.cards.parent_column.in_(lists)))
+
+
+def runs_in_background(db: Session, tree: Tree, root_id: int, include_cards: bool = True) -> bool:
+    return include_cards and card_count(db, tree, root_id) > COPY_BACKGROUND_CARDS
+
+
+def fill_board(db: Session, source: Tree, source_id: int, board_id: int,
+               include_cards: bool = True, include_comments: bool = False) -> None:
+    """Copy into the new board ``board_id`` and move its revision on; the caller commits."""
+    copy_tree(db, source, source_id, BOARD, board_id, include_cards, include_comments)
+    # Core inserts bypass the unit of work, so readers of the board are told here
+    record_board_changes(db, {board_id})
+
+
+@jobs.job("board.fill", concurrency=2)
+def _fill_board_job(ctx: jobs.JobContext) -> None:
+    payload = ctx.payload
+    # One transaction, so a failed attempt leaves the board empty for the retry
+    fill_board(ctx.db, TREES[payload["source"]], payload["source_id"], payload["board_id"],
+               payload["include_cards"], payload["include_comments"])
+
+
+def fill_or_schedule(db: Session, source: Tree, source_id: int, board_id: int, user_id: Optional[int] = None,
+                     include_cards: bool = True, include_comments: bool = False) -> Optional[models.Job]:
+    """Fill the just-flushed board ``board_id`` and commit; returns the job if the copy was queued instead."""
+    if not runs_in_background(db, source, source_id, include_cards):
+        fill_board(db, source, source_id, board_id, include_cards, include_comments)
+        db.commit()
+        return None
+    source_name = next(name for name, tree in TREES.items() if tree is source)
+    db_job = jobs.enqueue(db, "board.fill", {
+        "source": source_name, "source_id": source_id, "board_id": board_id,
+        "include_cards": include_cards, "include_comments": include_comments,
+    }, user_id)
+    db.commit()
+    return db_job
+
+
+def new_template_from_board(db: Session, board: models.Board, user: models.User, name: str,
+                            description: Optional[str]) -> models.BoardTemplate:
+    template = models.BoardTemplate(name=name, description=description, created_by=user.id)
+    db.add(template)
+    db.flush()
+    copy_tree(db, BOARD, board.id, TEMPLATE, template.id)
+    return template
@@ -0,0 +1,58 @@
+# app/coalescing.py
+import asyncio
+from typing import Any, Awaitable, Callable, Hashable
+from urllib.parse import urlencode
+from fastapi import Request
+from starlette.concurrency import run_in_threadpool
+from . import metrics, models
+
+
+class SingleFlight:
+    """Shares one in-flight computation between concurrent callers using the same key.
+
+    The computation runs as its own task, so a caller that disconnects does not cancel
+    it for the others still waiting. The key is forgotten as soon as the task finishes,
+    which means results are only shared while in flight and never cached.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._calls.get(key)
+        if task is not None:
+            metrics.increment(f"{self.name}.collapsed")
+        else:
+            metrics.increment(f"{self.name}.executed")
+            task = asyncio.ensure_future(func())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: asyncio.Future) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            # Mark the exception retrieved even if every waiter went away
+            task.exception()
+
+
+board_reads = SingleFlight("single_flight.board_reads")
+
+
+async def coalesce_board_read(request: Request, board: models.Board, compute: Callable[[], Any]) -> Any:
+    """Run ``compute`` in the threadpool, shared with identical concurrent reads of ``board``.
+
+    Callers must have checked access already: every user allowed to read a board sees the
+    same data, so the permission scope in the key is "board reader". The board revision is
+    part of the key so a request that observed a newer revision never joins an older flight.
+    """
+    key = (
+        request.scope["route"].path,
+        "board-reader",
+        board.id,
+        board.revision,
+        urlencode(sorted(request.query_params.multi_items())),
+    )
+    return await board_reads.do(key, lambda: run_in_threadpool(compute))
@@ -0,0 +1,343 @@
+# app/compression.py
+import gzip
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Optional
+import anyio
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# brotli and zstandard are optional; without them only gzip is offered
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/x-ndjson",
+    "application/msgpack",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+)
+
+
+class _Codec:
+    def __init__(self, name, levels):
+        self.name = name
+        # (normal, fast) compression levels
+        self.level, self.fast_level = levels
+
+    def compress(self, data: bytes, level: int) -> bytes:
+        if self.name == "zstd":
+            return zstandard.ZstdCompressor(level=level).compress(data)
+        if self.name == "br":
+            return brotli.compress(data, quality=level)
+        return gzip.compress(data, compresslevel=level, mtime=0)
+
+    def stream(self, level: int):
+        return _StreamCompressor(self.name, level)
+
+
+class _StreamCompressor:
+    """Incremental compressor that flushes after every chunk so clients can decode progressively."""
+
+    def __init__(self, name, level):
+        self.name = name
+        if name == "zstd":
+            self._obj = zstandard.ZstdCompressor(level=level).compressobj()
+        elif name == "br":
+            self._obj = brotli.Compressor(quality=level)
+        else:
+            self._obj = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def chunk(self, data: bytes) -> bytes:
+        if self.name == "zstd":
+            return self._obj.compress(data) + self._obj.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        if self.name == "br":
+            return self._obj.process(data) + self._obj.flush()
+        return self._obj.compress(data) + self._obj.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self.name == "br":
+            return self._obj.finish()
+        return self._obj.flush()
+
+
+def available_codecs() -> dict:
+    """Supported codecs, in server preference order."""
+    codecs = {}
+    if zstandard is not None:
+        codecs["zstd"] = _Codec("zstd", (3, 1))
+    if brotli is not None:
+        codecs["br"] = _Codec("br", (5, 1))
+    codecs["gzip"] = _Codec("gzip", (6, 1))
+    return codecs
+
+
+def choose_encoding(accept_encoding: str, codecs: dict):
+    """Pick the server-preferred codec among those the client accepts with q > 0."""
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, *params = [item.strip() for item in part.split(";")]
+        quality = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        if name:
+            accepted[name.lower()] = quality
+
+    # Ties go to the earlier (server-preferred) codec
+    best, best_quality = None, 0.0
+    for name in codecs:
+        quality = accepted.get(name, accepted.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = name, quality
+    return codecs[best] if best else None
+
+
+class CpuBudget:
+    """Token bucket of compression seconds, refilled at ``seconds_per_second``.
+
+    Once half the bucket is spent compression drops to the fast level, and when it is
+    empty responses go out uncompressed until it refills.
+    """
+
+    def __init__(self, seconds_per_second: float):
+        self.rate = seconds_per_second
+        self.capacity = seconds_per_second
+        self._tokens = seconds_per_second
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def available(self) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            return self._tokens
+
+    def charge(self, seconds: float) -> None:
+        with self._lock:
+            self._tokens -= seconds
+
+
+class CompressedCache:
+    """Byte-bounded LRU of compressed bodies, keyed by path, ETag and encoding.
+
+    Only for responses that have no ``encoded_bodies`` of their own (see CompressionMiddleware).
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+            return body
+
+    def put(self, key, body: bytes) -> None:
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous)
+            self._entries[key] = body
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+
+class CompressionMiddleware:
+    """Negotiates zstd/br/gzip for responses above ``minimum_size``.
+
+    Bodies of ``offload_size`` bytes or more are compressed in a worker thread so the
+    event loop keeps serving other requests. A route that serves a cached value can put
+    a dict in ``scope["state"]["encoded_bodies"]`` that lives as long as its cache entry;
+    compressed bodies are stored there by content type and encoding, and are gone when
+    the entry is invalidated or evicted. Other responses that carry an ETag are
+    compressed once per encoding and then served from ``CompressedCache``. Every
+    response of a compressible type gets ``Vary: Accept-Encoding``, whether or not it
+    was compressed this time, so a shared cache never hands one client's encoding to
+    another.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 1024,
+        offload_size: int = 64 * 1024,
+        cpu_budget: float = 0.25,
+        cache_bytes: int = 32 * 1024 * 1024,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.offload_size = offload_size
+        self.codecs = available_codecs()
+        self.budget = CpuBudget(cpu_budget)
+        self.cache = CompressedCache(cache_bytes)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        # Without a codec the responder still marks compressible responses with Vary
+        codec = choose_encoding(Headers(scope=scope).get("accept-encoding", ""), self.codecs)
+        responder = _CompressionResponder(self, codec, scope, send)
+        await self.app(scope, receive, responder.send)
+
+    def pick_level(self, codec: Optional[_Codec]):
+        """Return the level to use under the current CPU budget, or None to skip compression."""
+        if codec is None:
+            return None
+        tokens = self.budget.available()
+        if tokens <= 0:
+            return None
+        return codec.level if tokens > self.budget.capacity / 2 else codec.fast_level
+
+    def compress(self, codec: _Codec, body: bytes, level: int) -> bytes:
+        started = time.perf_counter()
+        compressed = codec.compress(body, level)
+        self.budget.charge(time.perf_counter() - started)
+        return compressed
+
+
+class _CompressionResponder:
+    def __init__(self, middleware: CompressionMiddleware, codec: Optional[_Codec], scope: Scope, send: Send):
+        self.middleware = middleware
+        self.codec = codec
+        self.scope = scope
+        self.downstream = send
+        self.start_message = None
+        self.stream = None
+
+    def _compressible(self, status: int, headers: Headers) -> bool:
+        # Byte ranges refer to the unencoded body: anything that offers or answers them
+        # (attachment downloads) goes out as it is, or a resumed download would splice
+        # identity bytes onto an encoded prefix
+        if "content-encoding" in headers or status in (204, 206, 304):
+            return False
+        if "accept-ranges" in headers or "content-range" in headers:
+            return False
+        content_type = headers.get("content-type", "")
+        return content_type.startswith(COMPRESSIBLE_TYPES)
+
+    def _mark_encoded(self, headers: MutableHeaders) -> None:
+        headers["Content-Encoding"] = self.codec.name
+
+    async def send(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            self.start_message = message
+            return
+        if message["type"] != "http.response.body":
+            # Zero-copy file sends and the like can't be compressed here; the headers go first, unchanged
+            if self.start_message is not None:
+                start_message, self.start_message = self.start_message, None
+                await self.downstream(start_message)
+            await self.downstream(message)
+            return
+
+        if self.stream is not None:
+            await self._send_stream_chunk(message)
+            return
+        if self.start_message is None:
+            await self.downstream(message)
+            return
+
+        start_message, self.start_message = self.start_message, None
+        headers = MutableHeaders(raw=start_message["headers"])
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if not self._compressible(start_message["status"], Headers(raw=start_message["headers"])):
+            await self.downstream(start_message)
+            await self.downstream(message)
+            return
+        # The encoding depends on Accept-Encoding even when this response goes out as it is
+        headers.add_vary_header("Accept-Encoding")
+
+        if more_body:
+            level = self.middleware.pick_level(self.codec)
+            if level is None:
+                await self.downstream(start_message)
+                await self.downstream(message)
+                return
+            # Streaming responses are compressed chunk by chunk
+            self.stream = self.codec.stream(level)
+            self._mark_encoded(headers)
+            del headers["Content-Length"]
+            await self.downstream(start_message)
+            await self._send_stream_chunk(message)
+            return
+
+        if len(body) < self.middleware.minimum_size:
+            await self.downstream(start_message)
+            await self.downstream(message)
+            return
+
+        compressed = await self._compress_body(headers, body) if self.codec is not None else None
+        if compressed is None or len(compressed) >= len(body):
+            await self.downstream(start_message)
+            await self.downstream(message)
+            return
+
+        self._mark_encoded(headers)
+        headers["Content-Length"] = str(len(compressed))
+        await self.downstream(start_message)
+        await self.downstream({"type": "http.response.body", "body": compressed})
+
+    async def _compress_body(self, headers: MutableHeaders, body: bytes):
+        # Read once the route has run, which is when it sets them
+        encoded = self.scope.get("state", {}).get("encoded_bodies")
+        etag = headers.get("etag")
+        if encoded is not None:
+            cache_key = (headers.get("content-type"), self.codec.name)
+            cached = encoded.get(cache_key)
+        elif etag:
+            cache_key = (self.scope["path"], etag, self.codec.name)
+            cached = self.middleware.cache.get(cache_key)
+        else:
+            cache_key = cached = None
+        if cached is not None:
+            return cached
+
+        level = self.middleware.pick_level(self.codec)
+        if level is None:
+            return None
+        if len(body) >= self.middleware.offload_size:
+            compressed = await anyio.to_thread.run_sync(self.middleware.compress, self.codec, body, level)
+        else:
+            compressed = self.middleware.compress(self.codec, body, level)
+
+        if encoded is not None:
+            encoded[cache_key] = compressed
+        elif cache_key is not None:
+            self.middleware.cache.put(cache_key, compressed)
+        return compressed
+
+    async def _send_stream_chunk(self, message: Message) -> None:
+        more_body = message.get("more_body", False)
+        started = time.perf_counter()
+        data = self.stream.chunk(message.get("body", b""))
+        if not more_body:
+            data += self.stream.finish()
+        self.middleware.budget.charge(time.perf_counter() - started)
+        await self.downstream({"type": "http.response.body", "body": data, "more_body": more_body})
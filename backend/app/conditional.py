@@ -0,0 +1,78 @@
+# app/conditional.py
+import hashlib
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from urllib.parse import urlencode
+from fastapi import Request, Response, status
+from . import models
+
+
+@dataclass(frozen=True)
+class Validators:
+    etag: str
+    last_modified: datetime
+    cache_control: str = "private, no-cache"
+
+    @property
+    def headers(self) -> dict:
+        return {
+            "ETag": self.etag,
+            "Last-Modified": format_datetime(self.last_modified, usegmt=True),
+            "Cache-Control": self.cache_control,
+        }
+
+
+def as_utc(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def board_validators(request: Request, board: models.Board) -> Validators:
+    """Build validators for a board-scoped read from the board's change revision.
+
+    The ETag also covers the path, query string and Accept header, so ``/boards/1/cards``
+    and ``/boards/1/lists`` (or two ``?fields=`` selections, or JSON and MessagePack
+    renderings) never share a tag.
+    """
+    query = urlencode(sorted(request.query_params.multi_items()))
+    accept = request.headers.get("accept", "")
+    variant = hashlib.md5(f"{request.url.path}?{query}|{accept}".encode()).hexdigest()[:8]
+    changed_at = board.updated_at or board.created_at or datetime.now(timezone.utc)
+    return Validators(
+        etag=f'W/"{board.id}-{board.revision or 0}-{variant}"',
+        last_modified=as_utc(changed_at).replace(microsecond=0),
+    )
+
+
+def _opaque_tag(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def is_not_modified(request: Request, validators: Validators) -> bool:
+    """Evaluate If-None-Match (weak comparison), falling back to If-Modified-Since."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        current = _opaque_tag(validators.etag)
+        return any(_opaque_tag(tag) == current for tag in if_none_match.split(","))
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = as_utc(parsedate_to_datetime(if_modified_since))
+        except (TypeError, ValueError):
+            return False
+        return validators.last_modified <= since
+    return False
+
+
+def not_modified_response(validators: Validators) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=validators.headers)
+
+
+def apply_validators(response: Response, validators: Validators) -> None:
+    response.headers.update(validators.headers)
@@ -1,5 +1,6 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, declarative_base
+from fastapi.requests import HTTPConnection
 import os
 from dotenv import load_dotenv
 from urllib.parse import quote_plus
@@ -16,7 +17,22 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
-def get_db():
+def enable_sqlite_foreign_keys(sqlite_engine):
+    """SQLite ignores foreign keys, ON DELETE CASCADE included, unless each connection turns them on."""
+    @event.listens_for(sqlite_engine, "connect")
+    def _foreign_keys_on(dbapi_connection, connection_record):
+        dbapi_connection.execute("PRAGMA foreign_keys=ON")
+
+def shared_session(connection: HTTPConnection):
+    """The session of the /batch call this sub-request belongs to, if any."""
+    return connection.scope.get("state", {}).get("batch_db")
+
+def get_db(connection: HTTPConnection):
+    # Sub-requests of a /batch call run on the batch's session, which the batch closes
+    shared = shared_session(connection)
+    if shared is not None:
+        yield shared
+        return
     db = SessionLocal()
     try:
         yield db
@@ -0,0 +1,161 @@
+# app/downloads.py
+#
+# Serving attachment files. Content-addressed files never change, so their sha256 is a
+# strong ETag and they are cached as immutable; single byte ranges (including
+# If-Range) and If-None-Match / If-Modified-Since are answered here. The body goes out
+# through the ASGI zero-copy send extension when the server offers it, and otherwise
+# in FILE_CHUNK_SIZE reads on worker threads. Behind nginx, setting
+# ATTACHMENT_ACCEL_PREFIX hands the transfer to nginx's sendfile via X-Accel-Redirect.
+#
+# Signed URLs let a client fetch one attachment without credentials until they expire:
+# the signature is an HMAC of the attachment id and expiry time, so checking it costs
+# no token decode and no permission query.
+import hashlib
+import hmac
+import os
+import time
+from datetime import datetime, timezone
+from typing import Optional
+from urllib.parse import quote, urlencode
+import anyio
+from fastapi import Request, Response, status
+from starlette.types import Receive, Scope, Send
+from . import auth, conditional, metrics, models, storage
+
+# Lifetime of a signed URL, in seconds
+SIGNED_URL_TTL = int(os.getenv("SIGNED_URL_TTL", "300"))
+# An internal nginx location that maps onto UPLOAD_DIR, e.g. "/protected-uploads/"
+ATTACHMENT_ACCEL_PREFIX = os.getenv("ATTACHMENT_ACCEL_PREFIX", "")
+IMMUTABLE = "private, max-age=31536000, immutable"
+# Types a browser may render in place; anything else (HTML and SVG included) is downloaded
+INLINE_TYPES = ("image/png", "image/jpeg", "image/gif", "image/webp", "application/pdf", "text/plain")
+
+
+def _signing_key() -> bytes:
+    # Derived, so a URL signature can never double as anything else signed with SECRET_KEY
+    return hashlib.sha256(b"attachment-url:" + (auth.SECRET_KEY or "").encode()).digest()
+
+
+def _signature(attachment_id: int, expires: int) -> str:
+    return hmac.new(_signing_key(), f"{attachment_id}:{expires}".encode(), hashlib.sha256).hexdigest()
+
+
+def signed_url(attachment_id: int) -> tuple:
+    """(URL, expiry) of a credential-free link to the attachment's content."""
+    expires = int(time.time()) + SIGNED_URL_TTL
+    query = urlencode({"expires": expires, "signature": _signature(attachment_id, expires)})
+    return f"/files/{attachment_id}?{query}", datetime.fromtimestamp(expires, timezone.utc)
+
+
+def verify(attachment_id: int, expires: int, signature: str) -> bool:
+    return expires >= time.time() and hmac.compare_digest(_signature(attachment_id, expires), signature)
+
+
+def _validators(attachment: models.Attachment, stat: os.stat_result) -> conditional.Validators:
+    if attachment.sha256:
+        changed_at = attachment.uploaded_at or datetime.fromtimestamp(stat.st_mtime, timezone.utc)
+        return conditional.Validators(
+            etag=f'"{attachment.sha256}"',
+            last_modified=conditional.as_utc(changed_at).replace(microsecond=0),
+            cache_control=IMMUTABLE,
+        )
+    # Files from before content addressing could in principle be replaced in place
+    return conditional.Validators(
+        etag=f'W/"{stat.st_size:x}-{int(stat.st_mtime):x}"',
+        last_modified=datetime.fromtimestamp(int(stat.st_mtime), timezone.utc),
+    )
+
+
+def _byte_range(request: Request, validators: conditional.Validators, size: int):
+    """(first, last) of the one range asked for, None for the whole file, or False if unsatisfiable."""
+    header = request.headers.get("range", "")
+    if not header.startswith("bytes=") or "," in header:
+        # Multiple ranges are allowed to be answered with the whole file
+        return None
+    if_range = request.headers.get("if-range")
+    if if_range is not None and if_range.strip() != validators.etag:
+        return None
+    first, _, last = header[len("bytes="):].strip().partition("-")
+    try:
+        if not first:
+            # Suffix range: the last N bytes
+            length = int(last)
+            return (max(size - length, 0), size - 1) if length > 0 and size > 0 else False
+        first = int(first)
+        last = min(int(last), size - 1) if last else size - 1
+    except ValueError:
+        return None
+    if first >= size or last < first:
+        return False
+    return first, last
+
+
+def _disposition(attachment: models.Attachment) -> str:
+    kind = "inline" if (attachment.content_type or "") in INLINE_TYPES else "attachment"
+    filename = os.path.basename(attachment.filename or "") or "file"
+    return f"{kind}; filename*=UTF-8''{quote(filename)}"
+
+
+class FileRangeResponse(Response):
+    """Sends ``length`` bytes of ``path`` from ``offset``, zero-copy when the server supports it."""
+
+    def __init__(self, path: str, offset: int, length: int, status_code: int, headers: dict, media_type: str):
+        super().__init__(status_code=status_code, headers=headers, media_type=media_type)
+        self.path, self.offset, self.length = path, offset, length
+        self.headers["Content-Length"] = str(length)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        f = await anyio.to_thread.run_sync(open, self.path, "rb")
+        try:
+            if "http.response.zerocopysend" in scope.get("extensions", {}):
+                await send({"type": "http.response.zerocopysend", "file": f, "offset": self.offset,
+                            "count": self.length, "more_body": False})
+                return
+            await anyio.to_thread.run_sync(f.seek, self.offset)
+            remaining = self.length
+            while remaining > 0:
+                chunk = await anyio.to_thread.run_sync(f.read, min(storage.FILE_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining > 0:
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            await anyio.to_thread.run_sync(f.close)
+
+
+def respond(request: Request, attachment: Optional[models.Attachment]) -> Response:
+    """The attachment's content, honouring Range and conditional headers."""
+    path = storage.local_path(attachment.file_path) if attachment is not None else None
+    if path is None:
+        return Response(status_code=status.HTTP_404_NOT_FOUND)
+    stat = os.stat(path)
+    validators = _validators(attachment, stat)
+    if conditional.is_not_modified(request, validators):
+        return conditional.not_modified_response(validators)
+
+    headers = {
+        **validators.headers,
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": _disposition(attachment),
+        "X-Content-Type-Options": "nosniff",
+    }
+    media_type = attachment.content_type or "application/octet-stream"
+    metrics.increment("attachments.downloads")
+    if ATTACHMENT_ACCEL_PREFIX:
+        # nginx serves the file itself, Range requests included
+        relative = os.path.relpath(path, os.path.realpath(storage.UPLOAD_DIR))
+        headers["X-Accel-Redirect"] = ATTACHMENT_ACCEL_PREFIX.rstrip("/") + "/" + quote(relative)
+        return Response(headers=headers, media_type=media_type)
+
+    byte_range = _byte_range(request, validators, stat.st_size)
+    if byte_range is False:
+        return Response(status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                        headers={"Content-Range": f"bytes */{stat.st_size}"})
+    if byte_range is None:
+        return FileRangeResponse(path, 0, stat.st_size, status.HTTP_200_OK, headers, media_type)
+    first, last = byte_range
+    headers["Content-Range"] = f"bytes {first}-{last}/{stat.st_size}"
+    return FileRangeResponse(path, first, last - first + 1, status.HTTP_206_PARTIAL_CONTENT, headers, media_type)
@@ -0,0 +1,190 @@
+# app/export.py
+#
+# Streaming exports of one board or of a whole account, as NDJSON or as a gzipped
+# tarball. Rows come off server-side cursors (yield_per) and are written out as they
+# arrive, and attachment files are read from UPLOAD_DIR a chunk at a time, so memory
+# use stays the same however big the board is.
+#
+# NDJSON is one {"type": <table>, "data": {<columns>}} record per line; attachment
+# files follow as base64 "attachment_content" records. The tarball holds the same
+# records in export.ndjson plus each file as attachments/<id>/<filename>.
+import base64
+import json
+import os
+import tarfile
+import tempfile
+import time
+import zlib
+from datetime import datetime
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from . import archive, metrics, models, storage
+from .negotiation import chunked
+
+# Rows fetched per cursor round trip
+EXPORT_BATCH = 1000
+# Output is handed to the server in chunks of about this size
+EXPORT_CHUNK_BYTES = 64 * 1024
+# export.ndjson is staged in memory up to this size, then on disk, because a tar
+# header needs the size of its file
+EXPORT_SPOOL_BYTES = 8 * 1024 * 1024
+# Raw bytes per attachment_content record (a multiple of 3, so chunks encode separately)
+_CONTENT_CHUNK = 48 * 1024
+
+FORMATS = {"ndjson": "application/x-ndjson", "tar.gz": "application/gzip"}
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, bytes):
+        return base64.b64encode(value).decode()
+    if hasattr(value, "value"):
+        return value.value
+    raise TypeError(f"Cannot export {type(value).__name__}")
+
+
+def _line(record: dict) -> bytes:
+    return json.dumps(record, default=_encode, separators=(",", ":")).encode() + b"\n"
+
+
+def _rows(db: Session, table, where):
+    result = db.execute(select(table).where(where).order_by(*table.primary_key.columns)
+                        .execution_options(yield_per=EXPORT_BATCH))
+    try:
+        for row in result:
+            yield {"type": table.name, "data": dict(row._mapping)}
+    finally:
+        result.close()
+
+
+def board_records(db: Session, board_id: int):
+    """The board row, its members and every row under it."""
+    boards, members = models.Board.__table__, models.BoardMember.__table__
+    yield from _rows(db, boards, boards.c.id == board_id)
+    yield from _rows(db, members, members.c.board_id == board_id)
+    for table, ids in archive.subtree(board_id):
+        yield from _rows(db, table, table.c.id.in_(ids))
+
+
+def _owned_boards(user_id: int):
+    return select(models.Board.id).where(models.Board.owner_id == user_id, models.Board.deleted_at.is_(None))
+
+
+def account_records(db: Session, user_id: int):
+    """The user, every board they own in full, and their memberships and comments elsewhere."""
+    users = models.User.__table__
+    for record in _rows(db, users, users.c.id == user_id):
+        record["data"].pop("hashed_password", None)
+        yield record
+    for board_id in db.scalars(_owned_boards(user_id).order_by(models.Board.id)).all():
+        yield from board_records(db, board_id)
+    members, comments = models.BoardMember.__table__, models.Comment.__table__
+    yield from _rows(db, members, (members.c.user_id == user_id) & members.c.board_id.not_in(_owned_boards(user_id)))
+    owned_cards = select(models.Card.id).join(models.List).where(models.List.board_id.in_(_owned_boards(user_id)))
+    yield from _rows(db, comments, (comments.c.user_id == user_id) & comments.c.card_id.not_in(owned_cards))
+
+
+def _attachment_files(db: Session, board_ids):
+    cards = select(models.Card.id).join(models.List).where(models.List.board_id.in_(board_ids))
+    result = db.execute(
+        select(models.Attachment.id, models.Attachment.filename, models.Attachment.file_path)
+        .where(models.Attachment.card_id.in_(cards))
+        .order_by(models.Attachment.id)
+        .execution_options(yield_per=EXPORT_BATCH)
+    )
+    try:
+        for row in result:
+            # Files that went missing or point outside UPLOAD_DIR are left out
+            path = storage.local_path(row.file_path)
+            if path is not None:
+                yield row.id, os.path.basename(row.filename or "") or "file", path
+    finally:
+        result.close()
+
+
+def _ndjson(db: Session, records, board_ids):
+    for record in records:
+        yield _line(record)
+    for attachment_id, _, path in _attachment_files(db, board_ids):
+        with open(path, "rb") as f:
+            while chunk := f.read(_CONTENT_CHUNK):
+                yield _line({"type": "attachment_content", "id": attachment_id, "data": chunk})
+
+
+class _TarGz:
+    """Writes a gzipped tar stream entry by entry, without holding any entry in memory."""
+
+    def __init__(self):
+        self._gzip = zlib.compressobj(6, zlib.DEFLATED, 31)
+        self._size = 0
+
+    def _write(self, data: bytes) -> bytes:
+        self._size += len(data)
+        return self._gzip.compress(data)
+
+    def add(self, name: str, size: int, chunks):
+        info = tarfile.TarInfo(name)
+        info.size = size
+        info.mtime = int(time.time())
+        yield self._write(info.tobuf(format=tarfile.PAX_FORMAT))
+        for chunk in chunks:
+            yield self._write(chunk)
+        # Entries are padded out to whole blocks
+        yield self._write(b"\0" * (-size % tarfile.BLOCKSIZE))
+
+    def close(self) -> bytes:
+        end = b"\0" * (2 * tarfile.BLOCKSIZE)
+        end += b"\0" * (-(self._size + len(end)) % tarfile.RECORDSIZE)
+        return self._write(end) + self._gzip.flush()
+
+
+def _tar_gz(db: Session, records, board_ids):
+    tar = _TarGz()
+    with tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_BYTES) as spool:
+        for record in records:
+            spool.write(_line(record))
+        size = spool.tell()
+        spool.seek(0)
+        yield from tar.add("export.ndjson", size, iter(lambda: spool.read(storage.FILE_CHUNK_SIZE), b""))
+    for attachment_id, filename, path in _attachment_files(db, board_ids):
+        yield from tar.add(f"attachments/{attachment_id}/{filename}", os.path.getsize(path), storage.read_chunks(path))
+    yield tar.close()
+
+
+def _stream(bind, export_format: str, records, board_ids):
+    # A session of its own: the request's session is closed before the body is sent
+    with Session(bind=bind) as db:
+        writer = _tar_gz if export_format == "tar.gz" else _ndjson
+        sent = 0
+        for chunk in chunked(writer(db, records(db), board_ids), EXPORT_CHUNK_BYTES):
+            sent += len(chunk)
+            yield chunk
+    metrics.increment("export.bytes", sent)
+
+
+def response(bind, export_format: str, name: str, records, board_ids) -> StreamingResponse:
+    """Stream ``records(db)`` and the attachments of ``board_ids`` as a download named ``name``."""
+    metrics.increment("export.requests")
+    extension = "tar.gz" if export_format == "tar.gz" else "ndjson"
+    return StreamingResponse(
+        _stream(bind, export_format, records, board_ids),
+        media_type=FORMATS[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{name}.{extension}"'},
+    )
+
+
+def board_export(bind, board_id: int, export_format: str) -> StreamingResponse:
+    return response(bind, export_format, f"board-{board_id}", lambda db: board_records(db, board_id), [board_id])
+
+
+def account_export(db: Session, user: models.User, export_format: str) -> StreamingResponse:
+    # Archived boards are restored first, so their rows can be read like any other's
+    archived = db.scalars(select(models.Board).where(
+        models.Board.owner_id == user.id, models.Board.deleted_at.is_(None), models.Board.archived_at.is_not(None)
+    )).all()
+    for board in archived:
+        archive.ensure_live(db, board)
+    return response(db.get_bind(), export_format, f"account-{user.id}",
+                    lambda session: account_records(session, user.id), _owned_boards(user.id))
@@ -0,0 +1,53 @@
+# app/fieldsets.py
+from typing import Iterable, Optional
+from fastapi import Query, Response
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
+from .exceptions import BadRequestException
+from .negotiation import NegotiatedResponse
+
+
+def sparse_fields(schema: type[BaseModel]):
+    """Build a ``?fields=a,b`` dependency restricted to the fields of ``schema``.
+
+    The dependency resolves to ``None`` when the parameter is absent, otherwise to the
+    requested field names in schema order. Unknown names are rejected with a 400.
+    """
+    allowed = list(schema.model_fields)
+
+    def dependency(
+        fields: Optional[str] = Query(
+            None,
+            description=f"Comma-separated subset of: {', '.join(allowed)}"
+        )
+    ) -> Optional[list[str]]:
+        if fields is None:
+            return None
+        requested = {name.strip() for name in fields.split(",") if name.strip()}
+        if not requested:
+            raise BadRequestException(detail="At least one field must be requested")
+        unknown = sorted(requested.difference(allowed))
+        if unknown:
+            raise BadRequestException(detail=f"Unknown fields: {', '.join(unknown)}")
+        return [name for name in allowed if name in requested]
+
+    return dependency
+
+
+def columns(model, fields: list[str]) -> list:
+    """Map requested field names onto the model's column attributes, for ``with_entities``."""
+    return [getattr(model, name) for name in fields]
+
+
+def sparse_response(content, response: Response) -> NegotiatedResponse:
+    """Serialize already-projected content, keeping headers set on the injected ``response``."""
+    return NegotiatedResponse(content=jsonable_encoder(content), headers=dict(response.headers))
+
+
+def project_rows(rows: Iterable, response: Response) -> NegotiatedResponse:
+    return sparse_response([row._asdict() for row in rows], response)
+
+
+def project_models(items: Iterable[BaseModel], fields: list[str], response: Response) -> NegotiatedResponse:
+    include = set(fields)
+    return sparse_response([item.model_dump(include=include) for item in items], response)
@@ -0,0 +1,174 @@
+# app/fulltext.py
+#
+# Full-text search over boards, lists and cards. On Postgres each table carries a
+# generated tsvector column with a GIN index; on SQLite each has an external-content
+# FTS5 table kept in step by triggers. Either way a search is one ranked UNION query.
+#
+# Substring search (match="substring") keeps the old ILIKE '%q%' semantics, ranked the
+# way the trigram index ranks them; on Postgres pg_trgm indexes spare it a scan.
+import re
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import DDL, Integer, String, case, column, event, exists, func, literal, literal_column, or_, select, table, union_all
+from sqlalchemy.orm import Session
+from . import models
+from .permissions import readable_boards
+
+# Order of entities with equal substring rank, as in the trigram index
+_ENTITY_ORDER = {"board": 0, "list": 1, "card": 2}
+# Searchable text per table; the first column is weighted above the rest
+_INDEXED = {
+    models.Board.__table__: ("title",),
+    models.List.__table__: ("title",),
+    models.Card.__table__: ("title", "description"),
+}
+
+
+def _tsvector_sql(columns) -> str:
+    weighted = [
+        f"setweight(to_tsvector('english', coalesce({name}, '')), '{'A' if i == 0 else 'B'}')"
+        for i, name in enumerate(columns)
+    ]
+    return " || ".join(weighted)
+
+
+def _postgres_ddl(name: str, columns) -> list:
+    return [
+        f"ALTER TABLE {name} ADD COLUMN IF NOT EXISTS search_vector tsvector "
+        f"GENERATED ALWAYS AS ({_tsvector_sql(columns)}) STORED",
+        f"CREATE INDEX IF NOT EXISTS ix_{name}_search_vector ON {name} USING gin (search_vector)",
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+        *(f"CREATE INDEX IF NOT EXISTS ix_{name}_{c}_trgm ON {name} USING gin ({c} gin_trgm_ops)" for c in columns),
+    ]
+
+
+def _sqlite_ddl(name: str, columns) -> list:
+    cols = ", ".join(columns)
+    new = ", ".join(f"new.{c}" for c in columns)
+    old = ", ".join(f"old.{c}" for c in columns)
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {name}_fts USING fts5({cols}, content='{name}', "
+        f"content_rowid='id', tokenize='porter unicode61')",
+        f"CREATE TRIGGER IF NOT EXISTS {name}_fts_insert AFTER INSERT ON {name} BEGIN "
+        f"INSERT INTO {name}_fts(rowid, {cols}) VALUES (new.id, {new}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {name}_fts_delete AFTER DELETE ON {name} BEGIN "
+        f"INSERT INTO {name}_fts({name}_fts, rowid, {cols}) VALUES ('delete', old.id, {old}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {name}_fts_update AFTER UPDATE OF {cols} ON {name} BEGIN "
+        f"INSERT INTO {name}_fts({name}_fts, rowid, {cols}) VALUES ('delete', old.id, {old}); "
+        f"INSERT INTO {name}_fts(rowid, {cols}) VALUES (new.id, {new}); END",
+    ]
+
+
+# Databases built with create_all (tests, local SQLite) get the index along with the
+# tables; existing Postgres databases get it from the migration
+for _table, _columns in _INDEXED.items():
+    for _statement in _postgres_ddl(_table.name, _columns):
+        event.listen(_table, "after_create", DDL(_statement).execute_if(dialect="postgresql"))
+    for _statement in _sqlite_ddl(_table.name, _columns):
+        event.listen(_table, "after_create", DDL(_statement).execute_if(dialect="sqlite"))
+    event.listen(_table, "after_drop", DDL(f"DROP TABLE IF EXISTS {_table.name}_fts").execute_if(dialect="sqlite"))
+
+
+def terms(query: str) -> list:
+    return re.findall(r"\w+", query.lower())
+
+
+def _match(db: Session, target, query_terms):
+    """(join target or None, WHERE clause, rank expression) for one indexed table."""
+    name = target.__table__.name
+    if db.get_bind().dialect.name == "postgresql":
+        # Every term must match, each as a prefix so "desig" finds "design"
+        tsquery = func.to_tsquery(literal_column("'english'::regconfig"), " & ".join(f"{t}:*" for t in query_terms))
+        vector = literal_column(f"{name}.search_vector")
+        return None, vector.op("@@")(tsquery), func.ts_rank(vector, tsquery)
+    fts = table(f"{name}_fts", column("rowid"))
+    match = " ".join(f'"{t}"*' for t in query_terms)
+    weights = [10.0] + [1.0] * (len(_INDEXED[target.__table__]) - 1)
+    # bm25 is lower for better matches
+    return fts, literal_column(fts.name).op("MATCH")(match), -func.bm25(literal_column(fts.name), *weights)
+
+
+def _entity_select(db: Session, entity: str, target, query_terms):
+    fts, where, rank = _match(db, target, query_terms)
+    stmt = select(
+        literal(entity, String).label("type"), target.id.label("id"), target.title.label("title"), rank.label("rank")
+    )
+    if fts is not None:
+        stmt = stmt.join_from(target, fts, fts.c.rowid == target.id)
+    return stmt.where(where)
+
+
+def _like_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _substring_select(entity: str, target, needle: str):
+    # Ranked as the trigram index ranks: title prefix, then title, then description
+    contains, prefix = f"%{_like_escape(needle)}%", f"{_like_escape(needle)}%"
+    columns = [getattr(target, name) for name in _INDEXED[target.__table__]]
+    rank = case(
+        (target.title.ilike(prefix, escape="\\"), 3),
+        (target.title.ilike(contains, escape="\\"), 2),
+        else_=1,
+    )
+    return select(
+        literal(entity, String).label("type"), target.id.label("id"), target.title.label("title"),
+        rank.label("rank"), literal(_ENTITY_ORDER[entity], Integer).label("position"),
+    ).where(or_(*(c.ilike(contains, escape="\\") for c in columns)))
+
+
+def search(
+    db: Session,
+    user: models.User,
+    query: str,
+    *,
+    match: str = "words",
+    board_id: Optional[int] = None,
+    due_date_start: Optional[datetime] = None,
+    due_date_end: Optional[datetime] = None,
+    label: Optional[str] = None,
+    skip: int = 0,
+    limit: int = 20,
+) -> list:
+    """Ranked (type, id, title, rank) rows on boards ``user`` owns or is a member of.
+
+    ``match`` is "words" for stemmed word-prefix matches, or "substring" for ILIKE '%q%'.
+    """
+    if match == "substring":
+        needle = query.lower()
+        entity_select = lambda entity, target: _substring_select(entity, target, needle)
+        order = ("position", "id")
+    else:
+        query_terms = terms(query)
+        if not query_terms:
+            return []
+        entity_select = lambda entity, target: _entity_select(db, entity, target, query_terms)
+        order = ("type", "id")
+
+    readable = readable_boards(user).with_only_columns(models.Board.id)
+    if board_id:
+        readable = readable.where(models.Board.id == board_id)
+
+    boards = entity_select("board", models.Board).where(models.Board.id.in_(readable))
+    lists = entity_select("list", models.List).where(models.List.board_id.in_(readable))
+    cards = entity_select("card", models.Card).where(
+        models.Card.list_id.in_(select(models.List.id).where(models.List.board_id.in_(readable)))
+    )
+    # Card filters only narrow the cards, as they always have
+    if due_date_start:
+        cards = cards.where(models.Card.due_date >= due_date_start)
+    if due_date_end:
+        cards = cards.where(models.Card.due_date <= due_date_end)
+    if label:
+        # The name picks palette entries; cards are then matched on integer label ids
+        palette = select(models.BoardLabel.id).where(models.BoardLabel.board_id.in_(readable), models.BoardLabel.name == label)
+        cards = cards.where(exists().where(models.CardLabel.card_id == models.Card.id, models.CardLabel.label_id.in_(palette)))
+
+    results = union_all(boards, lists, cards).subquery()
+    stmt = (
+        select(results)
+        .order_by(results.c.rank.desc(), *(results.c[name] for name in order))
+        .offset(skip)
+        .limit(limit)
+    )
+    return db.execute(stmt).all()
@@ -0,0 +1,306 @@
+# app/idempotency.py
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import os
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Union
+import anyio
+from redis.exceptions import RedisError
+from sqlalchemy import delete
+from sqlalchemy.exc import IntegrityError
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse, Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from . import metrics, models
+from .database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(24 * 60 * 60)))
+# How long an unfinished first request holds its key before a retry may take over
+IDEMPOTENCY_LOCK_SECONDS = int(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "60"))
+# How long a duplicate waits for the first request to finish before giving up with 409
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "10"))
+
+IDEMPOTENT_PATHS = ("/boards/", "/lists/", "/cards/", "/cards/batch")
+
+
+@dataclass
+class StoredResponse:
+    fingerprint: str
+    status: int
+    content_type: Optional[str]
+    body: bytes
+
+
+@dataclass
+class InFlight:
+    fingerprint: str
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _as_utc(value: datetime) -> datetime:
+    # SQLite hands back naive datetimes
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+class RedisStore:
+    """Keys live in Redis as compact JSON; SET NX claims a key, the TTL expires it."""
+
+    def __init__(self, redis_client):
+        self.redis = redis_client
+
+    async def begin(self, key: str, fingerprint: str) -> Union[None, InFlight, StoredResponse]:
+        claimed = await self.redis.set(f"idempotency:{key}", json.dumps({"f": fingerprint}), nx=True, ex=IDEMPOTENCY_LOCK_SECONDS)
+        return None if claimed else await self.get(key)
+
+    async def get(self, key: str) -> Union[None, InFlight, StoredResponse]:
+        raw = await self.redis.get(f"idempotency:{key}")
+        if raw is None:
+            return None
+        record = json.loads(raw)
+        if "s" not in record:
+            return InFlight(record["f"])
+        return StoredResponse(record["f"], record["s"], record["t"], base64.b64decode(record["b"]))
+
+    async def complete(self, key: str, response: StoredResponse) -> None:
+        record = {
+            "f": response.fingerprint,
+            "s": response.status,
+            "t": response.content_type,
+            "b": base64.b64encode(response.body).decode(),
+        }
+        await self.redis.set(f"idempotency:{key}", json.dumps(record, separators=(",", ":")), ex=IDEMPOTENCY_TTL_SECONDS)
+
+    async def release(self, key: str) -> None:
+        await self.redis.delete(f"idempotency:{key}")
+
+
+class DatabaseStore:
+    """Fallback store on the idempotency_keys table, used when Redis is unavailable."""
+
+    PURGE_EVERY = 100
+
+    def __init__(self, session_factory):
+        self.session_factory = session_factory
+        self._begins = 0
+
+    async def begin(self, key: str, fingerprint: str) -> Union[None, InFlight, StoredResponse]:
+        return await anyio.to_thread.run_sync(self._begin, key, fingerprint)
+
+    async def get(self, key: str) -> Union[None, InFlight, StoredResponse]:
+        return await anyio.to_thread.run_sync(self._get, key)
+
+    async def complete(self, key: str, response: StoredResponse) -> None:
+        await anyio.to_thread.run_sync(self._complete, key, response)
+
+    async def release(self, key: str) -> None:
+        await anyio.to_thread.run_sync(self._release, key)
+
+    def _begin(self, key, fingerprint):
+        self._begins += 1
+        with self.session_factory() as db:
+            if self._begins % self.PURGE_EVERY == 0:
+                db.execute(delete(models.IdempotencyKey).where(models.IdempotencyKey.expires_at < _now()))
+                db.commit()
+            for _ in range(2):
+                now = _now()
+                db.add(models.IdempotencyKey(
+                    key=key,
+                    fingerprint=fingerprint,
+                    locked_until=now + timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS),
+                    expires_at=now + timedelta(seconds=IDEMPOTENCY_TTL_SECONDS),
+                ))
+                try:
+                    db.commit()
+                    return None
+                except IntegrityError:
+                    db.rollback()
+                row = db.get(models.IdempotencyKey, key)
+                if row is None:
+                    continue
+                abandoned = row.status_code is None and _as_utc(row.locked_until) < now
+                if _as_utc(row.expires_at) >= now and not abandoned:
+                    return self._decode(row)
+                # Expired, or its first request died mid-flight: clear it and claim it again
+                db.execute(delete(models.IdempotencyKey).where(
+                    models.IdempotencyKey.key == key,
+                    models.IdempotencyKey.locked_until == row.locked_until,
+                ))
+                db.commit()
+            return self._get(key)
+
+    def _get(self, key):
+        with self.session_factory() as db:
+            row = db.get(models.IdempotencyKey, key)
+            return None if row is None else self._decode(row)
+
+    def _complete(self, key, response):
+        with self.session_factory() as db:
+            row = db.get(models.IdempotencyKey, key)
+            if row is None:
+                return
+            row.status_code = response.status
+            row.content_type = response.content_type
+            row.body = response.body
+            row.expires_at = _now() + timedelta(seconds=IDEMPOTENCY_TTL_SECONDS)
+            db.commit()
+
+    def _release(self, key):
+        with self.session_factory() as db:
+            db.execute(delete(models.IdempotencyKey).where(models.IdempotencyKey.key == key))
+            db.commit()
+
+    @staticmethod
+    def _decode(row):
+        if row.status_code is None:
+            return InFlight(row.fingerprint)
+        return StoredResponse(row.fingerprint, row.status_code, row.content_type, row.body)
+
+
+# Replaced with a RedisStore in lifespan when Redis is reachable
+store = DatabaseStore(SessionLocal)
+
+
+def configure(new_store) -> None:
+    global store
+    store = new_store
+
+
+def _replay(response: StoredResponse) -> Response:
+    return Response(
+        content=response.body,
+        status_code=response.status,
+        headers={"Idempotent-Replayed": "true"},
+        media_type=response.content_type,
+    )
+
+
+def _error(status: int, message: str):
+    return JSONResponse(status_code=status, content={"message": message})
+
+
+class IdempotencyMiddleware:
+    """Makes POSTs to create endpoints safe to retry when they carry an Idempotency-Key.
+
+    The first request with a key runs normally and its response is stored; retries get
+    that response back without running again. A duplicate arriving while the first is
+    still running waits for it. Keys are scoped to the caller's credentials and expire
+    after IDEMPOTENCY_TTL_SECONDS. 5xx responses are not stored, so those can be retried.
+    """
+
+    def __init__(self, app: ASGIApp, paths=IDEMPOTENT_PATHS):
+        self.app = app
+        self.paths = set(paths)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        idempotency_key = headers.get("idempotency-key")
+        if not idempotency_key:
+            await self.app(scope, receive, send)
+            return
+        if len(idempotency_key) > 255:
+            await _error(400, "Idempotency-Key must be at most 255 characters")(scope, receive, send)
+            return
+
+        body = await _read_body(receive)
+        key = hashlib.sha256(
+            f"{headers.get('authorization', '')}|{scope['path']}|{idempotency_key}".encode()
+        ).hexdigest()
+        fingerprint = hashlib.sha256(body).hexdigest()
+
+        try:
+            existing = await self._claim(key, fingerprint)
+        except RedisError:
+            logger.warning("Idempotency store unavailable; running the request without a key")
+            existing = None
+            key = None
+
+        if isinstance(existing, (StoredResponse, InFlight)):
+            if existing.fingerprint != fingerprint:
+                metrics.increment("idempotency.conflicts")
+                response = _error(422, "Idempotency-Key was already used with a different request body")
+            elif isinstance(existing, InFlight):
+                response = _error(409, "A request with this Idempotency-Key is still in progress")
+            else:
+                metrics.increment("idempotency.replayed")
+                response = _replay(existing)
+            await response(scope, receive, send)
+            return
+
+        await self._run_first(scope, body, send, key, fingerprint)
+
+    async def _claim(self, key, fingerprint):
+        """Claim ``key`` (returning None), or return what it holds once settled.
+
+        A duplicate of an in-flight request polls until the first one completes, is
+        released (then the duplicate claims it and runs) or the wait times out.
+        """
+        deadline = asyncio.get_running_loop().time() + IDEMPOTENCY_WAIT_SECONDS
+        delay = 0.02
+        waited = False
+        while True:
+            existing = await store.begin(key, fingerprint)
+            if not isinstance(existing, InFlight) or existing.fingerprint != fingerprint:
+                return existing
+            if not waited:
+                metrics.increment("idempotency.waited")
+                waited = True
+            if asyncio.get_running_loop().time() >= deadline:
+                return existing
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.5)
+
+    async def _run_first(self, scope, body, send, key, fingerprint):
+        start: Optional[Message] = None
+        chunks = []
+
+        async def receive_body():
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        async def capture(message: Message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                start = message
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive_body, capture)
+        except BaseException:
+            if key is not None:
+                await store.release(key)
+            raise
+        if key is None:
+            return
+        if start is None or start["status"] >= 500:
+            await store.release(key)
+            return
+        response_headers = Headers(raw=start["headers"])
+        if "content-encoding" in response_headers:
+            # Only identity bodies are stored; compression sits outside this middleware
+            await store.release(key)
+            return
+        await store.complete(key, StoredResponse(
+            fingerprint, start["status"], response_headers.get("content-type"), b"".join(chunks)
+        ))
+
+
+async def _read_body(receive: Receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            return b"".join(chunks)
@@ -0,0 +1,325 @@
+# app/jobs.py
+#
+# Durable background jobs. A job is a row in the jobs table; handlers register under a
+# type with a concurrency limit, and a JobRunner started in the lifespan claims queued
+# rows with SELECT ... FOR UPDATE SKIP LOCKED (so several processes can share the
+# queue on Postgres) and runs each handler on a worker thread. Claiming takes a lease
+# that a heartbeat renews while the handler runs; a job whose lease runs out is claimed
+# again, so work survives a crash. A run only records its outcome (and only commits
+# its work, for handlers that leave committing to the runner) while its claim still
+# stands. Failures are retried with exponential backoff up to max_attempts.
+import asyncio
+import logging
+import os
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Optional
+import anyio
+from sqlalchemy import and_, event, or_, select, update
+from sqlalchemy.orm import Session
+from . import metrics, models
+
+logger = logging.getLogger(__name__)
+
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "300"))
+# How often a running job's lease is renewed and its progress written
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", "5.0"))
+JOB_RETRY_BACKOFF = float(os.getenv("JOB_RETRY_BACKOFF", "5.0"))
+# How long shutdown waits for running jobs; anything unfinished is re-run once its lease expires
+JOB_SHUTDOWN_GRACE = float(os.getenv("JOB_SHUTDOWN_GRACE", "10.0"))
+
+
+@dataclass(frozen=True)
+class JobType:
+    name: str
+    handler: Callable
+    concurrency: int
+    max_attempts: int
+    cleanup: Optional[Callable]
+
+
+_job_types = {}
+
+
+def job(name: str, concurrency: int = 1, max_attempts: int = 3, cleanup: Optional[Callable] = None):
+    """Register ``handler(ctx: JobContext)`` for jobs of type ``name``; it may return a JSON-able result.
+
+    ``cleanup(payload)``, if given, runs once the job has ended, succeeded or failed for good.
+    """
+    def register(handler):
+        _job_types[name] = JobType(name, handler, concurrency, max_attempts, cleanup)
+        return handler
+    return register
+
+
+def enqueue(db: Session, name: str, payload: dict, user_id: Optional[int] = None) -> models.Job:
+    """Add a job on ``db``; it becomes claimable when the caller commits."""
+    if name not in _job_types:
+        raise ValueError(f"Unknown job type: {name}")
+    db_job = models.Job(
+        type=name,
+        payload=payload,
+        max_attempts=_job_types[name].max_attempts,
+        run_after=datetime.now(timezone.utc),
+        created_by=user_id,
+    )
+    db.add(db_job)
+    db.flush()
+    db.info["jobs_enqueued"] = True
+    return db_job
+
+
+@dataclass
+class JobContext:
+    """What a handler gets: its payload, a session of its own, and a way to report progress."""
+    job_id: int
+    payload: dict
+    db: Session
+    progress_done: int = 0
+    progress_total: Optional[int] = None
+
+    def progress(self, done: int, total: Optional[int] = None) -> None:
+        # Only noted here; the heartbeat writes it, so reporting never waits on or
+        # commits the handler's transaction
+        self.progress_done = done
+        if total is not None:
+            self.progress_total = total
+
+    def progress_values(self) -> dict:
+        values = {"progress_done": self.progress_done}
+        if self.progress_total is not None:
+            values["progress_total"] = self.progress_total
+        return values
+
+
+def _lease() -> datetime:
+    return datetime.now(timezone.utc) + timedelta(seconds=JOB_LEASE_SECONDS)
+
+
+def _held(job_id: int, attempt: int):
+    """The job's row, as long as the claim made for ``attempt`` still stands."""
+    return and_(models.Job.id == job_id, models.Job.status == models.JobStatus.RUNNING, models.Job.attempts == attempt)
+
+
+class _Heartbeat(threading.Thread):
+    """Renews a running job's lease and writes its progress every JOB_HEARTBEAT_SECONDS."""
+
+    def __init__(self, session_factory, ctx: JobContext, attempt: int):
+        super().__init__(name=f"job-{ctx.job_id}-heartbeat", daemon=True)
+        self.session_factory = session_factory
+        self.ctx = ctx
+        self.attempt = attempt
+        self._stopped = threading.Event()
+
+    def run(self) -> None:
+        while not self._stopped.wait(JOB_HEARTBEAT_SECONDS):
+            try:
+                with self.session_factory() as db:
+                    db.execute(
+                        update(models.Job).where(_held(self.ctx.job_id, self.attempt))
+                        .values(locked_until=_lease(), **self.ctx.progress_values())
+                    )
+                    db.commit()
+            except Exception:
+                # SQLite's write lock may be the handler's; the lease outlasts a few missed beats
+                logger.warning("Heartbeat of job %s failed", self.ctx.job_id, exc_info=True)
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self.join()
+
+
+def _claimable(now: datetime):
+    return or_(
+        and_(models.Job.status == models.JobStatus.QUEUED, models.Job.run_after <= now),
+        and_(models.Job.status == models.JobStatus.RUNNING, models.Job.locked_until < now),
+    )
+
+
+def claim(session_factory, types) -> Optional[tuple]:
+    """Take the oldest claimable job of one of ``types``; (id, type, payload, attempt) or None."""
+    now = datetime.now(timezone.utc)
+    with session_factory() as db:
+        job_id = db.scalar(
+            select(models.Job.id)
+            .where(models.Job.type.in_(types), _claimable(now))
+            .order_by(models.Job.id)
+            .limit(1)
+            # Concurrent claimers skip past this row instead of queueing behind it;
+            # SQLite has no row locks, and the guarded UPDATE below settles races there
+            .with_for_update(skip_locked=True)
+        )
+        if job_id is None:
+            return None
+        claimed = db.execute(
+            update(models.Job)
+            .where(models.Job.id == job_id, _claimable(now))
+            .values(status=models.JobStatus.RUNNING, attempts=models.Job.attempts + 1, locked_until=_lease())
+            .returning(models.Job.type, models.Job.payload, models.Job.attempts)
+        ).first()
+        db.commit()
+    if claimed is None:
+        return None
+    return job_id, claimed.type, claimed.payload, claimed.attempts
+
+
+def _clean_up(job_type: JobType, job_id: int, payload: dict) -> None:
+    if job_type.cleanup is None:
+        return
+    try:
+        job_type.cleanup(payload)
+    except Exception:
+        logger.exception("Cleaning up after job %s failed", job_id)
+
+
+def execute(session_factory, job_id: int, name: str, payload: dict, attempt: int) -> bool:
+    """Run one claimed job to completion and record the outcome; True if it succeeded."""
+    job_type = _job_types[name]
+    with session_factory() as db:
+        ctx = JobContext(job_id, payload, db)
+        heartbeat = _Heartbeat(session_factory, ctx, attempt)
+        heartbeat.start()
+        try:
+            try:
+                result = job_type.handler(ctx)
+            finally:
+                heartbeat.stop()
+            # In the handler's transaction: if the job was claimed again meanwhile, its
+            # work goes with the rollback and the other run records the outcome
+            finished = db.execute(
+                update(models.Job).where(_held(job_id, attempt)).values(
+                    status=models.JobStatus.SUCCEEDED, result=result, error=None,
+                    locked_until=None, finished_at=datetime.now(timezone.utc), **ctx.progress_values(),
+                )
+            ).rowcount
+            if not finished:
+                db.rollback()
+                logger.warning("Job %s (%s) was claimed again while it ran; this run is discarded", job_id, name)
+                metrics.increment(f"jobs.{name}.superseded")
+                return False
+            db.commit()
+        except Exception as exc:
+            db.rollback()
+            logger.exception("Job %s (%s) failed", job_id, name)
+            if _fail(db, job_id, attempt, f"{type(exc).__name__}: {exc}"):
+                _clean_up(job_type, job_id, payload)
+            return False
+    metrics.increment(f"jobs.{name}.succeeded")
+    _clean_up(job_type, job_id, payload)
+    return True
+
+
+def _fail(db: Session, job_id: int, attempt: int, error: str) -> bool:
+    """Queue the job's retry, or mark it failed; True if it has failed for good."""
+    db_job = db.get(models.Job, job_id)
+    now = datetime.now(timezone.utc)
+    values = {"error": error, "locked_until": None}
+    retry = attempt < db_job.max_attempts
+    if retry:
+        values.update(status=models.JobStatus.QUEUED, run_after=now + timedelta(seconds=JOB_RETRY_BACKOFF * 2 ** (attempt - 1)))
+    else:
+        values.update(status=models.JobStatus.FAILED, finished_at=now)
+    recorded = db.execute(update(models.Job).where(_held(job_id, attempt)).values(**values)).rowcount
+    db.commit()
+    if not recorded:
+        return False
+    metrics.increment(f"jobs.{db_job.type}.{'retried' if retry else 'failed'}")
+    return not retry
+
+
+class JobRunner:
+    """Claims and runs jobs from a background task, within each type's concurrency limit."""
+
+    def __init__(self, poll_interval: float):
+        self.poll_interval = poll_interval
+        self._running = {}  # job type -> jobs of it in flight here
+        self._tasks = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def _free_types(self) -> list:
+        return [name for name, job_type in _job_types.items() if self._running.get(name, 0) < job_type.concurrency]
+
+    async def start(self, session_factory) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run(session_factory))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        if self._tasks:
+            await asyncio.wait(self._tasks, timeout=JOB_SHUTDOWN_GRACE)
+
+    def wake(self) -> None:
+        """Poll now rather than at the next interval; safe from any thread."""
+        if self.running:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def _run(self, session_factory) -> None:
+        while True:
+            claimed = None
+            types = self._free_types()
+            if types:
+                try:
+                    claimed = await anyio.to_thread.run_sync(claim, session_factory, types)
+                except Exception:
+                    logger.exception("Claiming a job failed")
+            if claimed is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                continue
+            job_id, name, payload, attempt = claimed
+            self._running[name] = self._running.get(name, 0) + 1
+            task = asyncio.create_task(self._execute(session_factory, job_id, name, payload, attempt))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _execute(self, session_factory, job_id: int, name: str, payload: dict, attempt: int) -> None:
+        try:
+            await anyio.to_thread.run_sync(execute, session_factory, job_id, name, payload, attempt)
+        except Exception:
+            logger.exception("Recording the outcome of job %s failed; it runs again once its lease expires", job_id)
+        finally:
+            self._running[name] -= 1
+            # A slot of this type is free again
+            self._wakeup.set()
+
+    def run_pending(self, session_factory) -> int:
+        """Run every claimable job on this thread until none is left; returns how many ran."""
+        ran = 0
+        while True:
+            claimed = claim(session_factory, list(_job_types))
+            if claimed is None:
+                return ran
+            execute(session_factory, *claimed)
+            ran += 1
+
+
+runner = JobRunner(poll_interval=JOB_POLL_INTERVAL)
+
+
+@event.listens_for(Session, "after_commit")
+def _wake_runner(session):
+    if session.info.pop("jobs_enqueued", False):
+        runner.wake()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_enqueued(session):
+    session.info.pop("jobs_enqueued", None)
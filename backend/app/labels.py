@@ -0,0 +1,80 @@
+# app/labels.py
+#
+# Board label palettes. A label's name and color are stored once per board in
+# board_labels; cards carry integer references to them in card_labels. A card that
+# lands on another board has its labels re-pointed at that board's palette, adding
+# whatever the palette lacks, so a board never refers to another board's labels.
+# Palette entries are inserted with Core statements, so the entries each one actually
+# created are reported to the change log here.
+from sqlalchemy import and_, literal, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session, aliased
+from . import models
+from .board_revisions import ChangeEvent, record_board_changes
+
+_COLUMNS = (models.BoardLabel.id, models.BoardLabel.board_id, models.BoardLabel.name, models.BoardLabel.color)
+
+
+def _insert_missing(db: Session):
+    """INSERT for board_labels that skips (board, name, color) rows that already exist.
+
+    It returns the rows it inserted, and only those.
+    """
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    return dialect.insert(models.BoardLabel).on_conflict_do_nothing(
+        index_elements=["board_id", "name", "color"]
+    ).returning(*_COLUMNS)
+
+
+def _record_created(db: Session, rows) -> None:
+    events = [
+        ChangeEvent(row.board_id, "board_label", row.id, "created", data=dict(row._mapping))
+        for row in rows
+    ]
+    if events:
+        record_board_changes(db, set(), events)
+
+
+def ensure_labels(db: Session, pairs) -> dict:
+    """Palette ids for ``{(board_id, name, color)}``, creating missing entries; the caller commits."""
+    pairs = set(pairs)
+    if not pairs:
+        return {}
+    _record_created(db, db.execute(
+        _insert_missing(db), [{"board_id": b, "name": n, "color": c} for b, n, c in pairs]
+    ).all())
+    board_ids = {board_id for board_id, _, _ in pairs}
+    rows = db.execute(select(*_COLUMNS).where(models.BoardLabel.board_id.in_(board_ids)))
+    found = {(row.board_id, row.name, row.color): row.id for row in rows}
+    return {pair: found[pair] for pair in pairs}
+
+
+def ensure_label(db: Session, board_id: int, name: str, color: str) -> int:
+    return ensure_labels(db, [(board_id, name, color)])[(board_id, name, color)]
+
+
+def rehome(db: Session, board_id: int, card_ids) -> None:
+    """Point labels of ``card_ids`` (ids or a SELECT of them) that belong to other boards at ``board_id``'s palette."""
+    used = aliased(models.BoardLabel)
+    _record_created(db, db.execute(_insert_missing(db).from_select(
+        ["board_id", "name", "color"],
+        select(literal(board_id), used.name, used.color)
+        .join(models.CardLabel, models.CardLabel.label_id == used.id)
+        .where(models.CardLabel.card_id.in_(card_ids), used.board_id != board_id)
+        .distinct(),
+    )).all())
+    source, target = aliased(models.BoardLabel), aliased(models.BoardLabel)
+    db.execute(
+        update(models.CardLabel)
+        .where(
+            models.CardLabel.card_id.in_(card_ids),
+            models.CardLabel.label_id.in_(select(models.BoardLabel.id).where(models.BoardLabel.board_id != board_id)),
+        )
+        .values(label_id=(
+            select(target.id)
+            .join(source, and_(source.name == target.name, source.color == target.color))
+            .where(source.id == models.CardLabel.label_id, target.board_id == board_id)
+            .scalar_subquery()
+        ))
+        .execution_options(synchronize_session=False)
+    )
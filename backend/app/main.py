@@ -2,9 +2,17 @@ import os
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request, Depends
 from fastapi.responses import JSONResponse
-from .database import engine
-from . import models
+from .database import engine, SessionLocal
+from . import models, board_revisions
 from .routes import router
+from .compression import CompressionMiddleware
+from .idempotency import IdempotencyMiddleware, RedisStore, configure as configure_idempotency
+from .cache import response_cache
+from .realtime import broker
+from .activity import ACTIVITY_WRITE_MODE, batcher as activity_batcher
+from .trigram import index as trigram_index
+from .jobs import runner as job_runner
+from .archive import BOARD_ARCHIVE_AFTER_DAYS, sweeper as archive_sweeper
 from .exceptions import NotFoundException, ForbiddenException, BadRequestException, CustomException, UnauthorizedException
 import logging
 from fastapi_limiter import FastAPILimiter
@@ -27,15 +35,35 @@ async def lifespan(app: FastAPI):
         r = await redis.from_url(redis_url, encoding="utf-8", decode_responses=True)
         await r.ping()  # Test the connection
         await FastAPILimiter.init(r)
+        await response_cache.start(r)
+        await broker.start(r)
+        configure_idempotency(RedisStore(r))
         app.state.use_redis = True
         logger.info("Connected to Redis successfully")
     except (RedisConnectionError, OSError):
-        logger.warning("Failed to connect to Redis. Rate limiting is disabled.")
+        logger.warning("Failed to connect to Redis. Rate limiting is disabled; the response cache and live board updates are local-only, and idempotency keys are kept in the database.")
         app.state.use_redis = False
     
+    if ACTIVITY_WRITE_MODE == "background":
+        await activity_batcher.start()
+    if trigram_index.enabled:
+        # Streams boards in the background; searches load any board it hasn't reached yet
+        await trigram_index.start(SessionLocal)
+    await job_runner.start(SessionLocal)
+    if BOARD_ARCHIVE_AFTER_DAYS > 0:
+        await archive_sweeper.start(SessionLocal)
+
     yield
-    
+
+    await archive_sweeper.stop()
+    await job_runner.stop()
+
+    # Write out any activity still waiting in the batcher before the process exits
+    await activity_batcher.stop()
+    await trigram_index.stop()
     if app.state.use_redis:
+        await broker.stop()
+        await response_cache.stop()
         await FastAPILimiter.close()
     
 
@@ -71,6 +99,18 @@ async def custom_exception_handler(request: Request, exc: CustomException):
         content={"message": exc.detail},
     )
     
+# Innermost, so stored responses are the uncompressed bodies the routes produced
+app.add_middleware(IdempotencyMiddleware)
+
+# Registered before log_requests so it wraps the router directly and sees whole
+# response bodies rather than the re-streamed output of BaseHTTPMiddleware
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=int(os.getenv("COMPRESSION_MIN_SIZE", "1024")),
+    offload_size=int(os.getenv("COMPRESSION_OFFLOAD_SIZE", str(64 * 1024))),
+    cpu_budget=float(os.getenv("COMPRESSION_CPU_BUDGET", "0.25")),
+)
+
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
     logger.info(f"Request: {request.method} {request.url}")
@@ -0,0 +1,17 @@
+# app/metrics.py
+import threading
+from collections import defaultdict
+
+# Process-local counters, exposed as JSON by GET /metrics
+_counters = defaultdict(int)
+_lock = threading.Lock()
+
+
+def increment(name: str, amount: int = 1) -> None:
+    with _lock:
+        _counters[name] += amount
+
+
+def snapshot() -> dict:
+    with _lock:
+        return dict(sorted(_counters.items()))
@@ -1,5 +1,6 @@
 # app/models.py
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Enum
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Enum, Index, LargeBinary, JSON, Text
+from sqlalchemy.ext.associationproxy import association_proxy
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from .database import Base
@@ -25,24 +26,36 @@ class Board(Base):
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, index=True)
     owner_id = Column(Integer, ForeignKey("users.id"))
+    # Bumped on every change to the board or its lists, cards, labels and members
+    revision = Column(Integer, nullable=False, default=0, server_default="0")
+    # Lowest revision the change log can still replay from; older clients must resync
+    change_log_floor = Column(Integer, nullable=False, default=0, server_default="0")
+    # Set when a large board is deleted; its rows are then purged in batches in the background
+    deleted_at = Column(DateTime(timezone=True), nullable=True, index=True)
+    # Set while the board's rows live in archived_boards; the next read restores them
+    archived_at = Column(DateTime(timezone=True), nullable=True, index=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
     owner = relationship("User", back_populates="boards")
-    lists = relationship("List", back_populates="board", cascade="all, delete-orphan")
-    activities = relationship("Activity", back_populates="board")
+    # Children go with ON DELETE CASCADE in the database; passive_deletes stops the ORM
+    # loading them all just to delete them row by row
+    lists = relationship("List", back_populates="board", cascade="all, delete-orphan", passive_deletes=True)
+    activities = relationship("Activity", back_populates="board", cascade="all, delete-orphan", passive_deletes=True)
+    labels = relationship("BoardLabel", back_populates="board", order_by="BoardLabel.id",
+                          cascade="all, delete-orphan", passive_deletes=True)
 
 class List(Base):
     __tablename__ = "lists"
 
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, index=True)
-    board_id = Column(Integer, ForeignKey("boards.id"))
+    board_id = Column(Integer, ForeignKey("boards.id", ondelete="CASCADE"))
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
     board = relationship("Board", back_populates="lists")
-    cards = relationship("Card", back_populates="list", cascade="all, delete-orphan")
+    cards = relationship("Card", back_populates="list", cascade="all, delete-orphan", passive_deletes=True)
 
 class Card(Base):
     __tablename__ = "cards"
@@ -50,26 +63,43 @@ class Card(Base):
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, index=True)
     description = Column(String)
-    list_id = Column(Integer, ForeignKey("lists.id"))
+    list_id = Column(Integer, ForeignKey("lists.id", ondelete="CASCADE"))
     due_date = Column(DateTime, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
     list = relationship("List", back_populates="cards")
-    labels = relationship("Label", back_populates="card")
-    attachments = relationship("Attachment", back_populates="card")
+    labels = relationship("CardLabel", back_populates="card", cascade="all, delete-orphan", passive_deletes=True)
+    attachments = relationship("Attachment", back_populates="card", cascade="all, delete-orphan", passive_deletes=True)
 
 class ActivityType(str, PyEnum):
+    BOARD_CREATED = "board_created"
+    BOARD_UPDATED = "board_updated"
+    LIST_CREATED = "list_created"
+    LIST_UPDATED = "list_updated"
+    LIST_DELETED = "list_deleted"
     CARD_CREATED = "card_created"
+    CARD_UPDATED = "card_updated"
     CARD_MOVED = "card_moved"
     CARD_ARCHIVED = "card_archived"
-    LIST_CREATED = "list_created"
+    CARD_DELETED = "card_deleted"
+    LABEL_ADDED = "label_added"
+    LABEL_REMOVED = "label_removed"
+    COMMENT_ADDED = "comment_added"
+    ATTACHMENT_ADDED = "attachment_added"
+    MEMBER_ADDED = "member_added"
+    MEMBER_UPDATED = "member_updated"
+    MEMBER_REMOVED = "member_removed"
     
 class Activity(Base):
     __tablename__ = "activities"
+    __table_args__ = (
+        # Latest activity per board: the activity feed and the archive sweeper
+        Index("ix_activities_board_id_created_at", "board_id", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    board_id = Column(Integer, ForeignKey("boards.id"))
+    board_id = Column(Integer, ForeignKey("boards.id", ondelete="CASCADE"))
     user_id = Column(Integer, ForeignKey("users.id"))
     activity_type = Column(String)  
     details = Column(String)
@@ -78,27 +108,77 @@ class Activity(Base):
     board = relationship("Board", back_populates="activities")
     user = relationship("User", back_populates="activities")
 
-class Label(Base):
-    __tablename__ = "labels"
+class BoardLabel(Base):
+    """One entry of a board's label palette; cards refer to it through card_labels."""
+    __tablename__ = "board_labels"
+    __table_args__ = (
+        Index("ix_board_labels_board_id_name_color", "board_id", "name", "color", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    name = Column(String)
-    color = Column(String)
-    card_id = Column(Integer, ForeignKey("cards.id"))
+    board_id = Column(Integer, ForeignKey("boards.id", ondelete="CASCADE"), nullable=False)
+    name = Column(String, nullable=False)
+    color = Column(String, nullable=False)
+
+    board = relationship("Board", back_populates="labels")
+
+class CardLabel(Base):
+    """A palette label applied to a card. Its id is the card label id of the API."""
+    __tablename__ = "card_labels"
+    __table_args__ = (
+        Index("ix_card_labels_card_id_label_id", "card_id", "label_id", unique=True),
+        # Label filters: card ids by label
+        Index("ix_card_labels_label_id_card_id", "label_id", "card_id"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    card_id = Column(Integer, ForeignKey("cards.id", ondelete="CASCADE"), nullable=False)
+    label_id = Column(Integer, ForeignKey("board_labels.id", ondelete="CASCADE"), nullable=False)
 
     card = relationship("Card", back_populates="labels")
+    # Joined, so a list of card labels serializes without a query per label
+    label = relationship("BoardLabel", lazy="joined")
+
+    name = association_proxy("label", "name")
+    color = association_proxy("label", "color")
 
 class Attachment(Base):
     __tablename__ = "attachments"
 
     id = Column(Integer, primary_key=True, index=True)
     filename = Column(String)
+    # Content-addressed under UPLOAD_DIR (see app/storage.py); attachments with the same
+    # content share one file. Unset for files uploaded before content addressing.
     file_path = Column(String)
-    card_id = Column(Integer, ForeignKey("cards.id"))
+    sha256 = Column(String(64), nullable=True, index=True)
+    size = Column(Integer, nullable=True)
+    content_type = Column(String, nullable=True)
+    card_id = Column(Integer, ForeignKey("cards.id", ondelete="CASCADE"))
     uploaded_at = Column(DateTime(timezone=True), server_default=func.now())
 
     card = relationship("Card", back_populates="attachments")
 
+    @property
+    def url(self) -> str:
+        """Where the content is downloaded from with the caller's credentials."""
+        return f"/attachments/{self.id}/content"
+
+class UploadSession(Base):
+    """A resumable upload in progress: bytes so far sit in a part file until ``offset`` reaches ``size``."""
+    __tablename__ = "upload_sessions"
+
+    id = Column(String(32), primary_key=True)
+    card_id = Column(Integer, ForeignKey("cards.id", ondelete="CASCADE"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    filename = Column(String, nullable=False)
+    content_type = Column(String, nullable=True)
+    size = Column(Integer, nullable=False)
+    offset = Column(Integer, nullable=False, default=0)
+    # Held by the PATCH writing to the part file, so two requests never write at once
+    locked_until = Column(DateTime(timezone=True), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
+
 class BoardTemplate(Base):
     __tablename__ = "board_templates"
 
@@ -109,23 +189,48 @@ class BoardTemplate(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     creator = relationship("User", back_populates="templates")
-    lists = relationship("ListTemplate", back_populates="board_template")
+    lists = relationship("ListTemplate", back_populates="board_template", order_by="ListTemplate.id",
+                         cascade="all, delete-orphan", passive_deletes=True)
 
 class ListTemplate(Base):
     __tablename__ = "list_templates"
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String)
-    board_template_id = Column(Integer, ForeignKey("board_templates.id"))
+    board_template_id = Column(Integer, ForeignKey("board_templates.id", ondelete="CASCADE"))
 
     board_template = relationship("BoardTemplate", back_populates="lists")
+    cards = relationship("CardTemplate", back_populates="list_template", order_by="CardTemplate.id",
+                         cascade="all, delete-orphan", passive_deletes=True)
+
+class CardTemplate(Base):
+    __tablename__ = "card_templates"
+
+    id = Column(Integer, primary_key=True, index=True)
+    title = Column(String)
+    description = Column(String)
+    list_template_id = Column(Integer, ForeignKey("list_templates.id", ondelete="CASCADE"), index=True)
+
+    list_template = relationship("ListTemplate", back_populates="cards")
+    labels = relationship("LabelTemplate", back_populates="card_template", order_by="LabelTemplate.id",
+                          cascade="all, delete-orphan", passive_deletes=True)
+
+class LabelTemplate(Base):
+    __tablename__ = "label_templates"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String)
+    color = Column(String)
+    card_template_id = Column(Integer, ForeignKey("card_templates.id", ondelete="CASCADE"), index=True)
+
+    card_template = relationship("CardTemplate", back_populates="labels")
     
 class Comment(Base):
     __tablename__ = "comments"
 
     id = Column(Integer, primary_key=True, index=True)
     content = Column(String)
-    card_id = Column(Integer, ForeignKey("cards.id"))
+    card_id = Column(Integer, ForeignKey("cards.id", ondelete="CASCADE"))
     user_id = Column(Integer, ForeignKey("users.id"))
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
@@ -134,7 +239,7 @@ class Comment(Base):
     user = relationship("User", back_populates="comments")
 
 # Update Card and User models
-Card.comments = relationship("Comment", back_populates="card")
+Card.comments = relationship("Comment", back_populates="card", cascade="all, delete-orphan", passive_deletes=True)
 User.comments = relationship("Comment", back_populates="user")    
 
 class PermissionLevel(str, PyEnum):
@@ -144,9 +249,12 @@ class PermissionLevel(str, PyEnum):
 
 class BoardMember(Base):
     __tablename__ = "board_members"
+    __table_args__ = (
+        Index("ix_board_members_board_id_user_id", "board_id", "user_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    board_id = Column(Integer, ForeignKey("boards.id"))
+    board_id = Column(Integer, ForeignKey("boards.id", ondelete="CASCADE"))
     user_id = Column(Integer, ForeignKey("users.id"))
     permission_level = Column(Enum(PermissionLevel), nullable=False, default=PermissionLevel.VIEW)
 
@@ -155,6 +263,84 @@ class BoardMember(Base):
 
     
 
+class BoardChange(Base):
+    """One row per entity touched by a board revision; the payload is read from the live tables."""
+    __tablename__ = "board_changes"
+    __table_args__ = (
+        Index("ix_board_changes_board_id_revision", "board_id", "revision"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    board_id = Column(Integer, ForeignKey("boards.id", ondelete="CASCADE"), nullable=False)
+    revision = Column(Integer, nullable=False)
+    entity = Column(String(16), nullable=False)
+    entity_id = Column(Integer, nullable=False)
+    op = Column(String(8), nullable=False)
+
+class IdempotencyKey(Base):
+    """Response of the first request made with an Idempotency-Key (status unset while it runs)."""
+    __tablename__ = "idempotency_keys"
+
+    # sha256 of the caller's credentials, the path and the client's key
+    key = Column(String(64), primary_key=True)
+    fingerprint = Column(String(64), nullable=False)
+    status_code = Column(Integer, nullable=True)
+    content_type = Column(String, nullable=True)
+    body = Column(LargeBinary, nullable=True)
+    locked_until = Column(DateTime(timezone=True), nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
+
+class ArchivedBoard(Base):
+    """The lists, cards, labels, comments, attachments and activity of an archived board (see app/archive.py)."""
+    __tablename__ = "archived_boards"
+
+    board_id = Column(Integer, ForeignKey("boards.id", ondelete="CASCADE"), primary_key=True)
+    # zlib-compressed JSON
+    data = Column(LargeBinary, nullable=False)
+    row_count = Column(Integer, nullable=False)
+    raw_bytes = Column(Integer, nullable=False)
+    archived_at = Column(DateTime(timezone=True), nullable=False)
+
+class ArchivedRow(Base):
+    """Which archived board holds a list, card or attachment, so a lookup by its id can restore the board."""
+    __tablename__ = "archived_rows"
+
+    table_name = Column(String(32), primary_key=True)
+    row_id = Column(Integer, primary_key=True)
+    board_id = Column(Integer, ForeignKey("boards.id", ondelete="CASCADE"), nullable=False, index=True)
+
+class JobStatus(str, PyEnum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+class Job(Base):
+    """Background work, claimed by one worker at a time (see app/jobs.py)."""
+    __tablename__ = "jobs"
+    __table_args__ = (
+        Index("ix_jobs_status_run_after", "status", "run_after"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    type = Column(String(64), nullable=False)
+    payload = Column(JSON, nullable=False, default=dict)
+    status = Column(Enum(JobStatus), nullable=False, default=JobStatus.QUEUED)
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=3)
+    progress_done = Column(Integer, nullable=False, default=0)
+    progress_total = Column(Integer, nullable=True)
+    result = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
+    # Not claimed before this (retries back off); a running job whose lease has
+    # passed is taken to have died with its worker and is claimed again
+    run_after = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    locked_until = Column(DateTime(timezone=True), nullable=True)
+    created_by = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
 # Update Board and User models
-Board.members = relationship("BoardMember", back_populates="board")
+Board.members = relationship("BoardMember", back_populates="board", cascade="all, delete-orphan", passive_deletes=True)
+Board.changes = relationship("BoardChange", cascade="all, delete-orphan", passive_deletes=True)
 User.board_memberships = relationship("BoardMember", back_populates="user")
\ No newline at end of file
@@ -0,0 +1,172 @@
+# app/negotiation.py
+import json
+from contextvars import ContextVar
+from typing import Any, Callable, Optional, Type
+import msgpack
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.routing import APIRoute
+from pydantic import BaseModel
+from sqlalchemy.orm import Session
+from .exceptions import BadRequestException
+
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack")
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+# Rows fetched per cursor round trip when streaming
+STREAM_BATCH = 500
+# Streamed output is handed to the server in chunks of about this size
+STREAM_CHUNK_BYTES = 64 * 1024
+
+# Set per request by NegotiatedRoute and read when the response class renders
+_wants_msgpack: ContextVar[bool] = ContextVar("wants_msgpack", default=False)
+
+
+def _media_ranges(accept: str):
+    for part in accept.split(","):
+        media_type, *params = [item.strip() for item in part.split(";")]
+        quality = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        yield media_type.lower(), quality
+
+
+def prefers_msgpack(accept: str) -> bool:
+    """True when the Accept header ranks MessagePack at least as high as JSON."""
+    if not accept:
+        return False
+    msgpack_q, json_q = 0.0, 0.0
+    for media_type, quality in _media_ranges(accept):
+        if media_type in MSGPACK_MEDIA_TYPES:
+            msgpack_q = max(msgpack_q, quality)
+        elif media_type in ("application/json", "application/*", "*/*"):
+            json_q = max(json_q, quality)
+    return msgpack_q > 0 and msgpack_q >= json_q
+
+
+def prefers_ndjson(accept: str) -> bool:
+    """True when the Accept header names NDJSON and ranks it at least as high as JSON."""
+    if not accept:
+        return False
+    ndjson_q, json_q = 0.0, 0.0
+    for media_type, quality in _media_ranges(accept):
+        if media_type == NDJSON_MEDIA_TYPE:
+            ndjson_q = max(ndjson_q, quality)
+        elif media_type in ("application/json", "application/*", "*/*"):
+            json_q = max(json_q, quality)
+    return ndjson_q > 0 and ndjson_q >= json_q
+
+
+def is_msgpack(content_type: str) -> bool:
+    return content_type.split(";")[0].strip().lower() in MSGPACK_MEDIA_TYPES
+
+
+def _default(value: Any):
+    # Content has normally been through FastAPI's JSON-mode serialization already;
+    # this only covers values handed over directly, such as datetimes.
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def packb(content: Any) -> bytes:
+    return msgpack.packb(content, default=_default, use_bin_type=True)
+
+
+class MsgPackResponse(Response):
+    media_type = "application/msgpack"
+
+    def render(self, content: Any) -> bytes:
+        return packb(content)
+
+
+class NegotiatedResponse(JSONResponse):
+    """JSON by default, MessagePack when the request's Accept header asks for it."""
+
+    def __init__(self, content: Any = None, *args, **kwargs):
+        if _wants_msgpack.get():
+            self.media_type = MsgPackResponse.media_type
+        super().__init__(content, *args, **kwargs)
+        self.headers.setdefault("Vary", "Accept")
+
+    def render(self, content: Any) -> bytes:
+        if self.media_type == MsgPackResponse.media_type:
+            return packb(content)
+        return super().render(content)
+
+
+def chunked(pieces, size: int = STREAM_CHUNK_BYTES):
+    """Regroup a stream of small byte strings into chunks of about ``size`` bytes."""
+    buffer = bytearray()
+    for piece in pieces:
+        buffer += piece
+        if len(buffer) >= size:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+
+def _ndjson_lines(bind, statement, schema: Optional[Type[BaseModel]]):
+    # A session of its own: the request's session is closed before the body is sent
+    with Session(bind=bind) as db:
+        result = db.execute(statement.execution_options(yield_per=STREAM_BATCH))
+        try:
+            for row in result:
+                item = schema.model_validate(row[0]).model_dump(mode="json") if schema else row._asdict()
+                yield json.dumps(item, default=_default, ensure_ascii=False, separators=(",", ":")).encode() + b"\n"
+        finally:
+            result.close()
+
+
+def ndjson_response(bind, statement, schema: Optional[Type[BaseModel]] = None,
+                    headers: Optional[dict] = None) -> StreamingResponse:
+    """Stream ``statement`` off a server-side cursor, one JSON object per line.
+
+    Entity rows are rendered through ``schema``; without one, rows are plain columns.
+    Nothing is held beyond the current cursor batch and output chunk.
+    """
+    response = StreamingResponse(chunked(_ndjson_lines(bind, statement, schema)),
+                                 media_type=NDJSON_MEDIA_TYPE, headers=headers)
+    response.headers["Vary"] = "Accept"
+    return response
+
+
+class NegotiatedRoute(APIRoute):
+    """Route class that records the Accept preference and decodes MessagePack request bodies.
+
+    MessagePack bodies are decoded up front and handed to FastAPI as if they were JSON,
+    so the usual body validation applies unchanged.
+    """
+
+    def get_route_handler(self) -> Callable:
+        original_route_handler = super().get_route_handler()
+
+        async def negotiated_route_handler(request: Request) -> Response:
+            _wants_msgpack.set(prefers_msgpack(request.headers.get("accept", "")))
+            if is_msgpack(request.headers.get("content-type", "")):
+                request = await _decode_msgpack_request(request)
+            return await original_route_handler(request)
+
+        return negotiated_route_handler
+
+
+async def _decode_msgpack_request(request: Request) -> Request:
+    body = await request.body()
+    try:
+        data = msgpack.unpackb(body, raw=False) if body else None
+    except (ValueError, msgpack.UnpackException) as exc:
+        raise BadRequestException(detail=f"Invalid MessagePack body: {exc}")
+
+    headers = [
+        (name, value) for name, value in request.scope["headers"] if name != b"content-type"
+    ]
+    headers.append((b"content-type", b"application/json"))
+    decoded = Request({**request.scope, "headers": headers}, request.receive)
+    decoded._body = body
+    if data is not None:
+        decoded._json = data
+    return decoded
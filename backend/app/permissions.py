@@ -0,0 +1,85 @@
+# app/permissions.py
+from typing import Optional
+from sqlalchemy import and_, or_, select
+from sqlalchemy.orm import Session
+from . import archive, models
+from .exceptions import NotFoundException, ForbiddenException
+
+
+def get_readable_board(db: Session, board_id: int, user: models.User) -> models.Board:
+    """Load a board the user owns or is a member of, in a single indexed lookup.
+
+    An archived board is rehydrated here, so everything read after this finds its rows.
+    """
+    row = db.query(models.Board, models.BoardMember.id).outerjoin(
+        models.BoardMember,
+        and_(
+            models.BoardMember.board_id == models.Board.id,
+            models.BoardMember.user_id == user.id
+        )
+    ).filter(models.Board.id == board_id, models.Board.deleted_at.is_(None)).first()
+    if row is None:
+        raise NotFoundException(detail="Board not found")
+
+    board, member_id = row
+    if board.owner_id != user.id and member_id is None:
+        raise ForbiddenException(detail="Not authorized to access this board")
+    return archive.ensure_live(db, board)
+
+
+def readable_boards(user: models.User):
+    """SELECT of the boards ``user`` owns or is a member of, to filter or embed in other queries."""
+    return select(models.Board).where(models.Board.deleted_at.is_(None), or_(
+        models.Board.owner_id == user.id,
+        models.Board.id.in_(select(models.BoardMember.board_id).where(models.BoardMember.user_id == user.id)),
+    ))
+
+
+def ensure_readable_live(db: Session, user: models.User, board_id: Optional[int] = None) -> None:
+    """Rehydrate the archived boards ``user`` can read (or just ``board_id``), so searches see their rows."""
+    boards = readable_boards(user).with_only_columns(models.Board.id)
+    if board_id is not None:
+        boards = boards.where(models.Board.id == board_id)
+    archive.ensure_boards_live(db, boards)
+
+
+def _writable(query, user: models.User):
+    """Restrict ``query`` (already joined to Board) to boards the user may edit."""
+    return query.outerjoin(
+        models.BoardMember,
+        and_(
+            models.BoardMember.board_id == models.Board.id,
+            models.BoardMember.user_id == user.id
+        )
+    ).filter(models.Board.deleted_at.is_(None), or_(
+        models.Board.owner_id == user.id,
+        models.BoardMember.permission_level.in_([models.PermissionLevel.EDIT, models.PermissionLevel.ADMIN])
+    ))
+
+
+def get_writable_lists(db: Session, list_ids, user: models.User) -> dict:
+    """Check edit access to every list in one query; returns ``{list_id: board_id}``."""
+    list_ids = set(list_ids)
+    archive.ensure_rows_live(db, models.List, list_ids)
+    rows = _writable(
+        db.query(models.List.id, models.List.board_id).join(models.Board),
+        user
+    ).filter(models.List.id.in_(list_ids)).all()
+    found = {row.id: row.board_id for row in rows}
+    if len(found) != len(list_ids):
+        raise NotFoundException(detail="List not found or access denied")
+    return found
+
+
+def get_writable_cards(db: Session, card_ids, user: models.User) -> dict:
+    """Check edit access to every card in one query; returns ``{card_id: (list_id, board_id)}``."""
+    card_ids = set(card_ids)
+    archive.ensure_rows_live(db, models.Card, card_ids)
+    rows = _writable(
+        db.query(models.Card.id, models.Card.list_id, models.List.board_id).join(models.List).join(models.Board),
+        user
+    ).filter(models.Card.id.in_(card_ids)).all()
+    found = {row.id: (row.list_id, row.board_id) for row in rows}
+    if len(found) != len(card_ids):
+        raise NotFoundException(detail="Card not found or access denied")
+    return found
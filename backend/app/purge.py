@@ -0,0 +1,73 @@
+# app/purge.py
+#
+# Deleting a board is a single DELETE: its lists, cards, labels, comments, attachments,
+# members, activity and change log follow through ON DELETE CASCADE. Boards with more
+# than BOARD_PURGE_THRESHOLD cards are soft-deleted instead (deleted_at is set and every
+# read treats them as gone) and purged afterwards in transactions of PURGE_BATCH_SIZE
+# rows by a "board.purge" job, so no single statement holds locks on the whole board.
+import os
+from datetime import datetime, timezone
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.orm import Session
+from . import jobs, metrics, models
+from .board_revisions import ChangeEvent, record_board_changes
+
+BOARD_PURGE_THRESHOLD = int(os.getenv("BOARD_PURGE_THRESHOLD", "5000"))
+PURGE_BATCH_SIZE = int(os.getenv("PURGE_BATCH_SIZE", "1000"))
+
+
+def _board_cards(board_id: int):
+    return select(models.Card.id).join(models.List).where(models.List.board_id == board_id)
+
+
+def needs_purge(db: Session, board_id: int) -> bool:
+    return db.scalar(select(func.count()).select_from(_board_cards(board_id).subquery())) > BOARD_PURGE_THRESHOLD
+
+
+def soft_delete(db: Session, board_id: int, user_id: int) -> models.Job:
+    """Hide the board at once, tell its readers it is gone and queue its purge; the caller commits."""
+    db.execute(
+        update(models.Board).where(models.Board.id == board_id)
+        .values(deleted_at=datetime.now(timezone.utc))
+        .execution_options(synchronize_session=False)
+    )
+    record_board_changes(db, {board_id}, [ChangeEvent(board_id, "board", board_id, "deleted")])
+    return jobs.enqueue(db, "board.purge", {"board_id": board_id}, user_id)
+
+
+def _delete_in_batches(ctx: jobs.JobContext, model, ids_query, done: int) -> int:
+    while True:
+        ids = ctx.db.scalars(ids_query.limit(PURGE_BATCH_SIZE)).all()
+        if not ids:
+            return done
+        ctx.db.execute(delete(model).where(model.id.in_(ids)).execution_options(synchronize_session=False))
+        ctx.db.commit()
+        done += len(ids)
+        ctx.progress(done)
+
+
+@jobs.job("board.purge")
+def purge_board(ctx: jobs.JobContext) -> dict:
+    """Delete a soft-deleted board's rows in bounded transactions, then the board itself.
+
+    Every batch commits, so a retry picks up where a failed attempt stopped.
+    """
+    board_id = ctx.payload["board_id"]
+    children = [
+        # Cards take their labels, comments and attachments with them
+        (models.Card, _board_cards(board_id)),
+        (models.Activity, select(models.Activity.id).where(models.Activity.board_id == board_id)),
+        (models.BoardChange, select(models.BoardChange.id).where(models.BoardChange.board_id == board_id)),
+    ]
+    total = sum(ctx.db.scalar(select(func.count()).select_from(query.subquery())) for _, query in children)
+    ctx.progress(0, total)
+    rows = 0
+    for model, query in children:
+        rows = _delete_in_batches(ctx, model, query, rows)
+    ctx.db.execute(
+        delete(models.Board).where(models.Board.id == board_id, models.Board.deleted_at.is_not(None))
+        .execution_options(synchronize_session=False)
+    )
+    metrics.increment("purge.boards")
+    metrics.increment("purge.rows", rows)
+    return {"rows": rows}
@@ -0,0 +1,190 @@
+# app/realtime.py
+import asyncio
+import json
+import logging
+import os
+import threading
+from collections import deque
+from typing import Optional
+from fastapi.encoders import jsonable_encoder
+from redis.exceptions import RedisError
+from . import metrics
+from .board_revisions import ChangeEvent, on_changes_committed
+
+logger = logging.getLogger(__name__)
+
+EVENTS_CHANNEL = "board-events"
+
+
+def coalesce(events: list) -> list:
+    """Collapse a burst of events so each entity appears once, with its latest state.
+
+    A create followed by updates stays a create; a create followed by a delete cancels out.
+    """
+    merged = {}
+    for event in events:
+        key = (event["board_id"], event["entity"], event["id"])
+        previous = merged.pop(key, None)
+        if previous is not None and previous["op"] == "created":
+            if event["op"] == "deleted":
+                continue
+            event = {**event, "op": "created"}
+        merged[key] = event
+    return list(merged.values())
+
+
+class Subscription:
+    """One connected client. Events are buffered in a bounded deque on the client's loop.
+
+    A consumer that falls ``max_pending`` events behind has its backlog dropped and is
+    told to resync (refetch the board) instead of holding an unbounded queue.
+    """
+
+    def __init__(self, board_id: int, max_pending: int, coalesce_window: float):
+        self.board_id = board_id
+        self.max_pending = max_pending
+        self.coalesce_window = coalesce_window
+        self.loop = asyncio.get_running_loop()
+        self._pending = deque()
+        self._resync = False
+        self._ready = asyncio.Event()
+
+    def offer(self, events: list) -> None:
+        # Always called on self.loop
+        self._pending.extend(events)
+        if len(self._pending) > self.max_pending:
+            self._pending.clear()
+            self._resync = True
+            metrics.increment("realtime.resyncs")
+        self._ready.set()
+
+    async def next_message(self, timeout: Optional[float] = None) -> Optional[dict]:
+        """Wait for the next batch of events; None means ``timeout`` passed without any."""
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        # Let a burst of changes accumulate and go out as one message
+        await asyncio.sleep(self.coalesce_window)
+        self._ready.clear()
+        if self._resync:
+            self._resync = False
+            self._pending.clear()
+            return {"type": "resync", "board_id": self.board_id}
+        events = list(self._pending)
+        self._pending.clear()
+        return {"type": "changes", "board_id": self.board_id, "events": coalesce(events)}
+
+
+class Broker:
+    """In-process fan-out of committed board changes to subscribed clients.
+
+    With Redis available (``start``), commits are published to a Redis channel and every
+    worker, this one included, delivers what it receives to its own subscribers. Without
+    Redis, commits are delivered to local subscribers directly.
+    """
+
+    def __init__(self, max_pending: int, coalesce_window: float):
+        self.max_pending = max_pending
+        self.coalesce_window = coalesce_window
+        self.redis = None
+        self._subscriptions = {}
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._listener: Optional[asyncio.Task] = None
+
+    async def start(self, redis_client) -> None:
+        self.redis = redis_client
+        self._loop = asyncio.get_running_loop()
+        self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+        self._listener = None
+        self.redis = None
+
+    def subscribe(self, board_id: int) -> Subscription:
+        subscription = Subscription(board_id, self.max_pending, self.coalesce_window)
+        with self._lock:
+            self._subscriptions.setdefault(board_id, set()).add(subscription)
+        metrics.increment("realtime.subscriptions")
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.board_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.board_id]
+
+    def deliver(self, events: list) -> None:
+        """Hand serialized events to local subscribers; safe to call from any thread."""
+        by_board = {}
+        for event in events:
+            by_board.setdefault(event["board_id"], []).append(event)
+        with self._lock:
+            targets = [
+                (subscription, by_board[board_id])
+                for board_id in by_board
+                for subscription in self._subscriptions.get(board_id, ())
+            ]
+        for subscription, board_events in targets:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.offer, board_events)
+            except RuntimeError:
+                # The client's loop has shut down; it will be unsubscribed on its way out
+                self.unsubscribe(subscription)
+
+    def publish(self, events: list) -> None:
+        """Post-commit hook: fan ChangeEvents out locally or through the Redis backplane."""
+        payload = [
+            jsonable_encoder({
+                "board_id": event.board_id,
+                "entity": event.entity,
+                "id": event.entity_id,
+                "op": event.op,
+                "revision": event.revision,
+                "data": event.data,
+            })
+            for event in events
+            if isinstance(event, ChangeEvent)
+        ]
+        if not payload:
+            return
+        if self.redis is None or self._loop is None:
+            self.deliver(payload)
+            return
+        asyncio.run_coroutine_threadsafe(self._publish_remote(payload), self._loop)
+
+    async def _publish_remote(self, payload: list) -> None:
+        try:
+            await self.redis.publish(EVENTS_CHANNEL, json.dumps(payload, separators=(",", ":")))
+        except RedisError:
+            logger.warning("Redis event publish failed; delivering to local subscribers only")
+            self.deliver(payload)
+
+    async def _listen(self) -> None:
+        pubsub = self.redis.pubsub()
+        try:
+            await pubsub.subscribe(EVENTS_CHANNEL)
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    self.deliver(json.loads(message["data"]))
+        except RedisError:
+            logger.warning("Lost the board event subscription; falling back to local delivery")
+            self.redis = None
+        finally:
+            await pubsub.reset()
+
+
+broker = Broker(
+    max_pending=int(os.getenv("REALTIME_MAX_PENDING", "500")),
+    coalesce_window=float(os.getenv("REALTIME_COALESCE_SECONDS", "0.05")),
+)
+on_changes_committed(broker.publish)
@@ -1,21 +1,45 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query, UploadFile, File
+from fastapi import APIRouter, Depends, Header, HTTPException, status, Query, UploadFile, File, Request, Response, WebSocket
+from fastapi.responses import StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import UploadFile as StarletteUploadFile
 from sqlalchemy.orm import Session
-import shutil
-import os
-from . import models, schemas, auth
+import asyncio
+import json
+from . import models, schemas, auth, activity, archive, bulk, changes, cloning, conditional, downloads, export, fieldsets, fulltext, jobs, labels, metrics, purge, storage, trello, uploads
+from .board_revisions import ChangeEvent, record_board_changes
+from .suggest import suggester
+from .trigram import index as trigram_index
+from . import batch as batching
 from .database import get_db
+from .permissions import ensure_readable_live, get_readable_board
+from .negotiation import NegotiatedRoute, NegotiatedResponse, ndjson_response, prefers_ndjson
+from .cache import cached_board_read
+from .realtime import broker
+from fastapi.encoders import jsonable_encoder
 from datetime import datetime, timedelta
 from typing import List, Optional
-from sqlalchemy import func, desc, or_, asc, and_
+from sqlalchemy import func, desc, or_, asc, and_, select
 from .exceptions import NotFoundException, ForbiddenException, BadRequestException
 from .models import PermissionLevel
 import logging
 
 logger = logging.getLogger(__name__)
-UPLOAD_DIR = "uploads"
-# Create an APIRouter instance
-router = APIRouter()
+SSE_KEEPALIVE_SECONDS = 15
+# Create an APIRouter instance. Collection endpoints that declare
+# response_class=NegotiatedResponse can answer in MessagePack as well as JSON.
+router = APIRouter(route_class=NegotiatedRoute)
+
+# ?fields= dependencies for sparse responses
+board_fields = fieldsets.sparse_fields(schemas.Board)
+list_fields = fieldsets.sparse_fields(schemas.List)
+card_fields = fieldsets.sparse_fields(schemas.Card)
+search_fields = fieldsets.sparse_fields(schemas.SearchResult)
+
+def accepted(response: Response, db_job: models.Job) -> None:
+    # 202 with the job to poll for the rest of the work
+    response.status_code = status.HTTP_202_ACCEPTED
+    response.headers["Location"] = f"/jobs/{db_job.id}"
 
 # Board routes
 
@@ -24,39 +48,63 @@ router = APIRouter()
 def create_board(board: schemas.BoardCreate, current_user: models.User = Depends(auth.get_current_user), db: Session = Depends(get_db)):
     db_board = models.Board(**board.model_dump(), owner_id=current_user.id)
     db.add(db_board)
+    db.flush()
+    activity.record(db, db_board.id, current_user.id, models.ActivityType.BOARD_CREATED, f"Board '{db_board.title}' created")
     db.commit()
     db.refresh(db_board)
     return db_board
 
+# Import a Trello JSON export as a new board; answers 202 with the job doing the import
+@router.post("/boards/import/trello", response_model=schemas.Job, status_code=status.HTTP_202_ACCEPTED)
+async def import_trello_board(
+    response: Response,
+    file: UploadFile = File(...),
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    path = await trello.stage(file)
+    db_job = jobs.enqueue(db, "trello.import", {"path": path, "user_id": current_user.id}, current_user.id)
+    db.commit()
+    db.refresh(db_job)
+    accepted(response, db_job)
+    return db_job
+
 # Get all boards with pagination
 @router.get("/boards/", response_model=list[schemas.Board])
 def read_boards(
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(20, ge=1, le=100),
+    fields: Optional[List[str]] = Depends(board_fields),
     db: Session = Depends(get_db)
 ):
-    boards = db.query(models.Board).offset(skip).limit(limit).all()
+    query = db.query(models.Board).filter(models.Board.deleted_at.is_(None)).offset(skip).limit(limit)
+    if fields:
+        return fieldsets.project_rows(query.with_entities(*fieldsets.columns(models.Board, fields)), response)
+    boards = query.all()
     return boards
 
 # Get a specific board by ID
 
 @router.get("/boards/{board_id}", response_model=schemas.Board)
-def read_board(board_id: int, current_user: models.User = Depends(auth.get_current_user), db: Session = Depends(get_db)):
-    board = db.query(models.Board).filter(models.Board.id == board_id).first()
-    if board is None:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Board not found")
-    
-    print(f"Board owner_id: {board.owner_id}, Current user id: {current_user.id}")  # Debug print
-    
-    if board.owner_id != current_user.id:
-        member = db.query(models.BoardMember).filter(
-            models.BoardMember.board_id == board_id,
-            models.BoardMember.user_id == current_user.id
-        ).first()
-        if not member:
-            print(f"User {current_user.id} not authorized to access board {board_id}")  # Debug print
-            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized to access this board")
-    
+def read_board(
+    board_id: int,
+    request: Request,
+    response: Response,
+    fields: Optional[List[str]] = Depends(board_fields),
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    board = get_readable_board(db, board_id, current_user)
+
+    validators = conditional.board_validators(request, board)
+    if conditional.is_not_modified(request, validators):
+        return conditional.not_modified_response(validators)
+    conditional.apply_validators(response, validators)
+
+    if fields:
+        # The board row is already loaded for the access check, so only the payload shrinks
+        return fieldsets.sparse_response({name: getattr(board, name) for name in fields}, response)
     return board
 
 # Update a board
@@ -69,7 +117,7 @@ def update_board(
 ):
     logger.info(f"Updating board {board_id} for user {current_user.username} (id: {current_user.id})")
     
-    db_board = db.query(models.Board).filter(models.Board.id == board_id).first()
+    db_board = db.query(models.Board).filter(models.Board.id == board_id, models.Board.deleted_at.is_(None)).first()
     if db_board is None:
         raise HTTPException(status_code=404, detail="Board not found")
     
@@ -92,162 +140,254 @@ def update_board(
     for var, value in vars(board).items():
         setattr(db_board, var, value) if value else None
     db.add(db_board)
+    activity.record(db, board_id, current_user.id, models.ActivityType.BOARD_UPDATED, f"Board '{db_board.title}' updated")
     db.commit()
     db.refresh(db_board)
     logger.info(f"Board {board_id} updated successfully")
     return db_board
 
 @router.get("/boards/{board_id}/members", response_model=List[schemas.BoardMember])
-def get_board_members(
+async def get_board_members(
     board_id: int,
+    request: Request,
     current_user: models.User = Depends(auth.get_current_user),
     db: Session = Depends(get_db)
 ):
-    board = db.query(models.Board).filter(models.Board.id == board_id).first()
-    if not board:
-        raise HTTPException(status_code=404, detail="Board not found")
-        
-    if board.owner_id != current_user.id:
-        member = db.query(models.BoardMember).filter(
-            models.BoardMember.board_id == board_id,
-            models.BoardMember.user_id == current_user.id
-        ).first()
-        if not member:
-            raise ForbiddenException(detail="Not authorized to view this board's members")
-            
-    members = db.query(models.BoardMember).filter(models.BoardMember.board_id == board_id).all()
-    return members
+    board = await run_in_threadpool(get_readable_board, db, board_id, current_user)
+
+    def load_members(session):
+        members = session.query(models.BoardMember).filter(models.BoardMember.board_id == board_id).all()
+        return [schemas.BoardMember.model_validate(member).model_dump(mode="json") for member in members]
+
+    return await cached_board_read(request, db, board, load_members)
 
 # Delete a board
 @router.delete("/boards/{board_id}", response_model=schemas.Board)
 def delete_board(
     board_id: int, 
+    response: Response,
     current_user: models.User = Depends(auth.get_current_user),
     db: Session = Depends(get_db)
 ):
-    db_board = db.query(models.Board).filter(models.Board.id == board_id).first()
+    db_board = db.query(models.Board).filter(models.Board.id == board_id, models.Board.deleted_at.is_(None)).first()
     if db_board is None:
         raise HTTPException(status_code=404, detail="Board not found")
     
     if db_board.owner_id != current_user.id:
         raise ForbiddenException(detail="Not authorized to delete this board")
     
+    if purge.needs_purge(db, board_id):
+        # Too big for one transaction: hide it now, a job deletes it in batches
+        db_job = purge.soft_delete(db, board_id, current_user.id)
+        db.commit()
+        accepted(response, db_job)
+        return db_board
+
+    # Everything under the board goes with it through ON DELETE CASCADE
     db.delete(db_board)
     db.commit()
     return db_board
 
 # Get all lists for a specific board
-@router.get("/boards/{board_id}/lists", response_model=list[schemas.List])
-def read_lists_for_board(
+@router.get("/boards/{board_id}/lists", response_model=list[schemas.List], response_class=NegotiatedResponse)
+async def read_lists_for_board(
     board_id: int, 
+    request: Request,
+    response: Response,
+    fields: Optional[List[str]] = Depends(list_fields),
     current_user: models.User = Depends(auth.get_current_user),
     db: Session = Depends(get_db)
 ):
-    board = db.query(models.Board).filter(models.Board.id == board_id).first()
-    if board is None:
-        raise HTTPException(status_code=404, detail="Board not found")
-    
-    if board.owner_id != current_user.id:
-        member = db.query(models.BoardMember).filter(
-            models.BoardMember.board_id == board_id,
-            models.BoardMember.user_id == current_user.id
-        ).first()
-        if not member:
-            raise ForbiddenException(detail="Not authorized to access this board")
+    board = await run_in_threadpool(get_readable_board, db, board_id, current_user)
+
+    # An unchanged board is answered from its revision alone, without loading any lists
+    validators = conditional.board_validators(request, board)
+    if conditional.is_not_modified(request, validators):
+        return conditional.not_modified_response(validators)
+    conditional.apply_validators(response, validators)
     
-    lists = db.query(models.List).filter(models.List.board_id == board_id).all()
-    return lists
+    def load_lists(session):
+        query = session.query(models.List).filter(models.List.board_id == board_id)
+        if fields:
+            return jsonable_encoder([
+                row._asdict() for row in query.with_entities(*fieldsets.columns(models.List, fields))
+            ])
+        return [schemas.List.model_validate(db_list).model_dump(mode="json") for db_list in query.all()]
+
+    lists = await cached_board_read(request, db, board, load_lists)
+    return NegotiatedResponse(content=lists, headers=dict(response.headers))
 
 # Get board activity
-@router.get("/boards/{board_id}/activity", response_model=List[schemas.Activity])
+@router.get("/boards/{board_id}/activity", response_model=List[schemas.Activity], response_class=NegotiatedResponse)
 async def get_board_activity(
     board_id: int,
+    request: Request,
     current_user: models.User = Depends(auth.get_current_user),
     db: Session = Depends(get_db)
 ):
-    board = db.query(models.Board).filter(models.Board.id == board_id).first()
-    if not board:
-        raise HTTPException(status_code=404, detail="Board not found")
-    
-    if board.owner_id != current_user.id:
-        member = db.query(models.BoardMember).filter(
-            models.BoardMember.board_id == board_id,
-            models.BoardMember.user_id == current_user.id
-        ).first()
-        if not member:
-            raise ForbiddenException(detail="Not authorized to access this board")
-    
-    activities = db.query(models.Activity).filter(models.Activity.board_id == board_id).order_by(models.Activity.created_at.desc()).limit(50).all()
+    await run_in_threadpool(get_readable_board, db, board_id, current_user)
+    query = db.query(models.Activity).filter(models.Activity.board_id == board_id).order_by(models.Activity.created_at.desc(), models.Activity.id.desc()).limit(50)
+    # Accept: application/x-ndjson streams one activity per line as rows come off the cursor
+    if prefers_ndjson(request.headers.get("accept", "")):
+        return ndjson_response(db.get_bind(), query.statement, schemas.Activity)
+    activities = query.all()
     return activities
 
 # Get board statistics
 @router.get("/boards/{board_id}/statistics", response_model=schemas.BoardStatistics)
 async def get_board_statistics(
     board_id: int,
+    request: Request,
     current_user: models.User = Depends(auth.get_current_user),
     db: Session = Depends(get_db)
 ):
-    board = db.query(models.Board).filter(models.Board.id == board_id).first()
-    if not board:
-        raise HTTPException(status_code=404, detail="Board not found")
-    
-    if board.owner_id != current_user.id:
-        member = db.query(models.BoardMember).filter(
-            models.BoardMember.board_id == board_id,
-            models.BoardMember.user_id == current_user.id
-        ).first()
-        if not member:
-            raise ForbiddenException(detail="Not authorized to access this board")
-    
-    list_stats = db.query(
-        models.List.title,
-        func.count(models.Card.id).label('card_count')
-    ).outerjoin(models.Card).filter(models.List.board_id == board_id).group_by(models.List.id).all()
-    
-    total_cards = sum(stat.card_count for stat in list_stats)
-    
-    return schemas.BoardStatistics(
-        total_lists=len(list_stats),
-        total_cards=total_cards,
-        lists_statistics=[schemas.ListStatistics(name=stat.title, card_count=stat.card_count) for stat in list_stats]
-    )
-@router.get("/boards/{board_id}/cards", response_model=List[schemas.Card])
+    board = await run_in_threadpool(get_readable_board, db, board_id, current_user)
+
+    # Served from the response cache; on a miss, identical concurrent requests share
+    # one query, run off the event loop on its own session
+    def load_statistics(session):
+        list_stats = session.query(
+            models.List.title,
+            func.count(models.Card.id).label('card_count')
+        ).outerjoin(models.Card).filter(models.List.board_id == board_id).group_by(models.List.id).all()
+
+        total_cards = sum(stat.card_count for stat in list_stats)
+
+        return schemas.BoardStatistics(
+            total_lists=len(list_stats),
+            total_cards=total_cards,
+            lists_statistics=[schemas.ListStatistics(name=stat.title, card_count=stat.card_count) for stat in list_stats]
+        ).model_dump(mode="json")
+
+    return await cached_board_read(request, db, board, load_statistics)
+# Get all cards for a specific board
+@router.get("/boards/{board_id}/cards", response_model=List[schemas.Card], response_class=NegotiatedResponse)
 async def get_board_cards(
     board_id: int,
+    request: Request,
+    response: Response,
+    fields: Optional[List[str]] = Depends(card_fields),
     current_user: models.User = Depends(auth.get_current_user),
     db: Session = Depends(get_db)
 ):
-    board = db.query(models.Board).filter(models.Board.id == board_id).first()
-    if not board:
-        raise NotFoundException(detail="Board not found")
-    
-    if board.owner_id != current_user.id:
-        member = db.query(models.BoardMember).filter(
-            models.BoardMember.board_id == board_id,
-            models.BoardMember.user_id == current_user.id
-        ).first()
-        if not member:
-            raise ForbiddenException(detail="Not authorized to access this board")
-    
-    cards = db.query(models.Card).join(models.List).filter(models.List.board_id == board_id).all()
-    return cards
+    board = await run_in_threadpool(get_readable_board, db, board_id, current_user)
+
+    validators = conditional.board_validators(request, board)
+    if conditional.is_not_modified(request, validators):
+        return conditional.not_modified_response(validators)
+    conditional.apply_validators(response, validators)
+
+    # Streamed row by row instead, bypassing the cache, for Accept: application/x-ndjson
+    if prefers_ndjson(request.headers.get("accept", "")):
+        query = db.query(models.Card).join(models.List).filter(models.List.board_id == board_id).order_by(models.Card.id)
+        if fields:
+            return ndjson_response(db.get_bind(), query.with_entities(*fieldsets.columns(models.Card, fields)).statement,
+                                   headers=dict(response.headers))
+        return ndjson_response(db.get_bind(), query.statement, schemas.Card, headers=dict(response.headers))
+
+    # Cached per board revision; on a miss, identical concurrent requests share one
+    # query and one JSON-mode serialization
+    def load_cards(session):
+        query = session.query(models.Card).join(models.List).filter(models.List.board_id == board_id)
+        if fields:
+            return jsonable_encoder([
+                row._asdict() for row in query.with_entities(*fieldsets.columns(models.Card, fields))
+            ])
+        return [schemas.Card.model_validate(card).model_dump(mode="json") for card in query.all()]
+
+    cards = await cached_board_read(request, db, board, load_cards)
+    return NegotiatedResponse(content=cards, headers=dict(response.headers))
+
+# The board's label palette; card labels refer to these entries by id
+@router.get("/boards/{board_id}/labels", response_model=List[schemas.BoardLabel], response_class=NegotiatedResponse)
+def get_board_labels(
+    board_id: int,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    return get_readable_board(db, board_id, current_user).labels
 
-# Get all cards for a specific board
-@router.get("/boards/{board_id}", response_model=schemas.Board)
-def read_board(board_id: int, current_user: models.User = Depends(auth.get_current_user), db: Session = Depends(get_db)):
-    board = db.query(models.Board).filter(models.Board.id == board_id).first()
-    if board is None:
-        raise NotFoundException(detail="Board not found")
-    
-    if board.owner_id != current_user.id:
-        member = db.query(models.BoardMember).filter(
-            models.BoardMember.board_id == board_id,
-            models.BoardMember.user_id == current_user.id
-        ).first()
-        if not member:
-            raise ForbiddenException(detail="Not authorized to access this board")
-    
-    return board
+# Everything on the board, attachments included, streamed as NDJSON or a gzipped tarball
+@router.get("/boards/{board_id}/export")
+def export_board(
+    board_id: int,
+    format: str = Query("ndjson", pattern="^(ndjson|tar\\.gz)$"),
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    board = get_readable_board(db, board_id, current_user)
+    return export.board_export(db.get_bind(), board.id, format)
+
+# Delta sync: what changed on the board after revision `since`
+@router.get("/boards/{board_id}/changes", response_model=schemas.BoardChanges, response_class=NegotiatedResponse)
+def get_board_changes(
+    board_id: int,
+    since: int = Query(..., ge=0),
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    board = get_readable_board(db, board_id, current_user)
+    return changes.changes_since(db, board, since)
+
+# Live board updates. Both endpoints push {"type": "changes", "events": [...]} for each
+# burst of committed changes, or {"type": "resync"} when the client fell too far behind
+# and should refetch the board.
+@router.websocket("/boards/{board_id}/ws")
+async def board_updates_ws(websocket: WebSocket, board_id: int, token: str = Query(...), db: Session = Depends(get_db)):
+    # Browsers cannot set headers on a WebSocket handshake, so the token comes in the query
+    try:
+        current_user = await auth.get_current_user(token, db)
+        await run_in_threadpool(get_readable_board, db, board_id, current_user)
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    finally:
+        # Don't hold a pooled connection for the lifetime of the socket
+        db.close()
+
+    subscription = broker.subscribe(board_id)
+    await websocket.accept()
+
+    async def push():
+        while True:
+            message = await subscription.next_message()
+            await websocket.send_json(message)
+
+    sender = asyncio.create_task(push())
+    try:
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+    finally:
+        sender.cancel()
+        broker.unsubscribe(subscription)
+
+@router.get("/boards/{board_id}/events")
+async def board_updates_sse(
+    board_id: int,
+    request: Request,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    await run_in_threadpool(get_readable_board, db, board_id, current_user)
+    db.close()
+    subscription = broker.subscribe(board_id)
+
+    async def event_stream():
+        try:
+            while not await request.is_disconnected():
+                message = await subscription.next_message(timeout=SSE_KEEPALIVE_SECONDS)
+                if message is None:
+                    yield ": keepalive\n\n"
+                else:
+                    yield f"event: {message['type']}\ndata: {json.dumps(message, separators=(',', ':'))}\n\n"
+        finally:
+            broker.unsubscribe(subscription)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @router.post("/board-templates", response_model=schemas.BoardTemplate)
 async def create_board_template(
@@ -255,16 +395,38 @@ async def create_board_template(
     current_user: models.User = Depends(auth.get_current_user),
     db: Session = Depends(get_db)
 ):
-    db_template = models.BoardTemplate(**template.model_dump(), created_by=current_user.id)
+    db_template = models.BoardTemplate(name=template.name, description=template.description, created_by=current_user.id)
+    for item in template.lists:
+        if isinstance(item, str):
+            item = schemas.ListTemplateCreate(name=item)
+        db_template.lists.append(models.ListTemplate(name=item.name, cards=[
+            models.CardTemplate(title=card.title, description=card.description,
+                                labels=[models.LabelTemplate(**label.model_dump()) for label in card.labels])
+            for card in item.cards
+        ]))
     db.add(db_template)
     db.commit()
     db.refresh(db_template)
     return db_template
 
+@router.post("/boards/{board_id}/template", response_model=schemas.BoardTemplate)
+async def create_template_from_board(
+    board_id: int,
+    template: schemas.BoardTemplateFromBoard,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    board = await run_in_threadpool(get_readable_board, db, board_id, current_user)
+    db_template = cloning.new_template_from_board(db, board, current_user, template.name, template.description)
+    db.commit()
+    db.refresh(db_template)
+    return db_template
+
 @router.post("/boards/from-template/{template_id}", response_model=schemas.Board)
 async def create_board_from_template(
     template_id: int,
     board_name: str,
+    response: Response,
     current_user: models.User = Depends(auth.get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -275,12 +437,31 @@ async def create_board_from_template(
     new_board = models.Board(title=board_name, owner_id=current_user.id)
     db.add(new_board)
     db.flush()
+    activity.record(db, new_board.id, current_user.id, models.ActivityType.BOARD_CREATED, f"Board '{new_board.title}' created from template '{template.name}'")
+    # Big copies answer 202 with the empty board and a job that fills it in
+    db_job = cloning.fill_or_schedule(db, cloning.TEMPLATE, template.id, new_board.id, current_user.id)
+    if db_job is not None:
+        accepted(response, db_job)
+    db.refresh(new_board)
+    return new_board
 
-    for list_template in template.lists:
-        new_list = models.List(title=list_template.name, board_id=new_board.id)
-        db.add(new_list)
-
-    db.commit()
+@router.post("/boards/{board_id}/duplicate", response_model=schemas.Board)
+async def duplicate_board(
+    board_id: int,
+    options: schemas.BoardDuplicate,
+    response: Response,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    source = await run_in_threadpool(get_readable_board, db, board_id, current_user)
+    new_board = models.Board(title=options.title or f"{source.title} (copy)", owner_id=current_user.id)
+    db.add(new_board)
+    db.flush()
+    activity.record(db, new_board.id, current_user.id, models.ActivityType.BOARD_CREATED, f"Board '{new_board.title}' created as a copy of '{source.title}'")
+    db_job = cloning.fill_or_schedule(db, cloning.BOARD, source.id, new_board.id, current_user.id,
+                                      include_cards=options.include_cards, include_comments=options.include_comments)
+    if db_job is not None:
+        accepted(response, db_job)
     db.refresh(new_board)
     return new_board
 
@@ -297,6 +478,7 @@ def add_board_member(
     
     new_member = models.BoardMember(**member.model_dump(), board_id=board_id)
     db.add(new_member)
+    activity.record(db, board_id, current_user.id, models.ActivityType.MEMBER_ADDED, f"User {new_member.user_id} added with {member.permission_level} access")
     db.commit()
     db.refresh(new_member)
     return new_member
@@ -318,6 +500,7 @@ def update_board_member_permission(
         raise HTTPException(status_code=404, detail="Board member not found")
     
     member.permission_level = permission
+    activity.record(db, board_id, current_user.id, models.ActivityType.MEMBER_UPDATED, f"User {user_id} given {permission.value} access")
     db.commit()
     db.refresh(member)
     return member
@@ -338,6 +521,7 @@ def remove_board_member(
         raise HTTPException(status_code=404, detail="Board member not found")
     
     db.delete(member)
+    activity.record(db, board_id, current_user.id, models.ActivityType.MEMBER_REMOVED, f"User {user_id} removed")
     db.commit()
     return {"detail": "Board member removed successfully"}
    
@@ -347,43 +531,56 @@ def remove_board_member(
 def create_list(list: schemas.ListCreate, current_user: models.User = Depends(auth.get_current_user), db: Session = Depends(get_db)):
     db_list = models.List(**list.model_dump())
     db.add(db_list)
+    # Logged in the same transaction, so creating a list is a single commit
+    activity.record(db, db_list.board_id, current_user.id, models.ActivityType.LIST_CREATED, f"List '{db_list.title}' created")
     db.commit()
     db.refresh(db_list)
-    
-    # Log activity
-    activity = models.Activity(
-        board_id=db_list.board_id,
-        user_id=current_user.id,
-        activity_type="list_created",
-        details=f"List '{db_list.title}' created"
-    )
-    db.add(activity)
-    db.commit()
-    
     return db_list
 
 # Get all lists with pagination
 @router.get("/lists/", response_model=list[schemas.List])
-def read_lists(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def read_lists(
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    fields: Optional[List[str]] = Depends(list_fields),
+    db: Session = Depends(get_db)
+):
     # Query the database for lists, applying offset and limit for pagination
-    lists = db.query(models.List).offset(skip).limit(limit).all()
+    query = db.query(models.List).offset(skip).limit(limit)
+    if fields:
+        # Select only the requested columns
+        return fieldsets.project_rows(query.with_entities(*fieldsets.columns(models.List, fields)), response)
+    lists = query.all()
     # Return the retrieved lists
     return lists
 
 # Get a specific list by ID
 @router.get("/lists/{list_id}", response_model=schemas.List)
-def read_list(list_id: int, db: Session = Depends(get_db)):
-    # Query the database for a list with the given ID
-    db_list = db.query(models.List).filter(models.List.id == list_id).first()
+def read_list(
+    list_id: int,
+    response: Response,
+    fields: Optional[List[str]] = Depends(list_fields),
+    db: Session = Depends(get_db)
+):
+    archive.ensure_rows_live(db, models.List, [list_id])
+    # Query the database for a list with the given ID, selecting only the requested columns
+    query = db.query(models.List).filter(models.List.id == list_id)
+    if fields:
+        query = query.with_entities(*fieldsets.columns(models.List, fields))
+    db_list = query.first()
     # If the list is not found, raise a 404 error
     if db_list is None:
         raise HTTPException(status_code=404, detail="List not found")
+    if fields:
+        return fieldsets.sparse_response(db_list._asdict(), response)
     # Return the found list
     return db_list
 
 # Update a specific list
 @router.put("/lists/{list_id}", response_model=schemas.List)
 def update_list(list_id: int, list: schemas.ListUpdate, db: Session = Depends(get_db)):
+    archive.ensure_rows_live(db, models.List, [list_id])
     # Query the database for a list with the given ID
     db_list = db.query(models.List).filter(models.List.id == list_id).first()
     # If the list is not found, raise a 404 error
@@ -394,6 +591,12 @@ def update_list(list_id: int, list: schemas.ListUpdate, db: Session = Depends(ge
         setattr(db_list, var, value) if value is not None else None
     # Add the updated list to the database
     db.add(db_list)
+    if list.board_id is not None:
+        # Cards moving with the list take their labels into the new board's palette
+        db.flush()
+        labels.rehome(db, db_list.board_id, select(models.Card.id).where(models.Card.list_id == list_id))
+    # Log the change; endpoints without credentials record no user
+    activity.record(db, db_list.board_id, None, models.ActivityType.LIST_UPDATED, f"List '{db_list.title}' updated")
     # Commit the changes to the database
     db.commit()
     # Refresh the list object to ensure it reflects the current state in the database
@@ -403,21 +606,33 @@ def update_list(list_id: int, list: schemas.ListUpdate, db: Session = Depends(ge
 
 @router.delete("/lists/{list_id}", response_model=schemas.List)
 def delete_list(list_id: int, db: Session = Depends(get_db)):
+    archive.ensure_rows_live(db, models.List, [list_id])
     db_list = db.query(models.List).filter(models.List.id == list_id).first()
     if db_list is None:
         raise HTTPException(status_code=404, detail="List not found")
+    # The cards go through ON DELETE CASCADE without being loaded; only their ids are
+    # read, so change-log readers learn they are gone too
+    card_ids = db.scalars(select(models.Card.id).where(models.Card.list_id == list_id)).all()
+    record_board_changes(db, {db_list.board_id}, [
+        ChangeEvent(db_list.board_id, "card", card_id, "deleted") for card_id in card_ids
+    ])
     db.delete(db_list)
+    activity.record(db, db_list.board_id, None, models.ActivityType.LIST_DELETED, f"List '{db_list.title}' deleted")
     db.commit()
     return db_list
 
 @router.get("/lists/{list_id}/cards", response_model=list[schemas.Card])
 def read_cards_for_list(
     list_id: int,
+    request: Request,
+    response: Response,
     due_date: Optional[datetime] = None,
     sort_by: Optional[str] = Query(None, enum=["created_at", "due_date"]),
     sort_order: Optional[str] = Query("asc", enum=["asc", "desc"]),
+    fields: Optional[List[str]] = Depends(card_fields),
     db: Session = Depends(get_db)
 ):
+    archive.ensure_rows_live(db, models.List, [list_id])
     query = db.query(models.Card).filter(models.Card.list_id == list_id)
 
     if due_date:
@@ -427,62 +642,153 @@ def read_cards_for_list(
         order = desc if sort_order == "desc" else asc
         query = query.order_by(order(getattr(models.Card, sort_by)))
 
+    if fields:
+        query = query.with_entities(*fieldsets.columns(models.Card, fields))
+    # Accept: application/x-ndjson streams one card per line as rows come off the cursor
+    if prefers_ndjson(request.headers.get("accept", "")):
+        return ndjson_response(db.get_bind(), query.statement, None if fields else schemas.Card)
+    if fields:
+        return fieldsets.project_rows(query, response)
+
     cards = query.all()
     return cards
 
 # Card routes
 @router.post("/cards/", response_model=schemas.Card)
 def create_card(card: schemas.CardCreate, current_user: models.User = Depends(auth.get_current_user), db: Session = Depends(get_db)):
+    archive.ensure_rows_live(db, models.List, [card.list_id])
     list = db.query(models.List).filter(models.List.id == card.list_id).first()
     if not list:
         raise HTTPException(status_code=404, detail="List not found")
     
     db_card = models.Card(**card.model_dump())
     db.add(db_card)
+    # Logged in the same transaction, so creating a card is a single commit
+    activity.record(db, list.board_id, current_user.id, models.ActivityType.CARD_CREATED, f"Card '{db_card.title}' created in list '{list.title}'")
     db.commit()
     db.refresh(db_card)
+    return db_card
 
-    # Log activity
-    activity = models.Activity(
-        board_id=list.board_id,
-        user_id=current_user.id,
-        activity_type="card_created",
-        details=f"Card '{db_card.title}' created in list '{list.title}'"
-    )
-    db.add(activity)
+# Batch card routes. Each request is one transaction: access to every target is
+# checked in a single query and the write is a single multi-row statement. They are
+# registered ahead of the /cards/{card_id}/... routes so "batch" isn't read as an id.
+@router.post("/cards/batch", response_model=List[schemas.Card], response_class=NegotiatedResponse)
+def create_cards_batch(
+    cards: List[schemas.CardCreate],
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    # Serialized before commit, which would otherwise expire every row
+    created = [schemas.Card.model_validate(card) for card in bulk.create_cards(db, cards, current_user)]
     db.commit()
+    return created
 
-    return db_card
+@router.post("/cards/batch/move", response_model=List[schemas.Card], response_class=NegotiatedResponse)
+def move_cards_batch(
+    moves: List[schemas.CardBatchMove],
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    moved = [schemas.Card.model_validate(card) for card in bulk.move_cards(db, moves, current_user)]
+    db.commit()
+    return moved
+
+@router.post("/cards/batch/update", response_model=List[schemas.Card], response_class=NegotiatedResponse)
+def update_cards_batch(
+    cards: List[schemas.CardBatchUpdate],
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    updated = [schemas.Card.model_validate(card) for card in bulk.update_cards(db, cards, current_user)]
+    db.commit()
+    return updated
+
+@router.post("/cards/batch/delete", response_model=List[schemas.Card], response_class=NegotiatedResponse)
+def delete_cards_batch(
+    batch: schemas.CardBatchDelete,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    deleted = [schemas.Card.model_validate(card) for card in bulk.delete_cards(db, batch.card_ids, current_user)]
+    db.commit()
+    return deleted
+
+@router.post("/cards/batch/labels", response_model=List[schemas.Label], response_class=NegotiatedResponse)
+def add_labels_batch(
+    batch: schemas.CardBatchLabels,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    labels = [schemas.Label.model_validate(label) for label in bulk.add_labels(db, batch.card_ids, batch.labels, current_user)]
+    db.commit()
+    return labels
+
+@router.post("/cards/batch/labels/delete", response_model=List[schemas.Label], response_class=NegotiatedResponse)
+def remove_labels_batch(
+    batch: schemas.LabelBatchDelete,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    labels = [schemas.Label.model_validate(label) for label in bulk.remove_labels(db, batch.label_ids, current_user)]
+    db.commit()
+    return labels
 
 @router.get("/cards/", response_model=list[schemas.Card])
-def read_cards(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    cards = db.query(models.Card).offset(skip).limit(limit).all()
+def read_cards(
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    fields: Optional[List[str]] = Depends(card_fields),
+    db: Session = Depends(get_db)
+):
+    query = db.query(models.Card).offset(skip).limit(limit)
+    if fields:
+        return fieldsets.project_rows(query.with_entities(*fieldsets.columns(models.Card, fields)), response)
+    cards = query.all()
     return cards
 
 @router.get("/cards/{card_id}", response_model=schemas.Card)
-def read_card(card_id: int, db: Session = Depends(get_db)):
-    db_card = db.query(models.Card).filter(models.Card.id == card_id).first()
+def read_card(
+    card_id: int,
+    response: Response,
+    fields: Optional[List[str]] = Depends(card_fields),
+    db: Session = Depends(get_db)
+):
+    archive.ensure_rows_live(db, models.Card, [card_id])
+    query = db.query(models.Card).filter(models.Card.id == card_id)
+    if fields:
+        query = query.with_entities(*fieldsets.columns(models.Card, fields))
+    db_card = query.first()
     if db_card is None:
         raise HTTPException(status_code=404, detail="Card not found")
+    if fields:
+        return fieldsets.sparse_response(db_card._asdict(), response)
     return db_card
 
 @router.put("/cards/{card_id}", response_model=schemas.Card)
 def update_card(card_id: int, card: schemas.CardUpdate, db: Session = Depends(get_db)):
+    archive.ensure_rows_live(db, models.Card, [card_id])
     db_card = db.query(models.Card).filter(models.Card.id == card_id).first()
     if db_card is None:
         raise HTTPException(status_code=404, detail="Card not found")
     for var, value in vars(card).items():
         setattr(db_card, var, value) if value is not None else None
     db.add(db_card)
+    if card.list_id is not None:
+        db.flush()
+        labels.rehome(db, db.scalar(select(models.List.board_id).where(models.List.id == db_card.list_id)), [card_id])
+    activity.record(db, db_card.list.board_id, None, models.ActivityType.CARD_UPDATED, f"Card '{db_card.title}' updated")
     db.commit()
     db.refresh(db_card)
     return db_card
 
 @router.delete("/cards/{card_id}", response_model=schemas.Card)
 def delete_card(card_id: int, db: Session = Depends(get_db)):
+    archive.ensure_rows_live(db, models.Card, [card_id])
     db_card = db.query(models.Card).filter(models.Card.id == card_id).first()
     if db_card is None:
         raise HTTPException(status_code=404, detail="Card not found")
+    activity.record(db, db_card.list.board_id, None, models.ActivityType.CARD_DELETED, f"Card '{db_card.title}' deleted")
     db.delete(db_card)
     db.commit()
     return db_card
@@ -495,6 +801,7 @@ async def move_card(
     db: Session = Depends(get_db)
 ):
     print(f"Moving card {card_id} to list {new_list_id} for user {current_user.id}")
+    await run_in_threadpool(archive.ensure_rows_live, db, models.Card, [card_id])
     card = db.query(models.Card).filter(models.Card.id == card_id).first()
     if not card:
         print(f"Card {card_id} not found")
@@ -513,7 +820,9 @@ async def move_card(
         raise HTTPException(status_code=400, detail="Invalid new list ID")
 
     # Move the card
+    old_list_title = db.query(models.List.title).filter(models.List.id == card.list_id).scalar()
     card.list_id = new_list_id
+    activity.record(db, board.id, current_user.id, models.ActivityType.CARD_MOVED, f"Card '{card.title}' moved from '{old_list_title}' to '{new_list.title}'")
     db.commit()
     db.refresh(card)
 
@@ -526,6 +835,7 @@ def add_label_to_card(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_user)
 ):
+    archive.ensure_rows_live(db, models.Card, [card_id])
     card = db.query(models.Card).join(models.List).join(models.Board).filter(
         models.Card.id == card_id,
         models.Board.owner_id == current_user.id
@@ -533,8 +843,11 @@ def add_label_to_card(
     if not card:
         raise HTTPException(status_code=404, detail="Card not found")
     
-    new_label = models.Label(**label.model_dump(), card_id=card_id)
-    db.add(new_label)
+    # The name and color live in the board's palette; the card only refers to them
+    label_id = labels.ensure_label(db, card.list.board_id, label.name, label.color)
+    if not any(card_label.label_id == label_id for card_label in card.labels):
+        db.add(models.CardLabel(card_id=card_id, label_id=label_id))
+        activity.record(db, card.list.board_id, current_user.id, models.ActivityType.LABEL_ADDED, f"Label '{label.name}' added to card '{card.title}'")
     db.commit()
     db.refresh(card)
     return card
@@ -546,6 +859,7 @@ def remove_label_from_card(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_user)
 ):
+    archive.ensure_rows_live(db, models.Card, [card_id])
     card = db.query(models.Card).join(models.List).join(models.Board).filter(
         models.Card.id == card_id,
         models.Board.owner_id == current_user.id
@@ -553,63 +867,51 @@ def remove_label_from_card(
     if not card:
         raise HTTPException(status_code=404, detail="Card not found")
     
-    label = db.query(models.Label).filter(models.Label.id == label_id, models.Label.card_id == card_id).first()
+    label = db.query(models.CardLabel).filter(models.CardLabel.id == label_id, models.CardLabel.card_id == card_id).first()
     if not label:
         raise HTTPException(status_code=404, detail="Label not found")
     
     db.delete(label)
+    activity.record(db, card.list.board_id, current_user.id, models.ActivityType.LABEL_REMOVED, f"Label '{label.name}' removed from card '{card.title}'")
     db.commit()
     db.refresh(card)
     return card
 
-@router.post("/cards/batch", response_model=List[schemas.Card])
-def create_cards_batch(
-    cards: List[schemas.CardCreate],
-    current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
-):
-    created_cards = []
-    for card_data in cards:
-        # Verify that the user has access to the list
-        list_obj = db.query(models.List).join(models.Board).filter(
-            models.List.id == card_data.list_id,
-            models.Board.owner_id == current_user.id
-        ).first()
-        if not list_obj:
-            raise HTTPException(status_code=404, detail="List not found or access denied")
-        
-        db_card = models.Card(**card_data.model_dump())
-        db.add(db_card)
-        created_cards.append(db_card)
-    
-    db.commit()
-    for card in created_cards:
-        db.refresh(card)
-    
-    return created_cards
-
-@router.post("/cards/{card_id}/attachments", response_model=schemas.Attachment)
-async def add_attachment(
-    card_id: int,
-    file: UploadFile = File(...),
-    current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
-):
+def get_owned_card(db: Session, card_id: int, user: models.User) -> models.Card:
+    archive.ensure_rows_live(db, models.Card, [card_id])
     card = db.query(models.Card).join(models.List).join(models.Board).filter(
         models.Card.id == card_id,
-        models.Board.owner_id == current_user.id
+        models.Board.owner_id == user.id
     ).first()
     if not card:
         raise HTTPException(status_code=404, detail="Card not found or access denied")
+    return card
 
-    os.makedirs(UPLOAD_DIR, exist_ok=True)
-    file_path = os.path.join(UPLOAD_DIR, file.filename)
-    
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+# The body add_attachment parses itself, for the OpenAPI schema
+ATTACHMENT_UPLOAD_BODY = {"requestBody": {"required": True, "content": {"multipart/form-data": {"schema": {
+    "type": "object", "required": ["file"], "properties": {"file": {"type": "string", "format": "binary"}},
+}}}}}
 
-    db_attachment = models.Attachment(filename=file.filename, file_path=file_path, card_id=card.id)
-    db.add(db_attachment)
+# Upload a file in one request; it is streamed to disk and stored by content (see app/storage.py).
+# The multipart body is parsed here rather than by File(...), so the size limit applies
+# before any of it is spooled.
+@router.post("/cards/{card_id}/attachments", response_model=schemas.Attachment, openapi_extra=ATTACHMENT_UPLOAD_BODY)
+async def add_attachment(
+    card_id: int,
+    request: Request,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    card = await run_in_threadpool(get_owned_card, db, card_id, current_user)
+    form = await storage.limited(request).form(max_files=1)
+    try:
+        file = form.get("file")
+        if not isinstance(file, StarletteUploadFile):
+            raise BadRequestException(detail="A file is required")
+        stored = await storage.save_upload(file)
+    finally:
+        await form.close()
+    db_attachment = uploads.attach(db, card, current_user, file.filename, file.content_type, stored)
     db.commit()
     db.refresh(db_attachment)
 
@@ -621,15 +923,111 @@ async def get_attachments(
     current_user: models.User = Depends(auth.get_current_user),
     db: Session = Depends(get_db)
 ):
-    card = db.query(models.Card).join(models.List).join(models.Board).filter(
-        models.Card.id == card_id,
-        models.Board.owner_id == current_user.id
-    ).first()
-    if not card:
-        raise HTTPException(status_code=404, detail="Card not found or access denied")
-
+    card = await run_in_threadpool(get_owned_card, db, card_id, current_user)
     return card.attachments
 
+# Download an attachment; Range and conditional requests are supported (see app/downloads.py)
+@router.get("/attachments/{attachment_id}/content")
+def download_attachment(
+    attachment_id: int,
+    request: Request,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    archive.ensure_rows_live(db, models.Attachment, [attachment_id])
+    attachment = db.get(models.Attachment, attachment_id)
+    if attachment is None:
+        raise NotFoundException(detail="Attachment not found")
+    get_readable_board(db, attachment.card.list.board_id, current_user)
+    return downloads.respond(request, attachment)
+
+# A short-lived link to an attachment that works without credentials, for embeds and repeat downloads
+@router.get("/attachments/{attachment_id}/url", response_model=schemas.SignedUrl)
+def sign_attachment_url(
+    attachment_id: int,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    archive.ensure_rows_live(db, models.Attachment, [attachment_id])
+    attachment = db.get(models.Attachment, attachment_id)
+    if attachment is None:
+        raise NotFoundException(detail="Attachment not found")
+    get_readable_board(db, attachment.card.list.board_id, current_user)
+    url, expires_at = downloads.signed_url(attachment.id)
+    return schemas.SignedUrl(url=url, expires_at=expires_at)
+
+# Download through a signed link: the signature stands in for the token and the permission check
+@router.get("/files/{attachment_id}")
+def download_signed(
+    attachment_id: int,
+    request: Request,
+    expires: int,
+    signature: str,
+    db: Session = Depends(get_db)
+):
+    if not downloads.verify(attachment_id, expires, signature):
+        raise ForbiddenException(detail="Link is invalid or has expired")
+    archive.ensure_rows_live(db, models.Attachment, [attachment_id])
+    return downloads.respond(request, db.get(models.Attachment, attachment_id))
+
+# Start a resumable upload of a large file (see app/uploads.py for the protocol)
+@router.post("/cards/{card_id}/uploads", response_model=schemas.UploadSession, status_code=status.HTTP_201_CREATED)
+def create_upload(
+    card_id: int,
+    upload: schemas.UploadSessionCreate,
+    response: Response,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    card = get_owned_card(db, card_id, current_user)
+    db_upload = uploads.begin(db, card, current_user, upload)
+    db.commit()
+    db.refresh(db_upload)
+    response.headers["Location"] = f"/uploads/{db_upload.id}"
+    return db_upload
+
+# How far a resumable upload has got
+@router.get("/uploads/{upload_id}", response_model=schemas.UploadSession)
+def read_upload(
+    upload_id: str,
+    response: Response,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    db_upload = uploads.get_upload(db, upload_id, current_user)
+    response.headers["Upload-Offset"] = str(db_upload.offset)
+    return db_upload
+
+# Send the next bytes of a resumable upload, starting at the Upload-Offset header
+@router.patch("/uploads/{upload_id}", response_model=schemas.UploadSession)
+async def append_upload(
+    upload_id: str,
+    request: Request,
+    response: Response,
+    upload_offset: int = Header(..., ge=0),
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    db_upload = uploads.get_upload(db, upload_id, current_user)
+    upload = schemas.UploadSession.model_validate(db_upload)
+    db_attachment = await uploads.append(db, db_upload, upload_offset, request.stream(), current_user)
+    if db_attachment is None:
+        upload.offset = db_upload.offset
+    else:
+        # The upload's row is gone; the attachment takes its place
+        upload.offset, upload.attachment = upload.size, schemas.Attachment.model_validate(db_attachment)
+    response.headers["Upload-Offset"] = str(upload.offset)
+    return upload
+
+# Abandon a resumable upload
+@router.delete("/uploads/{upload_id}", status_code=204)
+def delete_upload(
+    upload_id: str,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    uploads.cancel(db, uploads.get_upload(db, upload_id, current_user))
+
 @router.post("/cards/{card_id}/comments", response_model=schemas.Comment)
 def add_comment_to_card(
     card_id: int,
@@ -637,6 +1035,7 @@ def add_comment_to_card(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_user)
 ):
+    archive.ensure_rows_live(db, models.Card, [card_id])
     card = db.query(models.Card).join(models.List).join(models.Board).filter(
         models.Card.id == card_id,
         models.Board.owner_id == current_user.id
@@ -646,6 +1045,7 @@ def add_comment_to_card(
     
     new_comment = models.Comment(**comment.model_dump(), card_id=card_id, user_id=current_user.id)
     db.add(new_comment)
+    activity.record(db, card.list.board_id, current_user.id, models.ActivityType.COMMENT_ADDED, f"Comment added to card '{card.title}'")
     db.commit()
     db.refresh(new_comment)
     return new_comment
@@ -656,6 +1056,7 @@ def get_card_comments(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_user)
 ):
+    archive.ensure_rows_live(db, models.Card, [card_id])
     card = db.query(models.Card).join(models.List).join(models.Board).filter(
         models.Card.id == card_id,
         models.Board.owner_id == current_user.id
@@ -684,10 +1085,27 @@ async def read_users_me(current_user: models.User = Depends(auth.get_current_use
     return current_user
 
 @router.get("/users/me/boards", response_model=List[schemas.Board])
-async def read_user_boards(current_user: models.User = Depends(auth.get_current_user), db: Session = Depends(get_db)):
-    boards = db.query(models.Board).filter(models.Board.owner_id == current_user.id).all()
+async def read_user_boards(
+    response: Response,
+    fields: Optional[List[str]] = Depends(board_fields),
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    query = db.query(models.Board).filter(models.Board.owner_id == current_user.id, models.Board.deleted_at.is_(None))
+    if fields:
+        return fieldsets.project_rows(query.with_entities(*fieldsets.columns(models.Board, fields)), response)
+    boards = query.all()
     return boards
 
+# The user's profile, boards, memberships and comments, streamed like a board export
+@router.get("/users/me/export")
+def export_account(
+    format: str = Query("ndjson", pattern="^(ndjson|tar\\.gz)$"),
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    return export.account_export(db, current_user, format)
+
 #token
 
 @router.post("/token", response_model=schemas.Token)
@@ -706,67 +1124,90 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
     return {"access_token": access_token, "token_type": "bearer"}
 
 
+#batch
+@router.post("/batch", response_model=schemas.BatchResponse)
+async def run_batch(
+    batch: schemas.BatchRequest,
+    request: Request,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    # Sub-requests reuse this request's user and session instead of authenticating again
+    return await batching.run_batch(request, batch, db, current_user)
+
+#metrics
+
+# Process counters; they describe every user's traffic, so only signed-in users see them
+@router.get("/metrics")
+def read_metrics(current_user: models.User = Depends(auth.get_current_user)):
+    return metrics.snapshot()
+
 #search
-@router.get("/search", response_model=List[schemas.SearchResult])
+@router.get("/search/suggest", response_model=List[schemas.SearchResult], response_class=NegotiatedResponse)
+async def search_suggest(
+    query: str,
+    limit: int = Query(10, ge=1, le=50),
+    board_id: Optional[int] = None,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    await run_in_threadpool(ensure_readable_live, db, current_user, board_id)
+    # Typeahead: titles with a word starting with the query, most recently changed first
+    items = await run_in_threadpool(suggester.suggest, db, current_user, query, limit, board_id=board_id)
+    return [schemas.SearchResult(type=item[0], id=item[1], title=item[2]) for item in items]
+
+@router.get("/search", response_model=List[schemas.SearchResult], response_class=NegotiatedResponse)
 async def search(
     query: str,
+    response: Response,
+    match: str = Query("words", pattern="^(words|substring)$"),
     due_date_start: Optional[datetime] = None,
     due_date_end: Optional[datetime] = None,
     label: Optional[str] = None,
     board_id: Optional[int] = None,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+    fields: Optional[List[str]] = Depends(search_fields),
     current_user: models.User = Depends(auth.get_current_user),
     db: Session = Depends(get_db)
 ):
-    # Base query for boards
-    board_query = db.query(models.Board).filter(models.Board.owner_id == current_user.id)
-    
-    # Apply board_id filter if provided
-    if board_id:
-        board_query = board_query.filter(models.Board.id == board_id)
-    
-    # Search in boards
-    boards = board_query.filter(models.Board.title.ilike(f"%{query}%")).all()
-
-    # Search in lists
-    lists = db.query(models.List).join(models.Board).filter(
-        models.Board.owner_id == current_user.id,
-        models.List.title.ilike(f"%{query}%")
-    ).all()
-
-    # Base query for cards
-    card_query = db.query(models.Card).join(models.List).join(models.Board).filter(
-        models.Board.owner_id == current_user.id
-    )
-    
-    # Apply filters
-    if due_date_start:
-        card_query = card_query.filter(models.Card.due_date >= due_date_start)
-    if due_date_end:
-        card_query = card_query.filter(models.Card.due_date <= due_date_end)
-    if label:
-        card_query = card_query.join(models.Label).filter(models.Label.name == label)
-    if board_id:
-        card_query = card_query.filter(models.Board.id == board_id)
-
-    # Full-text search on cards
-    cards = card_query.filter(
-        or_(
-            models.Card.title.ilike(f"%{query}%"),
-            models.Card.description.ilike(f"%{query}%")
+    # Archived boards are searched like any other, once their rows are back
+    await run_in_threadpool(ensure_readable_live, db, current_user, board_id)
+    rows = None
+    if match == "substring" and not (due_date_start or due_date_end or label):
+        # Substring matches from memory when the trigram index holds every board involved
+        rows = await run_in_threadpool(
+            trigram_index.search, db, current_user, query, board_id=board_id, skip=skip, limit=limit
         )
-    ).all()
-
-    results = [
-        *[schemas.SearchResult(type="board", id=b.id, title=b.title) for b in boards],
-        *[schemas.SearchResult(type="list", id=l.id, title=l.title) for l in lists],
-        *[schemas.SearchResult(type="card", id=c.id, title=c.title) for c in cards]
-    ]
+    if rows is None:
+        # One ranked UNION over boards, lists and cards, best matches first; substring
+        # matches here are the same ones the trigram index would have given
+        rows = await run_in_threadpool(
+            fulltext.search, db, current_user, query,
+            match=match,
+            board_id=board_id,
+            due_date_start=due_date_start,
+            due_date_end=due_date_end,
+            label=label,
+            skip=skip,
+            limit=limit,
+        )
+    results = [schemas.SearchResult(type=row.type, id=row.id, title=row.title) for row in rows]
 
+    if fields:
+        return fieldsets.project_models(results, fields, response)
     return results
 
+# Job routes
 
-
-
-
-
-
+# Status and progress of a background job started by one of the current user's requests
+@router.get("/jobs/{job_id}", response_model=schemas.Job)
+def read_job(
+    job_id: int,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    db_job = db.get(models.Job, job_id)
+    if db_job is None or db_job.created_by != current_user.id:
+        raise NotFoundException(detail="Job not found")
+    return db_job
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field, EmailStr
 from datetime import datetime
-from typing import List as PyList, Optional
+from typing import Any, Dict, List as PyList, Optional, Union
 from enum import Enum
 from pydantic.config import ConfigDict
 from .models import PermissionLevel
@@ -72,6 +72,16 @@ class Card(CardBase):
         
 class CardMove(BaseModel):
     new_list_id: int
+
+class CardBatchMove(BaseModel):
+    card_id: int
+    list_id: int = Field(..., gt=0)
+
+class CardBatchUpdate(CardUpdate):
+    id: int
+
+class CardBatchDelete(BaseModel):
+    card_ids: PyList[int]
             
 class UserBase(BaseModel):
     username: str
@@ -85,15 +95,29 @@ class User(UserBase):
     created_at: datetime
 
 class ActivityType(str, Enum):
+    BOARD_CREATED = "board_created"
+    BOARD_UPDATED = "board_updated"
+    LIST_CREATED = "list_created"
+    LIST_UPDATED = "list_updated"
+    LIST_DELETED = "list_deleted"
     CARD_CREATED = "card_created"
+    CARD_UPDATED = "card_updated"
     CARD_MOVED = "card_moved"
     CARD_ARCHIVED = "card_archived"
-    LIST_CREATED = "list_created"
+    CARD_DELETED = "card_deleted"
+    LABEL_ADDED = "label_added"
+    LABEL_REMOVED = "label_removed"
+    COMMENT_ADDED = "comment_added"
+    ATTACHMENT_ADDED = "attachment_added"
+    MEMBER_ADDED = "member_added"
+    MEMBER_UPDATED = "member_updated"
+    MEMBER_REMOVED = "member_removed"
     
 class Activity(BaseModel):
     id: int
     board_id: int
-    user_id: int
+    # Unset for changes made through endpoints that take no credentials
+    user_id: Optional[int] = None
     activity_type: ActivityType
     details: str
     created_at: datetime
@@ -110,22 +134,107 @@ class SearchResult(BaseModel):
 class Attachment(BaseModel):
     id: int
     filename: str
-    file_path: str
+    url: str
+    sha256: Optional[str] = None
+    size: Optional[int] = None
+    content_type: Optional[str] = None
     uploaded_at: datetime
 
     model_config = ConfigDict(from_attributes=True)
 
+class SignedUrl(BaseModel):
+    url: str
+    expires_at: datetime
+
+class UploadSessionCreate(BaseModel):
+    filename: str = Field(..., min_length=1)
+    size: int = Field(..., ge=1)
+    content_type: Optional[str] = None
+
+class UploadSession(BaseModel):
+    id: str
+    card_id: int
+    filename: str
+    size: int
+    offset: int
+    expires_at: datetime
+    # Set by the request that completes the upload
+    attachment: Optional[Attachment] = None
+
+    model_config = ConfigDict(from_attributes=True)
+
+class LabelTemplateCreate(BaseModel):
+    name: str
+    color: str
+
+class LabelTemplate(LabelTemplateCreate):
+    id: int
+
+    model_config = ConfigDict(from_attributes=True)
+
+class CardTemplateCreate(BaseModel):
+    title: str = Field(..., min_length=1, max_length=100)
+    description: Optional[str] = None
+    labels: PyList[LabelTemplateCreate] = []
+
+class CardTemplate(BaseModel):
+    id: int
+    title: str
+    description: Optional[str] = None
+    labels: PyList[LabelTemplate] = []
+
+    model_config = ConfigDict(from_attributes=True)
+
+class ListTemplateCreate(BaseModel):
+    name: str
+    cards: PyList[CardTemplateCreate] = []
+
+class ListTemplate(BaseModel):
+    id: int
+    name: str
+    cards: PyList[CardTemplate] = []
+
+    model_config = ConfigDict(from_attributes=True)
+
 class BoardTemplateCreate(BaseModel):
     name: str
     description: str
-    lists: PyList[str]
+    # Plain names still make empty lists
+    lists: PyList[Union[str, ListTemplateCreate]]
 
-class BoardTemplate(BoardTemplateCreate):
+class BoardTemplate(BaseModel):
     id: int
+    name: str
+    description: Optional[str] = None
     created_by: int
     created_at: datetime
+    lists: PyList[ListTemplate] = []
 
-    model_config = ConfigDict(from_attributes=True)    
+    model_config = ConfigDict(from_attributes=True)
+
+class BoardTemplateFromBoard(BaseModel):
+    name: str
+    description: str = ""
+
+class BoardDuplicate(BaseModel):
+    title: Optional[str] = Field(None, min_length=1, max_length=100)
+    include_cards: bool = True
+    include_comments: bool = False
+
+class Job(BaseModel):
+    id: int
+    type: str
+    status: str
+    attempts: int
+    max_attempts: int
+    progress_done: int
+    progress_total: Optional[int] = None
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+
+    model_config = ConfigDict(from_attributes=True)
 
 class ListStatistics(BaseModel):
     name: str
@@ -138,6 +247,13 @@ class BoardStatistics(BaseModel):
 
     model_config = ConfigDict(from_attributes=True)    
     
+class BoardChanges(BaseModel):
+    revision: int
+    # True when the requested revision is outside the change log; refetch the board
+    resync: bool
+    changed: Dict[str, PyList[dict]] = {}
+    deleted: Dict[str, PyList[int]] = {}
+
 class LabelCreate(BaseModel):
     name: str
     color: str
@@ -147,6 +263,19 @@ class Label(LabelCreate):
     card_id: int
 
     model_config = ConfigDict(from_attributes=True)   
+
+class BoardLabel(LabelCreate):
+    id: int
+    board_id: int
+
+    model_config = ConfigDict(from_attributes=True)
+
+class CardBatchLabels(BaseModel):
+    card_ids: PyList[int]
+    labels: PyList[LabelCreate]
+
+class LabelBatchDelete(BaseModel):
+    label_ids: PyList[int]
     
 class Token(BaseModel):
     access_token: str
@@ -189,4 +318,25 @@ class BoardMember(BoardMemberCreate):
     id: int
     board_id: int
 
-    model_config = ConfigDict(from_attributes=True)      
\ No newline at end of file
+    model_config = ConfigDict(from_attributes=True)      
+
+class BatchRequestItem(BaseModel):
+    method: str = "GET"
+    # Path on this API, optionally with a query string
+    path: str
+    body: Optional[Any] = None
+
+class BatchRequest(BaseModel):
+    requests: PyList[BatchRequestItem]
+    # Run consecutive read-only requests concurrently (ignored when atomic)
+    concurrent: bool = False
+    # Run the whole batch in one transaction, rolled back if any request fails
+    atomic: bool = False
+
+class BatchResponseItem(BaseModel):
+    status: int
+    headers: Dict[str, str] = {}
+    body: Optional[Any] = None
+
+class BatchResponse(BaseModel):
+    responses: PyList[BatchResponseItem]
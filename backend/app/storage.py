@@ -0,0 +1,182 @@
+# app/storage.py
+#
+# Attachment files on local disk, under UPLOAD_DIR. Files are content-addressed: each is
+# stored once as objects/<ab>/<cd>/<sha256>, so identical uploads share a file and
+# names never collide. Uploads are streamed to a temporary file in FILE_CHUNK_SIZE
+# pieces, with the writes and hashing done on worker threads, and moved into place
+# once complete. Resumable uploads collect their bytes in parts/<upload id> first.
+# Single-request uploads are read through limited(), so a body over MAX_UPLOAD_BYTES is
+# refused as it arrives rather than after it has been spooled.
+import hashlib
+import os
+import tempfile
+from dataclasses import dataclass
+from typing import AsyncIterator, Optional
+import anyio
+from fastapi import Request, UploadFile, status
+from starlette.requests import ClientDisconnect
+from starlette.types import Message
+from .exceptions import BadRequestException, CustomException
+
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
+# Bytes read from or written to disk at a time
+FILE_CHUNK_SIZE = 64 * 1024
+# Largest attachment accepted, in one request or through a resumable upload
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(100 * 1024 * 1024)))
+# Room allowed on top of MAX_UPLOAD_BYTES for the multipart boundaries and part headers
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+@dataclass(frozen=True)
+class StoredFile:
+    sha256: str
+    size: int
+    path: str
+
+
+def too_large() -> CustomException:
+    return CustomException(detail=f"File is larger than {MAX_UPLOAD_BYTES} bytes",
+                           status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+
+def limited(request: Request) -> Request:
+    """``request`` with its body capped, so an oversized upload is refused before it is spooled.
+
+    A declared Content-Length over the cap is refused at once; a chunked body is
+    counted as it arrives and refused as soon as it goes over.
+    """
+    limit = MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD
+    length = request.headers.get("content-length", "")
+    if length.isdigit() and int(length) > limit:
+        raise too_large()
+    received = 0
+
+    async def receive() -> Message:
+        nonlocal received
+        message = await request.receive()
+        received += len(message.get("body", b""))
+        if received > limit:
+            raise too_large()
+        return message
+    return Request(request.scope, receive)
+
+
+def object_path(sha256: str) -> str:
+    return os.path.join(UPLOAD_DIR, "objects", sha256[:2], sha256[2:4], sha256)
+
+
+def part_path(upload_id: str) -> str:
+    return os.path.join(UPLOAD_DIR, "parts", upload_id)
+
+
+def local_path(file_path: Optional[str]) -> Optional[str]:
+    """The stored ``file_path`` if it is an existing file inside UPLOAD_DIR, else None."""
+    if not file_path:
+        return None
+    root = os.path.realpath(UPLOAD_DIR)
+    path = os.path.realpath(file_path)
+    if os.path.commonpath([root, path]) != root or not os.path.isfile(path):
+        return None
+    return path
+
+
+def read_chunks(path: str):
+    with open(path, "rb") as f:
+        while chunk := f.read(FILE_CHUNK_SIZE):
+            yield chunk
+
+
+def _store(temp_path: str, sha256: str) -> str:
+    # Whichever copy lands first is kept; the contents are the same either way
+    path = object_path(sha256)
+    if os.path.exists(path):
+        os.remove(temp_path)
+    else:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(temp_path, path)
+    return path
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _write(f, digest, chunk: bytes) -> None:
+    digest.update(chunk)
+    f.write(chunk)
+
+
+def _open_temp():
+    directory = os.path.join(UPLOAD_DIR, "tmp")
+    os.makedirs(directory, exist_ok=True)
+    fd, path = tempfile.mkstemp(dir=directory)
+    return os.fdopen(fd, "wb"), path
+
+
+async def save_upload(upload: UploadFile) -> StoredFile:
+    """Stream ``upload`` to disk off the event loop, hashing it on the way, and store it by content."""
+    f, temp_path = await anyio.to_thread.run_sync(_open_temp)
+    digest, size = hashlib.sha256(), 0
+    try:
+        with f:
+            while chunk := await upload.read(FILE_CHUNK_SIZE):
+                size += len(chunk)
+                if size > MAX_UPLOAD_BYTES:
+                    raise too_large()
+                await anyio.to_thread.run_sync(_write, f, digest, chunk)
+        path = await anyio.to_thread.run_sync(_store, temp_path, digest.hexdigest())
+    except BaseException:
+        await anyio.to_thread.run_sync(_remove, temp_path)
+        raise
+    return StoredFile(digest.hexdigest(), size, path)
+
+
+def _open_part(upload_id: str, offset: int):
+    path = part_path(upload_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    f = open(path, "r+b" if os.path.exists(path) else "wb")
+    # Bytes past the recorded offset are from a request that never finished; drop them
+    f.truncate(offset)
+    f.seek(offset)
+    return f
+
+
+async def append_part(upload_id: str, offset: int, size: int, chunks: AsyncIterator[bytes]) -> int:
+    """Write ``chunks`` to the upload's part file from ``offset``; returns the offset reached.
+
+    If the client goes away mid-request, what arrived is kept and the client resumes
+    from the returned offset.
+    """
+    f = await anyio.to_thread.run_sync(_open_part, upload_id, offset)
+    try:
+        async for chunk in chunks:
+            if offset + len(chunk) > size:
+                raise BadRequestException(detail="Upload is longer than its declared size")
+            await anyio.to_thread.run_sync(f.write, chunk)
+            offset += len(chunk)
+    except ClientDisconnect:
+        pass
+    finally:
+        await anyio.to_thread.run_sync(f.close)
+    return offset
+
+
+def _store_part(upload_id: str) -> StoredFile:
+    path = part_path(upload_id)
+    digest, size = hashlib.sha256(), 0
+    for chunk in read_chunks(path):
+        digest.update(chunk)
+        size += len(chunk)
+    return StoredFile(digest.hexdigest(), size, _store(path, digest.hexdigest()))
+
+
+async def store_part(upload_id: str) -> StoredFile:
+    """Hash a finished part file and move it to its content address."""
+    return await anyio.to_thread.run_sync(_store_part, upload_id)
+
+
+def discard_part(upload_id: str) -> None:
+    _remove(part_path(upload_id))
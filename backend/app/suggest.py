@@ -0,0 +1,195 @@
+# app/suggest.py
+#
+# Typeahead over board, list and card titles. Each board's titles are kept in memory
+# as a sorted array of the suffixes starting at each word, so a prefix is two binary
+# searches. Like the trigram index, the arrays are kept current from the ChangeEvents
+# of local commits; a board is only rebuilt when its revision jumps past what was
+# applied (another process wrote to it). Boards not yet in memory are built together,
+# three queries for all of them, so a keystroke costs one indexed query for the
+# user's boards once they are loaded.
+import bisect
+import heapq
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from . import metrics, models
+from .board_revisions import on_changes_committed
+from .permissions import readable_boards
+
+SUGGEST_MAX_BOARDS = int(os.getenv("SUGGEST_MAX_BOARDS", "1024"))
+
+_WORD = re.compile(r"\w+")
+_ENTITY_ORDER = {"board": 0, "list": 1, "card": 2}
+
+
+def _recency(value) -> float:
+    return value.timestamp() if value is not None else 0.0
+
+
+def _word_keys(title: str) -> set:
+    # A title is found by the start of any of its words
+    folded = title.lower()
+    return {folded[match.start():] for match in _WORD.finditer(folded)}
+
+
+class BoardTitles:
+    """Sorted word-start keys of one board's titles, as of ``revision``."""
+
+    def __init__(self, board_id: int, revision: int, items: list):
+        self.board_id = board_id
+        self.revision = revision
+        self.items = {}  # (type, id) -> (type, id, title, recency)
+        self.lists = set()
+        keys = []
+        for item in items:
+            self.items[item[:2]] = item
+            if item[0] == "list":
+                self.lists.add(item[1])
+            keys.extend((key, item[0], item[1]) for key in _word_keys(item[2]))
+        keys.sort()
+        self.keys = keys  # (key, type, id)
+
+    def put(self, item: tuple) -> None:
+        self.remove(item[0], item[1])
+        self.items[item[:2]] = item
+        if item[0] == "list":
+            self.lists.add(item[1])
+        for key in _word_keys(item[2]):
+            bisect.insort(self.keys, (key, item[0], item[1]))
+
+    def remove(self, entity: str, entity_id: int) -> None:
+        item = self.items.pop((entity, entity_id), None)
+        if item is None:
+            return
+        if entity == "list":
+            self.lists.discard(entity_id)
+        for key in _word_keys(item[2]):
+            position = bisect.bisect_left(self.keys, (key, entity, entity_id))
+            del self.keys[position]
+
+    def apply(self, entity: str, entity_id: int, op: str, data) -> None:
+        if op == "deleted":
+            self.remove(entity, entity_id)
+            return
+        data = data or {}
+        # Rows that moved to another board leave this one
+        if entity == "list" and data.get("board_id", self.board_id) != self.board_id:
+            self.remove(entity, entity_id)
+            return
+        if entity == "card" and "list_id" in data and data["list_id"] not in self.lists:
+            self.remove(entity, entity_id)
+            return
+        # Snapshots only carry loaded columns; keep the title we had if it isn't there.
+        # The row has just been written, so its updated_at is now.
+        previous = self.items.get((entity, entity_id))
+        title = data.get("title", previous[2] if previous else None)
+        if title is None:
+            return
+        self.put((entity, entity_id, title, time.time()))
+
+    def matches(self, prefix: str, limit: int) -> list:
+        """The ``limit`` most recent items with a word starting with ``prefix``."""
+        start = bisect.bisect_left(self.keys, (prefix,))
+        end = bisect.bisect_left(self.keys, (prefix + "\U0010ffff",), lo=start)
+        # A title can match at several words, hence the set
+        found = {(entity, entity_id) for _, entity, entity_id in self.keys[start:end]}
+        return heapq.nlargest(limit, (self.items[key] for key in found), key=lambda item: (item[3], item[1]))
+
+
+class Suggester:
+    def __init__(self, max_boards: int):
+        self.max_boards = max_boards
+        self._boards = OrderedDict()  # board id -> BoardTitles, least recently used first
+        self._lock = threading.Lock()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._boards.clear()
+
+    def _build(self, db: Session, revisions: dict) -> list:
+        """BoardTitles for every board in ``revisions`` ({board id: revision}), in three queries."""
+        items = {board_id: [] for board_id in revisions}
+        boards = db.execute(
+            select(models.Board.id, models.Board.title,
+                   func.coalesce(models.Board.updated_at, models.Board.created_at).label("at"))
+            .where(models.Board.id.in_(revisions))
+        )
+        for row in boards:
+            items[row.id].append(("board", row.id, row.title or "", _recency(row.at)))
+        lists = db.execute(
+            select(models.List.board_id, models.List.id, models.List.title,
+                   func.coalesce(models.List.updated_at, models.List.created_at).label("at"))
+            .where(models.List.board_id.in_(revisions))
+        )
+        for row in lists:
+            items[row.board_id].append(("list", row.id, row.title or "", _recency(row.at)))
+        cards = db.execute(
+            select(models.List.board_id, models.Card.id, models.Card.title,
+                   func.coalesce(models.Card.updated_at, models.Card.created_at).label("at"))
+            .join(models.List).where(models.List.board_id.in_(revisions))
+        )
+        for row in cards:
+            items[row.board_id].append(("card", row.id, row.title or "", _recency(row.at)))
+        metrics.increment("suggest.rebuilds", len(revisions))
+        return [BoardTitles(board_id, revisions[board_id], items[board_id]) for board_id in revisions]
+
+    def titles(self, db: Session, revisions: dict) -> list:
+        """Current BoardTitles for each board in ``revisions``, building the ones missing or behind."""
+        found, missing = [], {}
+        with self._lock:
+            for board_id, revision in revisions.items():
+                cached = self._boards.get(board_id)
+                if cached is not None and cached.revision == revision:
+                    self._boards.move_to_end(board_id)
+                    found.append(cached)
+                else:
+                    missing[board_id] = revision
+        if not missing:
+            return found
+        built = self._build(db, missing)
+        with self._lock:
+            for titles in built:
+                self._boards[titles.board_id] = titles
+                self._boards.move_to_end(titles.board_id)
+            while len(self._boards) > self.max_boards:
+                self._boards.popitem(last=False)
+        return found + built
+
+    def apply(self, events: list) -> None:
+        """Post-commit hook: fold committed ChangeEvents into the boards they touch."""
+        with self._lock:
+            for event in sorted(events, key=lambda e: (e.board_id, e.revision, _ENTITY_ORDER.get(e.entity, 3))):
+                if event.entity == "board" and event.op == "deleted":
+                    self._boards.pop(event.board_id, None)
+                    continue
+                titles = self._boards.get(event.board_id)
+                # A gap means another process committed in between; the next read rebuilds
+                if titles is None or event.revision > titles.revision + 1:
+                    continue
+                if event.entity in _ENTITY_ORDER:
+                    titles.apply(event.entity, event.entity_id, event.op, event.data)
+                titles.revision = max(titles.revision, event.revision)
+
+    def suggest(self, db: Session, user: models.User, query: str, limit: int, board_id=None) -> list:
+        """The ``limit`` most recently changed (type, id, title, recency) items whose title has a word starting with ``query``."""
+        prefix = query.strip().lower()
+        if not prefix:
+            return []
+        boards = readable_boards(user).with_only_columns(models.Board.id, models.Board.revision)
+        if board_id:
+            boards = boards.where(models.Board.id == board_id)
+        revisions = {row.id: row.revision or 0 for row in db.execute(boards)}
+        found = []
+        for titles in self.titles(db, revisions):
+            with self._lock:
+                found.extend(titles.matches(prefix, limit))
+        # Ties on time go to the newest row
+        return heapq.nlargest(limit, found, key=lambda item: (item[3], item[1]))
+
+
+suggester = Suggester(max_boards=SUGGEST_MAX_BOARDS)
+on_changes_committed(suggester.apply)
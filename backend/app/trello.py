@@ -0,0 +1,187 @@
+# app/trello.py
+#
+# Imports a Trello board export (the JSON from Menu > Print and export) as a new board.
+# The upload is copied to disk and a "trello.import" job reads it back one top-level
+# array at a time: labels, then lists, cards and comments (commentCard actions), so
+# each child can be pointed at its parent's new id. ijson parses the arrays
+# incrementally, so the export is never held in memory whole. The staged file is
+# removed once the job has ended, whether it succeeded or failed for good.
+#
+# Rows are written IMPORT_BATCH at a time with ids allocated up front (from the
+# sequence on Postgres, above the current maximum on SQLite), so no row has to be
+# read back. Postgres gets each batch through COPY, SQLite through executemany. Closed
+# (archived) lists and cards are left out; Trello members don't map onto our users, so
+# comments are attributed to the importing user.
+import csv
+import io
+import os
+import uuid
+from datetime import datetime, timezone
+from typing import Optional
+import anyio
+import ijson
+from fastapi import UploadFile
+from sqlalchemy import func, insert, select, text
+from sqlalchemy.orm import Session
+from . import activity, jobs, labels, metrics, models, storage
+from .board_revisions import record_board_changes
+
+IMPORT_DIR = os.path.join(storage.UPLOAD_DIR, "imports")
+# Rows per COPY / executemany
+IMPORT_BATCH = int(os.getenv("IMPORT_BATCH", "5000"))
+
+
+async def stage(upload: UploadFile) -> str:
+    """Copy the uploaded export to IMPORT_DIR a chunk at a time; returns its path."""
+    await anyio.to_thread.run_sync(lambda: os.makedirs(IMPORT_DIR, exist_ok=True))
+    path = os.path.join(IMPORT_DIR, f"{uuid.uuid4().hex}.json")
+    with open(path, "wb") as f:
+        while chunk := await upload.read(storage.FILE_CHUNK_SIZE):
+            await anyio.to_thread.run_sync(f.write, chunk)
+    return path
+
+
+def _reader(path: str):
+    """``items(key)`` iterates the top-level array ``key``, ``name()`` is the board name."""
+    def items(key):
+        with open(path, "rb") as f:
+            yield from ijson.items(f, f"{key}.item")
+
+    def name():
+        with open(path, "rb") as f:
+            return next(ijson.items(f, "name"), None)
+    return items, name
+
+
+def _timestamp(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def _allocate_ids(db: Session, table, count: int) -> list:
+    """``count`` unused ids for ``table``; the board row already written holds SQLite's write lock."""
+    if db.get_bind().dialect.name == "postgresql":
+        return db.scalars(
+            text("SELECT nextval(pg_get_serial_sequence(:table, 'id')) FROM generate_series(1, :count)"),
+            {"table": table.name, "count": count},
+        ).all()
+    start = (db.scalar(select(func.max(table.c.id))) or 0) + 1
+    return list(range(start, start + count))
+
+
+def _write(db: Session, table, rows: list) -> None:
+    """Write ``rows`` (dicts with the same keys) to ``table`` in one round trip."""
+    if not rows:
+        return
+    if db.get_bind().dialect.name != "postgresql":
+        db.execute(insert(table), rows)
+        return
+    columns = list(rows[0])
+    buffer = io.StringIO()
+    # Strings are quoted and NULLs are not, which is how COPY's CSV format tells "" from NULL
+    writer = csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC)
+    for row in rows:
+        writer.writerow([row[name] for name in columns])
+    buffer.seek(0)
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+    finally:
+        cursor.close()
+
+
+def _batches(items):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= IMPORT_BATCH:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def import_board(ctx: jobs.JobContext, path: str, user_id: int) -> dict:
+    """Create a board from the export at ``path``; the caller commits."""
+    db = ctx.db
+    items, name = _reader(path)
+    board = models.Board(title=name() or "Imported board", owner_id=user_id)
+    db.add(board)
+    db.flush()
+    activity.record(db, board.id, user_id, models.ActivityType.BOARD_CREATED,
+                    f"Board '{board.title}' imported from Trello")
+    done = 0
+
+    palette = {}
+    for label in items("labels"):
+        palette[label["id"]] = (board.id, label.get("name") or "", label.get("color") or "")
+    label_ids = labels.ensure_labels(db, palette.values())
+    label_ids = {trello_id: label_ids[pair] for trello_id, pair in palette.items()}
+
+    # Lists are few; they are read in full to keep Trello's order
+    open_lists = sorted((l for l in items("lists") if not l.get("closed")), key=lambda l: float(l.get("pos") or 0))
+    list_ids = dict(zip((l["id"] for l in open_lists), _allocate_ids(db, models.List.__table__, len(open_lists))))
+    _write(db, models.List.__table__, [
+        {"id": list_ids[l["id"]], "board_id": board.id, "title": l.get("name") or ""} for l in open_lists
+    ])
+    done += len(open_lists)
+    ctx.progress(done)
+
+    card_ids = {}
+    cards = (c for c in items("cards") if not c.get("closed") and c.get("idList") in list_ids)
+    for batch in _batches(cards):
+        ids = _allocate_ids(db, models.Card.__table__, len(batch))
+        card_rows, card_labels = [], set()
+        for card, card_id in zip(batch, ids):
+            card_ids[card["id"]] = card_id
+            due = _timestamp(card.get("due"))
+            card_rows.append({
+                "id": card_id,
+                "list_id": list_ids[card["idList"]],
+                "title": card.get("name") or "",
+                "description": card.get("desc") or "",
+                # due_date has no time zone; it is stored in UTC
+                "due_date": due.astimezone(timezone.utc).replace(tzinfo=None) if due else None,
+            })
+            card_labels.update((card_id, label_ids[l]) for l in card.get("idLabels") or () if l in label_ids)
+        _write(db, models.Card.__table__, card_rows)
+        _write(db, models.CardLabel.__table__, [{"card_id": c, "label_id": l} for c, l in sorted(card_labels)])
+        done += len(batch)
+        ctx.progress(done)
+
+    comment_count = 0
+    comments = (
+        a for a in items("actions")
+        if a.get("type") == "commentCard" and ((a.get("data") or {}).get("card") or {}).get("id") in card_ids
+    )
+    for batch in _batches(comments):
+        _write(db, models.Comment.__table__, [{
+            "card_id": card_ids[a["data"]["card"]["id"]],
+            "user_id": user_id,
+            "content": a["data"].get("text") or "",
+            "created_at": _timestamp(a.get("date")) or datetime.now(timezone.utc),
+        } for a in batch])
+        comment_count += len(batch)
+        done += len(batch)
+        ctx.progress(done)
+
+    # Core inserts bypass the unit of work, so readers of the board are told here
+    record_board_changes(db, {board.id})
+    metrics.increment("trello.imports")
+    metrics.increment("trello.rows", done)
+    return {"board_id": board.id, "lists": len(open_lists), "cards": len(card_ids),
+            "labels": len(set(label_ids.values())), "comments": comment_count}
+
+
+def _discard_export(payload: dict) -> None:
+    try:
+        os.remove(payload["path"])
+    except FileNotFoundError:
+        pass
+
+
+@jobs.job("trello.import", concurrency=2, cleanup=_discard_export)
+def _import_job(ctx: jobs.JobContext) -> dict:
+    # One transaction, committed by the runner, so a failed attempt leaves nothing behind for the retry
+    return import_board(ctx, ctx.payload["path"], ctx.payload["user_id"])
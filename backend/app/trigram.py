@@ -0,0 +1,306 @@
+# app/trigram.py
+#
+# Optional in-memory trigram index over board, list and card text, answering
+# /search?match=substring (ILIKE '%q%') without going to the database. Whatever it
+# can't answer falls back to the same substring query in app/fulltext.py.
+# The index is partitioned by board. A partition is streamed in at startup or on first
+# use, kept current from the ChangeEvents of local commits, caught up from the change
+# log when another process wrote to its board, and evicted least recently used once
+# the index outgrows its memory cap.
+import asyncio
+import logging
+import os
+import threading
+from collections import OrderedDict, namedtuple
+from typing import Optional
+import anyio
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from . import changes, metrics, models
+from .board_revisions import on_changes_committed
+from .permissions import readable_boards
+
+logger = logging.getLogger(__name__)
+
+TRIGRAM_INDEX_ENABLED = os.getenv("TRIGRAM_INDEX_ENABLED", "false").lower() == "true"
+# Approximate bytes for the whole index, and for one board (bigger boards are searched in the database)
+TRIGRAM_INDEX_MAX_BYTES = int(os.getenv("TRIGRAM_INDEX_MAX_BYTES", str(256 * 1024 * 1024)))
+TRIGRAM_INDEX_MAX_BOARD_BYTES = int(os.getenv("TRIGRAM_INDEX_MAX_BOARD_BYTES", str(32 * 1024 * 1024)))
+# Rows fetched per round trip while streaming a board in
+TRIGRAM_LOAD_BATCH = 1000
+
+Hit = namedtuple("Hit", "type id title rank")
+
+_ENTITY_ORDER = {"board": 0, "list": 1, "card": 2}
+# Rough per-document and per-posting costs behind the memory estimate
+_DOC_BYTES = 200
+_POSTING_BYTES = 40
+
+
+def trigrams(text: str) -> set:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class BoardPartition:
+    """Documents and postings of one board, as of ``revision``."""
+
+    def __init__(self, board_id: int, revision: int):
+        self.board_id = board_id
+        self.revision = revision
+        self.docs = {}  # (entity, id) -> (title, description, lowercased searchable text)
+        self.postings = {}  # trigram -> {(entity, id)}
+        self.lists = set()
+        self.size = 0
+
+    @staticmethod
+    def _cost(text: str, grams: set) -> int:
+        return _DOC_BYTES + 2 * len(text) + _POSTING_BYTES * len(grams)
+
+    def put(self, entity: str, entity_id: int, title: Optional[str], description: Optional[str] = None) -> None:
+        self.remove(entity, entity_id)
+        key = (entity, entity_id)
+        text = (title or "").lower()
+        if description:
+            text = f"{text}\n{description.lower()}"
+        grams = trigrams(text)
+        self.docs[key] = (title or "", description, text)
+        for gram in grams:
+            self.postings.setdefault(gram, set()).add(key)
+        self.size += self._cost(text, grams)
+        if entity == "list":
+            self.lists.add(entity_id)
+
+    def remove(self, entity: str, entity_id: int) -> None:
+        key = (entity, entity_id)
+        doc = self.docs.pop(key, None)
+        if doc is None:
+            return
+        grams = trigrams(doc[2])
+        for gram in grams:
+            keys = self.postings[gram]
+            keys.discard(key)
+            if not keys:
+                del self.postings[gram]
+        self.size -= self._cost(doc[2], grams)
+        if entity == "list":
+            self.lists.discard(entity_id)
+
+    def apply(self, entity: str, entity_id: int, op: str, data: Optional[dict]) -> None:
+        if op == "deleted":
+            self.remove(entity, entity_id)
+            return
+        data = data or {}
+        # Rows that moved to another board leave this partition
+        if entity == "list" and data.get("board_id", self.board_id) != self.board_id:
+            self.remove(entity, entity_id)
+            return
+        if entity == "card" and "list_id" in data and data["list_id"] not in self.lists:
+            self.remove(entity, entity_id)
+            return
+        # Snapshots only carry loaded columns; keep what we had for the rest
+        title, description, _ = self.docs.get((entity, entity_id), (None, None, None))
+        self.put(entity, entity_id, data.get("title", title), data.get("description", description))
+
+    def search(self, needle: str):
+        if len(needle) < 3:
+            candidates = self.docs.keys()
+        else:
+            # Intersect the rarest postings first; every hit is then checked for the substring
+            postings = sorted((self.postings.get(gram, ()) for gram in trigrams(needle)), key=len)
+            if not postings[0]:
+                return []
+            candidates = set(postings[0]).intersection(*postings[1:])
+        hits = []
+        for key in candidates:
+            title, _, text = self.docs[key]
+            if needle not in text:
+                continue
+            folded_title = text.split("\n", 1)[0]
+            rank = 3 if folded_title.startswith(needle) else 2 if needle in folded_title else 1
+            hits.append(Hit(key[0], key[1], title, rank))
+        return hits
+
+
+class TrigramIndex:
+    def __init__(self, enabled: bool, max_bytes: int, max_board_bytes: int):
+        self.enabled = enabled
+        self.max_bytes = max_bytes
+        self.max_board_bytes = max_board_bytes
+        self.size = 0
+        self._partitions = OrderedDict()  # board id -> BoardPartition, least recently used first
+        self._oversized = {}  # board id -> revision at which it was too big to hold
+        self._lock = threading.RLock()
+        self._stopping = threading.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._partitions.clear()
+            self._oversized.clear()
+            self.size = 0
+
+    def load(self, db: Session, board: models.Board) -> Optional[BoardPartition]:
+        """Stream one board's text into a new partition; None if it is over the per-board cap."""
+        partition = BoardPartition(board.id, board.revision or 0)
+        partition.put("board", board.id, board.title)
+        queries = (
+            ("list", select(models.List.id, models.List.title).where(models.List.board_id == board.id)),
+            ("card", select(models.Card.id, models.Card.title, models.Card.description)
+             .join(models.List).where(models.List.board_id == board.id)),
+        )
+        for entity, query in queries:
+            result = db.execute(query.execution_options(yield_per=TRIGRAM_LOAD_BATCH))
+            try:
+                for row in result:
+                    partition.put(entity, row.id, row.title, getattr(row, "description", None))
+                    if partition.size > self.max_board_bytes:
+                        metrics.increment("trigram.oversized")
+                        return None
+            finally:
+                result.close()
+        metrics.increment("trigram.loads")
+        return partition
+
+    def _insert(self, partition: BoardPartition) -> None:
+        with self._lock:
+            previous = self._partitions.pop(partition.board_id, None)
+            if previous is not None:
+                self.size -= previous.size
+            self._partitions[partition.board_id] = partition
+            self.size += partition.size
+            self._evict()
+
+    def _evict(self) -> None:
+        # The most recently used partition always stays
+        while self.size > self.max_bytes and len(self._partitions) > 1:
+            _, victim = self._partitions.popitem(last=False)
+            self.size -= victim.size
+            metrics.increment("trigram.evictions")
+
+    def _catch_up(self, db: Session, partition: BoardPartition, board: models.Board) -> bool:
+        delta = changes.changes_since(db, board, partition.revision)
+        if delta["resync"]:
+            return False
+        with self._lock:
+            before = partition.size
+            for entity in _ENTITY_ORDER:
+                for item in delta["changed"].get(entity, []):
+                    partition.apply(entity, item["id"], "updated", item)
+                for entity_id in delta["deleted"].get(entity, []):
+                    partition.remove(entity, entity_id)
+            partition.revision = delta["revision"]
+            self.size += partition.size - before
+            self._evict()
+        return True
+
+    def partition(self, db: Session, board: models.Board) -> Optional[BoardPartition]:
+        """The up-to-date partition for ``board``, loading it if needed; None if it can't be held."""
+        revision = board.revision or 0
+        with self._lock:
+            partition = self._partitions.get(board.id)
+            if partition is not None:
+                self._partitions.move_to_end(board.id)
+        if partition is not None and partition.revision != revision:
+            # Behind means another process wrote; ahead only happens if the database was replaced
+            if partition.revision > revision or not self._catch_up(db, partition, board):
+                partition = None
+        if partition is None:
+            if self._oversized.get(board.id) == revision:
+                return None
+            partition = self.load(db, board)
+            if partition is None:
+                self._oversized[board.id] = revision
+                return None
+            self._insert(partition)
+        return partition
+
+    def search(self, db: Session, user: models.User, query: str, *, board_id: Optional[int] = None,
+               skip: int = 0, limit: int = 20) -> Optional[list]:
+        """Substring matches on ``user``'s boards, best first; None when the database has to answer."""
+        if not self.enabled:
+            return None
+        boards = readable_boards(user)
+        if board_id:
+            boards = boards.where(models.Board.id == board_id)
+        needle = query.lower()
+        hits = []
+        for board in db.scalars(boards):
+            partition = self.partition(db, board)
+            if partition is None:
+                metrics.increment("trigram.fallbacks")
+                return None
+            with self._lock:
+                hits.extend(partition.search(needle))
+        metrics.increment("trigram.queries")
+        hits.sort(key=lambda hit: (-hit.rank, _ENTITY_ORDER[hit.type], hit.id))
+        return hits[skip:skip + limit]
+
+    def apply(self, events: list) -> None:
+        """Post-commit hook: fold committed ChangeEvents into the partitions they touch."""
+        if not self.enabled:
+            return
+        with self._lock:
+            for event in sorted(events, key=lambda e: (e.board_id, e.revision, _ENTITY_ORDER.get(e.entity, 3))):
+                if event.entity == "board" and event.op == "deleted":
+                    dropped = self._partitions.pop(event.board_id, None)
+                    if dropped is not None:
+                        self.size -= dropped.size
+                    continue
+                partition = self._partitions.get(event.board_id)
+                # A gap means another process committed in between; the next read catches up
+                if partition is None or event.revision > partition.revision + 1:
+                    continue
+                before = partition.size
+                if event.entity in _ENTITY_ORDER:
+                    partition.apply(event.entity, event.entity_id, event.op, event.data)
+                partition.revision = max(partition.revision, event.revision)
+                self.size += partition.size - before
+            self._evict()
+
+    def warm(self, session_factory) -> int:
+        """Load the most recently active boards until the index is full; returns boards loaded."""
+        loaded = 0
+        with session_factory() as db:
+            boards = select(models.Board).where(models.Board.deleted_at.is_(None)).order_by(models.Board.revision.desc(), models.Board.id.desc())
+            for board in db.scalars(boards.execution_options(yield_per=TRIGRAM_LOAD_BATCH)):
+                if self._stopping.is_set() or self.size >= self.max_bytes:
+                    break
+                with self._lock:
+                    if board.id in self._partitions:
+                        continue
+                # A separate session, so the board cursor stays open while each board streams in
+                with session_factory() as board_db:
+                    partition = self.load(board_db, board)
+                if partition is None:
+                    self._oversized[board.id] = board.revision or 0
+                    continue
+                if self.size + partition.size > self.max_bytes:
+                    break
+                self._insert(partition)
+                loaded += 1
+        return loaded
+
+    async def start(self, session_factory) -> None:
+        self._stopping.clear()
+        self._task = asyncio.create_task(self._warm_in_background(session_factory))
+
+    async def _warm_in_background(self, session_factory) -> None:
+        try:
+            loaded = await anyio.to_thread.run_sync(self.warm, session_factory)
+            logger.info("Trigram index loaded %d boards (~%d bytes)", loaded, self.size)
+        except Exception:
+            logger.exception("Trigram index warm-up failed; boards will load on first search")
+
+    async def stop(self) -> None:
+        self._stopping.set()
+        if self._task is not None:
+            await self._task
+        self._task = None
+
+
+index = TrigramIndex(
+    enabled=TRIGRAM_INDEX_ENABLED,
+    max_bytes=TRIGRAM_INDEX_MAX_BYTES,
+    max_board_bytes=TRIGRAM_INDEX_MAX_BOARD_BYTES,
+)
+on_changes_committed(index.apply)
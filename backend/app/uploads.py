@@ -0,0 +1,127 @@
+# app/uploads.py
+#
+# Attachments, uploaded in one request or resumably. A resumable upload starts with
+# POST /cards/{card_id}/uploads, declaring the file's name and size, and is then sent
+# in any number of PATCH /uploads/{id} requests, each carrying an Upload-Offset header
+# and the bytes from that offset on. An interrupted client asks GET /uploads/{id} for
+# the offset reached and carries on from there. The request that reaches the declared
+# size turns the upload into an attachment. Unfinished uploads expire after
+# UPLOAD_SESSION_TTL seconds.
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+import anyio
+from fastapi import status
+from sqlalchemy import or_, select, update
+from sqlalchemy.orm import Session
+from . import activity, archive, metrics, models, schemas, storage
+from .exceptions import CustomException, NotFoundException
+
+UPLOAD_SESSION_TTL = int(os.getenv("UPLOAD_SESSION_TTL", str(24 * 60 * 60)))
+# How long one PATCH may hold an upload before another can take it over
+UPLOAD_WRITE_LEASE = int(os.getenv("UPLOAD_WRITE_LEASE", str(60 * 60)))
+# Expired uploads cleared out each time a new one starts
+EXPIRED_SWEEP_LIMIT = 100
+
+
+def attach(db: Session, card: models.Card, user: models.User, filename: str,
+           content_type: Optional[str], stored: storage.StoredFile) -> models.Attachment:
+    """Add a stored file to ``card``; the caller commits."""
+    db_attachment = models.Attachment(
+        filename=filename, file_path=stored.path, sha256=stored.sha256, size=stored.size,
+        content_type=content_type, card_id=card.id,
+    )
+    db.add(db_attachment)
+    activity.record(db, card.list.board_id, user.id, models.ActivityType.ATTACHMENT_ADDED, f"File '{filename}' attached to card '{card.title}'")
+    metrics.increment("attachments.bytes", stored.size)
+    return db_attachment
+
+
+def _sweep_expired(db: Session) -> None:
+    expired = db.scalars(
+        select(models.UploadSession)
+        .where(models.UploadSession.expires_at < datetime.now(timezone.utc))
+        .limit(EXPIRED_SWEEP_LIMIT)
+    ).all()
+    for upload in expired:
+        storage.discard_part(upload.id)
+        db.delete(upload)
+
+
+def begin(db: Session, card: models.Card, user: models.User, upload: schemas.UploadSessionCreate) -> models.UploadSession:
+    """Start a resumable upload to ``card``; the caller commits."""
+    if upload.size > storage.MAX_UPLOAD_BYTES:
+        raise storage.too_large()
+    _sweep_expired(db)
+    db_upload = models.UploadSession(
+        id=uuid.uuid4().hex, card_id=card.id, user_id=user.id, filename=upload.filename,
+        content_type=upload.content_type, size=upload.size, offset=0,
+        expires_at=datetime.now(timezone.utc) + timedelta(seconds=UPLOAD_SESSION_TTL),
+    )
+    db.add(db_upload)
+    return db_upload
+
+
+def get_upload(db: Session, upload_id: str, user: models.User) -> models.UploadSession:
+    db_upload = db.get(models.UploadSession, upload_id)
+    if db_upload is None or db_upload.user_id != user.id:
+        raise NotFoundException(detail="Upload not found")
+    expires_at = db_upload.expires_at
+    # SQLite hands back naive datetimes
+    if expires_at.tzinfo is None:
+        expires_at = expires_at.replace(tzinfo=timezone.utc)
+    if expires_at < datetime.now(timezone.utc):
+        raise NotFoundException(detail="Upload not found")
+    return db_upload
+
+
+async def append(db: Session, db_upload: models.UploadSession, offset: int, chunks,
+                 user: models.User) -> Optional[models.Attachment]:
+    """Add the bytes of one PATCH and commit; returns the attachment once the upload is complete.
+
+    The upload is claimed at ``offset`` in its own transaction before anything is
+    written, so of two requests sending the same bytes only one writes; the other gets 409.
+    """
+    now = datetime.now(timezone.utc)
+    sessions = models.UploadSession
+    claimed = db.execute(
+        update(sessions)
+        .where(sessions.id == db_upload.id, sessions.offset == offset,
+               or_(sessions.locked_until.is_(None), sessions.locked_until < now))
+        .values(locked_until=now + timedelta(seconds=UPLOAD_WRITE_LEASE))
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.commit()
+    if not claimed:
+        db.refresh(db_upload)
+        if db_upload.offset != offset:
+            raise CustomException(detail=f"Upload is at offset {db_upload.offset}", status_code=status.HTTP_409_CONFLICT)
+        raise CustomException(detail="Another request is writing to this upload", status_code=status.HTTP_409_CONFLICT)
+
+    try:
+        new_offset = await storage.append_part(db_upload.id, offset, db_upload.size, chunks)
+    except BaseException:
+        db.rollback()
+        db.execute(update(sessions).where(sessions.id == db_upload.id).values(locked_until=None))
+        db.commit()
+        raise
+    db_upload.offset, db_upload.locked_until = new_offset, None
+    if new_offset < db_upload.size:
+        db.commit()
+        return None
+
+    stored = await storage.store_part(db_upload.id)
+    await anyio.to_thread.run_sync(archive.ensure_rows_live, db, models.Card, [db_upload.card_id])
+    card = db.get(models.Card, db_upload.card_id)
+    db_attachment = attach(db, card, user, db_upload.filename, db_upload.content_type, stored)
+    db.delete(db_upload)
+    db.commit()
+    db.refresh(db_attachment)
+    return db_attachment
+
+
+def cancel(db: Session, db_upload: models.UploadSession) -> None:
+    storage.discard_part(db_upload.id)
+    db.delete(db_upload)
+    db.commit()
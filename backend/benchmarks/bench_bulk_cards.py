@@ -0,0 +1,116 @@
+# benchmarks/bench_bulk_cards.py
+#
+# Compares card writes one row at a time (the old /cards/batch loop: an access query,
+# an INSERT and a refresh per card) with the set-based functions in app.bulk, at 10,
+# 100 and 1000 cards. Run from the backend directory:
+#
+#     python -m benchmarks.bench_bulk_cards
+#
+# BENCH_DATABASE_URL points it at a real server (e.g. Postgres), where the round trips
+# saved matter far more than on the default SQLite file.
+import os
+import tempfile
+import time
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app import bulk, models, schemas
+from app.database import Base
+
+SIZES = (10, 100, 1000)
+
+
+def setup(engine):
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    with sessionmaker(bind=engine)() as db:
+        user = models.User(username="bench", email="bench@example.com", hashed_password="x")
+        db.add(user)
+        db.flush()
+        board = models.Board(title="Bench", owner_id=user.id)
+        db.add(board)
+        db.flush()
+        lists = [models.List(title=f"List {i}", board_id=board.id) for i in range(2)]
+        db.add_all(lists)
+        db.commit()
+        return user.id, [item.id for item in lists]
+
+
+def create_one_by_one(db, user, items):
+    created = []
+    for item in items:
+        db.query(models.List).join(models.Board).filter(
+            models.List.id == item.list_id,
+            models.Board.owner_id == user.id
+        ).first()
+        card = models.Card(**item.model_dump())
+        db.add(card)
+        created.append(card)
+    db.commit()
+    for card in created:
+        db.refresh(card)
+    return created
+
+
+def move_one_by_one(db, user, cards, list_id):
+    for card in cards:
+        db.query(models.Board).join(models.List).filter(models.List.id == card.list_id).first()
+        db.query(models.List).filter(models.List.id == list_id).first()
+        card.list_id = list_id
+        db.commit()
+        db.refresh(card)
+
+
+def delete_one_by_one(db, user, cards):
+    for card in cards:
+        db.delete(db.query(models.Card).filter(models.Card.id == card.id).first())
+        db.commit()
+
+
+def timed(func):
+    started = time.perf_counter()
+    result = func()
+    return result, (time.perf_counter() - started) * 1000
+
+
+def main():
+    url = os.getenv("BENCH_DATABASE_URL")
+    if url is None:
+        path = os.path.join(tempfile.mkdtemp(), "bench.db")
+        url = f"sqlite:///{path}"
+    engine = create_engine(url)
+    Session = sessionmaker(bind=engine)
+
+    print(f"{'cards':>6} {'op':>8} {'one-by-one ms':>14} {'bulk ms':>10} {'speedup':>8}")
+    for size in SIZES:
+        user_id, (first_list, second_list) = setup(engine)
+        items = [schemas.CardCreate(title=f"Card {i}", list_id=first_list) for i in range(size)]
+
+        with Session() as db:
+            user = db.get(models.User, user_id)
+            cards, slow_create = timed(lambda: create_one_by_one(db, user, items))
+            _, slow_move = timed(lambda: move_one_by_one(db, user, cards, second_list))
+            _, slow_delete = timed(lambda: delete_one_by_one(db, user, cards))
+
+        with Session() as db:
+            user = db.get(models.User, user_id)
+
+            def create():
+                created = bulk.create_cards(db, items, user)
+                db.commit()
+                return [card.id for card in created]
+
+            ids, fast_create = timed(create)
+            moves = [schemas.CardBatchMove(card_id=card_id, list_id=second_list) for card_id in ids]
+            _, fast_move = timed(lambda: (bulk.move_cards(db, moves, user), db.commit()))
+            _, fast_delete = timed(lambda: (bulk.delete_cards(db, ids, user), db.commit()))
+
+        for op, slow, fast in (
+            ("create", slow_create, fast_create),
+            ("move", slow_move, fast_move),
+            ("delete", slow_delete, fast_delete),
+        ):
+            print(f"{size:>6} {op:>8} {slow:>14.1f} {fast:>10.1f} {slow / fast:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
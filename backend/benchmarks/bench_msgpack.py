@@ -0,0 +1,61 @@
+# benchmarks/bench_msgpack.py
+#
+# Compares JSON and MessagePack for board card payloads: encode time, decode time
+# and bytes on the wire. Run from the backend directory:
+#
+#     python -m benchmarks.bench_msgpack
+import json
+import timeit
+from datetime import datetime, timedelta, timezone
+import msgpack
+from app import schemas
+from app.negotiation import packb
+
+SIZES = (10, 100, 1000, 5000)
+REPEAT = 5
+
+
+def make_cards(count):
+    now = datetime.now(timezone.utc)
+    return [
+        schemas.Card(
+            id=i,
+            title=f"Card {i}: follow up with the design team",
+            description="Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 4,
+            list_id=i % 12 + 1,
+            due_date=now + timedelta(days=i % 30),
+            created_at=now,
+            updated_at=now,
+        )
+        for i in range(count)
+    ]
+
+
+def json_dumps(content):
+    # Same settings as starlette's JSONResponse.render
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def best_of(func, number):
+    return min(timeit.repeat(func, number=number, repeat=REPEAT)) / number * 1000
+
+
+def main():
+    print(f"{'cards':>6} {'format':>8} {'bytes':>10} {'encode ms':>10} {'decode ms':>10}")
+    for size in SIZES:
+        # Both encoders receive the JSON-mode dicts FastAPI produces from the response model
+        content = [card.model_dump(mode="json") for card in make_cards(size)]
+        number = max(1, 2000 // size)
+
+        json_body = json_dumps(content)
+        msgpack_body = packb(content)
+        rows = (
+            ("json", json_body, lambda: json_dumps(content), lambda: json.loads(json_body)),
+            ("msgpack", msgpack_body, lambda: packb(content), lambda: msgpack.unpackb(msgpack_body)),
+        )
+        for name, body, encode, decode in rows:
+            print(f"{size:>6} {name:>8} {len(body):>10} {best_of(encode, number):>10.3f} {best_of(decode, number):>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# benchmarks/bench_suggest.py
+#
+# Latency of the /search/suggest lookup (app.suggest) for a user with many cards, one
+# query per keystroke of a few typical words. The first keystroke after a write pays
+# for a rebuild; the rest hit the per-board arrays. Run from the backend directory:
+#
+#     python -m benchmarks.bench_suggest
+#
+# BENCH_DATABASE_URL points it at a real server (e.g. Postgres).
+import os
+import random
+import tempfile
+import time
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+from app import models
+from app.database import Base
+from app.suggest import Suggester
+
+BOARDS = 20
+CARDS_PER_BOARD = 2000
+WORDS = ["release", "design", "review", "bug", "deploy", "invoice", "customer", "migration", "planning", "retro"]
+QUERIES = ["r", "re", "rel", "rele", "d", "de", "des", "cu", "cus", "mig", "migr", "pla", "plan"]
+
+
+def setup(engine):
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    rng = random.Random(1)
+    with sessionmaker(bind=engine)() as db:
+        user = models.User(username="bench", email="bench@example.com", hashed_password="x")
+        db.add(user)
+        db.flush()
+        for b in range(BOARDS):
+            board = models.Board(title=f"Board {b}", owner_id=user.id)
+            db.add(board)
+            db.flush()
+            board_list = models.List(title="Backlog", board_id=board.id)
+            db.add(board_list)
+            db.flush()
+            db.execute(insert(models.Card), [
+                {"title": " ".join(rng.sample(WORDS, 3)) + f" {i}", "list_id": board_list.id}
+                for i in range(CARDS_PER_BOARD)
+            ])
+        db.commit()
+        return user.id
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def main():
+    url = os.getenv("BENCH_DATABASE_URL")
+    if url is None:
+        url = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    engine = create_engine(url)
+    user_id = setup(engine)
+    suggester = Suggester(max_boards=1024)
+
+    with sessionmaker(bind=engine)() as db:
+        user = db.get(models.User, user_id)
+        started = time.perf_counter()
+        suggester.suggest(db, user, "warm", 10)
+        cold = (time.perf_counter() - started) * 1000
+
+        samples = []
+        for _ in range(50):
+            for query in QUERIES:
+                started = time.perf_counter()
+                suggester.suggest(db, user, query, 10)
+                samples.append((time.perf_counter() - started) * 1000)
+
+    print(f"{BOARDS * CARDS_PER_BOARD} cards on {BOARDS} boards")
+    print(f"first call (builds every board): {cold:.1f} ms")
+    print(f"keystrokes: p50 {percentile(samples, 0.5):.2f} ms, p99 {percentile(samples, 0.99):.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+# test_activity.py
+
+import asyncio
+from datetime import datetime, timezone
+from sqlalchemy import create_engine, delete, insert, select, func
+from sqlalchemy.pool import StaticPool
+from app import models
+from app.activity import ActivityBatcher
+from app.database import Base, enable_sqlite_foreign_keys
+
+
+def make_engine():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    enable_sqlite_foreign_keys(engine)
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        connection.execute(insert(models.User.__table__), [{"id": 1, "username": "u", "email": "u@example.com", "hashed_password": "x"}])
+        connection.execute(insert(models.Board.__table__), [{"id": 1, "title": "One", "owner_id": 1},
+                                                            {"id": 2, "title": "Two", "owner_id": 1}])
+    return engine
+
+
+def rows(count, board_id=1):
+    return [
+        {
+            "board_id": board_id,
+            "user_id": 1,
+            "activity_type": models.ActivityType.CARD_CREATED.value,
+            "details": f"Card {i} created",
+            "created_at": datetime.now(timezone.utc),
+        }
+        for i in range(count)
+    ]
+
+
+def count_activity(engine):
+    with engine.connect() as connection:
+        return connection.execute(select(func.count()).select_from(models.Activity)).scalar()
+
+
+def test_batcher_flushes_in_chunks_and_drains_on_stop():
+    engine = make_engine()
+
+    async def scenario():
+        batcher = ActivityBatcher(interval=60, max_batch=4)
+        await batcher.start()
+        batcher.enqueue(engine, rows(3))
+        await asyncio.sleep(0.05)
+        # Below max_batch and well inside the interval: nothing written yet
+        before_stop = count_activity(engine)
+        batcher.enqueue(engine, rows(6))
+        await batcher.stop()
+        return before_stop
+
+    assert asyncio.run(scenario()) == 0
+    assert count_activity(engine) == 9
+
+
+def test_batcher_writes_directly_when_not_started():
+    engine = make_engine()
+    ActivityBatcher(interval=60, max_batch=100).enqueue(engine, rows(2))
+    assert count_activity(engine) == 2
+
+
+def test_batcher_leaves_out_rows_of_deleted_boards():
+    engine = make_engine()
+
+    async def scenario():
+        batcher = ActivityBatcher(interval=60, max_batch=100)
+        await batcher.start()
+        batcher.enqueue(engine, rows(2) + rows(3, board_id=2))
+        with engine.begin() as connection:
+            connection.execute(delete(models.Board.__table__).where(models.Board.id == 2))
+        await batcher.stop()
+
+    asyncio.run(scenario())
+    # Board 2's rows would fail the foreign key; board 1's are still written
+    with engine.connect() as connection:
+        assert connection.scalars(select(models.Activity.board_id)).all() == [1, 1]
@@ -0,0 +1,42 @@
+# tests/test_cache.py
+import time
+from app.cache import LocalLRU
+
+
+def test_local_lru_evicts_oldest_entry():
+    cache = LocalLRU(max_entries=2)
+    cache.set("board:1:0:a", [1], board_id=1, ttl=60)
+    cache.set("board:1:0:b", [2], board_id=1, ttl=60)
+    assert cache.get("board:1:0:a") == [1]
+    cache.set("board:2:0:a", [3], board_id=2, ttl=60)
+    assert cache.get("board:1:0:b") is None
+    assert len(cache) == 2
+
+
+def test_local_lru_invalidates_by_board_tag():
+    cache = LocalLRU(max_entries=10)
+    cache.set("board:1:0:a", [], board_id=1, ttl=60)
+    cache.set("board:1:0:b", {}, board_id=1, ttl=60)
+    cache.set("board:2:0:a", [], board_id=2, ttl=60)
+    assert cache.invalidate(1) == 2
+    assert cache.get("board:1:0:a") is None
+    assert cache.get("board:2:0:a") == []
+
+
+def test_local_lru_expires_entries():
+    cache = LocalLRU(max_entries=10)
+    cache.set("board:1:0:a", [1], board_id=1, ttl=0)
+    time.sleep(0.001)
+    assert cache.get("board:1:0:a") is None
+
+
+def test_local_lru_encodings_belong_to_their_entry():
+    cache = LocalLRU(max_entries=10)
+    cache.set("board:1:0:a", [1], board_id=1, ttl=60)
+    cache.encodings("board:1:0:a")[("application/json", "gzip")] = b"encoded"
+    assert cache.encodings("board:1:0:a") == {("application/json", "gzip"): b"encoded"}
+    # A new value starts without encodings, and invalidation takes them along
+    cache.set("board:1:0:a", [2], board_id=1, ttl=60)
+    assert cache.encodings("board:1:0:a") == {}
+    cache.invalidate(1)
+    assert cache.encodings("board:1:0:a") is None
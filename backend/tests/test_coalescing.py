@@ -0,0 +1,40 @@
+# tests/test_coalescing.py
+import asyncio
+from app import metrics
+from app.coalescing import SingleFlight
+
+
+def test_single_flight_shares_concurrent_calls():
+    flight = SingleFlight("test_flight")
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"cards": 3}
+
+    async def main():
+        return await asyncio.gather(*(flight.do("board-1", compute) for _ in range(5)))
+
+    results = asyncio.run(main())
+    assert results == [{"cards": 3}] * 5
+    assert len(calls) == 1
+    counters = metrics.snapshot()
+    assert counters["test_flight.executed"] == 1
+    assert counters["test_flight.collapsed"] == 4
+
+
+def test_single_flight_propagates_errors_and_forgets_key():
+    flight = SingleFlight("test_flight_errors")
+
+    async def fail():
+        await asyncio.sleep(0)
+        raise ValueError("boom")
+
+    async def main():
+        results = await asyncio.gather(flight.do("k", fail), flight.do("k", fail), return_exceptions=True)
+        assert all(isinstance(result, ValueError) for result in results)
+        # The failed flight is not remembered
+        return await flight.do("k", lambda: asyncio.sleep(0, result="ok"))
+
+    assert asyncio.run(main()) == "ok"
@@ -0,0 +1,39 @@
+# tests/test_compression.py
+import gzip
+from app.compression import CompressedCache, CpuBudget, available_codecs, choose_encoding
+
+
+def test_choose_encoding_respects_quality_and_preference():
+    codecs = available_codecs()
+    assert choose_encoding("gzip", codecs).name == "gzip"
+    assert choose_encoding("identity", codecs) is None
+    assert choose_encoding("gzip;q=0", codecs) is None
+    assert choose_encoding("gzip;q=1, br;q=0.5", codecs).name == "gzip"
+    assert choose_encoding("*", codecs).name == next(iter(codecs))
+
+
+def test_gzip_codec_round_trip():
+    codec = available_codecs()["gzip"]
+    body = b'{"title":"Card"},' * 500
+    assert gzip.decompress(codec.compress(body, codec.level)) == body
+
+    stream = codec.stream(codec.fast_level)
+    data = stream.chunk(body[:100]) + stream.chunk(body[100:]) + stream.finish()
+    assert gzip.decompress(data) == body
+
+
+def test_cpu_budget_drains_and_refills():
+    budget = CpuBudget(seconds_per_second=1000.0)
+    budget.charge(budget.capacity * 2)
+    assert budget.available() < budget.capacity
+
+
+def test_compressed_cache_evicts_least_recently_used():
+    cache = CompressedCache(max_bytes=10)
+    cache.put("a", b"12345")
+    cache.put("b", b"12345")
+    assert cache.get("a") == b"12345"
+    cache.put("c", b"12345")
+    assert cache.get("b") is None
+    assert cache.get("a") == b"12345"
+    assert cache.size == 10
@@ -0,0 +1,86 @@
+# test_idempotency.py
+
+import asyncio
+import json
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app import idempotency
+from app.database import Base
+from app.idempotency import DatabaseStore, IdempotencyMiddleware
+
+
+def make_store(path):
+    # A file, so each worker thread gets its own connection
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    return DatabaseStore(sessionmaker(bind=engine))
+
+
+async def call(app, key, body=b'{"title": "x"}'):
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": "/cards/",
+        "headers": [(b"idempotency-key", key.encode()), (b"content-type", b"application/json")],
+    }
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    await app(scope, receive, send)
+    start = next(m for m in messages if m["type"] == "http.response.start")
+    return start["status"], dict(start["headers"]), b"".join(m.get("body", b"") for m in messages[1:])
+
+
+def test_concurrent_duplicates_wait_for_the_first_request(tmp_path):
+    calls = []
+
+    async def slow_create(scope, receive, send):
+        await receive()
+        calls.append(scope["path"])
+        await asyncio.sleep(0.2)
+        body = json.dumps({"id": len(calls)}).encode()
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": body})
+
+    async def scenario():
+        idempotency.configure(make_store(tmp_path / "keys.db"))
+        app = IdempotencyMiddleware(slow_create)
+        return await asyncio.gather(*(call(app, "same") for _ in range(3)))
+
+    previous = idempotency.store
+    try:
+        results = asyncio.run(scenario())
+    finally:
+        idempotency.configure(previous)
+
+    assert len(calls) == 1
+    assert {body for _, _, body in results} == {b'{"id": 1}'}
+    assert sum(1 for _, headers, _ in results if headers.get(b"idempotent-replayed") == b"true") == 2
+
+
+def test_failed_first_request_releases_the_key(tmp_path):
+    statuses = iter([500, 201])
+
+    async def flaky(scope, receive, send):
+        await receive()
+        await send({"type": "http.response.start", "status": next(statuses), "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def scenario():
+        idempotency.configure(make_store(tmp_path / "keys.db"))
+        app = IdempotencyMiddleware(flaky)
+        return [await call(app, "retry") for _ in range(3)]
+
+    previous = idempotency.store
+    try:
+        results = asyncio.run(scenario())
+    finally:
+        idempotency.configure(previous)
+
+    assert [status for status, _, _ in results] == [500, 201, 201]
+    assert results[2][1].get(b"idempotent-replayed") == b"true"
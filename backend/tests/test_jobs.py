@@ -0,0 +1,186 @@
+# test_jobs.py
+
+import asyncio
+import threading
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import create_engine, update
+from sqlalchemy.orm import sessionmaker
+from app import jobs, models
+from app.database import Base
+
+attempts = []
+running = []
+peak = []
+release = threading.Event()
+
+
+@jobs.job("test.flaky", max_attempts=3)
+def flaky(ctx):
+    attempts.append(ctx.payload["n"])
+    if len(attempts) < ctx.payload["fail_times"] + 1:
+        raise RuntimeError("not yet")
+    ctx.progress(1, 1)
+    return {"attempts": len(attempts)}
+
+
+@jobs.job("test.slow", concurrency=2)
+def slow(ctx):
+    running.append(ctx.job_id)
+    peak.append(len(running))
+    release.wait(5)
+    running.remove(ctx.job_id)
+
+
+@jobs.job("test.writes")
+def writes(ctx):
+    if ctx.payload.get("reclaimed"):
+        # Another runner takes the job over once this run's lease has lapsed
+        with ctx.payload["sessions"]() as db:
+            db.execute(update(models.Job).where(models.Job.id == ctx.job_id).values(attempts=models.Job.attempts + 1))
+            db.commit()
+    ctx.db.add(models.User(username=ctx.payload["username"], email=f"{ctx.payload['username']}@example.com", hashed_password="x"))
+    ctx.db.flush()
+    ctx.progress(1, 1)
+
+
+def make_sessions(path):
+    # A file, so the runner's worker threads get their own connections
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)
+
+
+def enqueue(sessions, name, payload):
+    with sessions() as db:
+        job_id = jobs.enqueue(db, name, payload).id
+        db.commit()
+    return job_id
+
+
+def test_failed_job_is_retried_after_backoff(tmp_path, monkeypatch):
+    sessions = make_sessions(tmp_path / "jobs.db")
+    attempts.clear()
+    monkeypatch.setattr(jobs, "JOB_RETRY_BACKOFF", 0)
+    job_id = enqueue(sessions, "test.flaky", {"n": 1, "fail_times": 1})
+
+    assert jobs.runner.run_pending(sessions) == 2
+    with sessions() as db:
+        job = db.get(models.Job, job_id)
+        assert job.status == models.JobStatus.SUCCEEDED
+        assert (job.attempts, job.result, job.error) == (2, {"attempts": 2}, None)
+        assert (job.progress_done, job.progress_total) == (1, 1)
+
+
+def test_job_fails_after_max_attempts(tmp_path, monkeypatch):
+    sessions = make_sessions(tmp_path / "jobs.db")
+    attempts.clear()
+    monkeypatch.setattr(jobs, "JOB_RETRY_BACKOFF", 3600)
+    job_id = enqueue(sessions, "test.flaky", {"n": 1, "fail_times": 5})
+
+    # The retry waits out its backoff
+    assert jobs.runner.run_pending(sessions) == 1
+    with sessions() as db:
+        db.execute(update(models.Job).values(run_after=datetime.now(timezone.utc) - timedelta(seconds=1)))
+        db.commit()
+    assert jobs.runner.run_pending(sessions) == 1
+    with sessions() as db:
+        db.execute(update(models.Job).values(run_after=datetime.now(timezone.utc) - timedelta(seconds=1)))
+        db.commit()
+    assert jobs.runner.run_pending(sessions) == 1
+    with sessions() as db:
+        job = db.get(models.Job, job_id)
+        assert (job.status, job.attempts) == (models.JobStatus.FAILED, 3)
+        assert job.error == "RuntimeError: not yet"
+    assert jobs.runner.run_pending(sessions) == 0
+
+
+def test_expired_lease_is_claimed_again(tmp_path):
+    sessions = make_sessions(tmp_path / "jobs.db")
+    job_id = enqueue(sessions, "test.flaky", {"n": 1, "fail_times": 0})
+    assert jobs.claim(sessions, ["test.flaky"])[0] == job_id
+    # Running and leased: nobody else gets it
+    assert jobs.claim(sessions, ["test.flaky"]) is None
+
+    with sessions() as db:
+        db.execute(update(models.Job).values(locked_until=datetime.now(timezone.utc) - timedelta(seconds=1)))
+        db.commit()
+    assert jobs.claim(sessions, ["test.flaky"])[0] == job_id
+
+
+def test_runner_respects_per_type_concurrency(tmp_path):
+    sessions = make_sessions(tmp_path / "jobs.db")
+    running.clear()
+    peak.clear()
+    release.clear()
+    job_ids = [enqueue(sessions, "test.slow", {}) for _ in range(4)]
+    runner = jobs.JobRunner(poll_interval=0.01)
+
+    async def scenario():
+        await runner.start(sessions)
+        await asyncio.sleep(0.3)
+        release.set()
+        for _ in range(100):
+            with sessions() as db:
+                if all(db.get(models.Job, job_id).status == models.JobStatus.SUCCEEDED for job_id in job_ids):
+                    break
+            await asyncio.sleep(0.05)
+        await runner.stop()
+
+    asyncio.run(scenario())
+    assert max(peak) == 2
+    with sessions() as db:
+        assert {db.get(models.Job, job_id).status for job_id in job_ids} == {models.JobStatus.SUCCEEDED}
+
+
+def test_progress_after_writes_does_not_lock_or_commit_the_handler(tmp_path):
+    sessions = make_sessions(tmp_path / "jobs.db")
+    job_id = enqueue(sessions, "test.writes", {"username": "written"})
+
+    assert jobs.runner.run_pending(sessions) == 1
+    with sessions() as db:
+        job = db.get(models.Job, job_id)
+        assert (job.status, job.progress_done, job.progress_total) == (models.JobStatus.SUCCEEDED, 1, 1)
+        assert db.query(models.User).filter(models.User.username == "written").count() == 1
+
+
+def test_superseded_run_discards_its_work(tmp_path):
+    sessions = make_sessions(tmp_path / "jobs.db")
+    job_id = enqueue(sessions, "test.writes", {"username": "twice"})
+    claimed = jobs.claim(sessions, ["test.writes"])
+    payload = {**claimed[2], "reclaimed": True, "sessions": sessions}
+
+    assert jobs.execute(sessions, job_id, "test.writes", payload, claimed[3]) is False
+    with sessions() as db:
+        job = db.get(models.Job, job_id)
+        # Left to the run holding the newer claim
+        assert (job.status, job.attempts) == (models.JobStatus.RUNNING, 2)
+        assert db.query(models.User).filter(models.User.username == "twice").count() == 0
+
+
+def test_heartbeat_renews_the_lease_and_writes_progress(tmp_path, monkeypatch):
+    sessions = make_sessions(tmp_path / "jobs.db")
+    monkeypatch.setattr(jobs, "JOB_HEARTBEAT_SECONDS", 0.02)
+    monkeypatch.setattr(jobs, "JOB_LEASE_SECONDS", 3600)
+    job_id = enqueue(sessions, "test.flaky", {"n": 1, "fail_times": 0})
+    claimed = jobs.claim(sessions, ["test.flaky"])
+    with sessions() as db:
+        db.execute(update(models.Job).values(locked_until=datetime.now(timezone.utc)))
+        db.commit()
+
+    # A handler that reports progress but never commits
+    ctx = jobs.JobContext(job_id, claimed[2], None)
+    ctx.progress(3, 10)
+    heartbeat = jobs._Heartbeat(sessions, ctx, claimed[3])
+    heartbeat.start()
+    try:
+        for _ in range(100):
+            with sessions() as db:
+                job = db.get(models.Job, job_id)
+                if job.progress_done == 3:
+                    break
+            threading.Event().wait(0.02)
+    finally:
+        heartbeat.stop()
+    lease = job.locked_until if job.locked_until.tzinfo else job.locked_until.replace(tzinfo=timezone.utc)
+    assert (job.progress_done, job.progress_total) == (3, 10)
+    assert lease > datetime.now(timezone.utc) + timedelta(minutes=30)
@@ -2,18 +2,29 @@
 
 import pytest
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, update
 from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.pool import StaticPool
 from fastapi import FastAPI, Depends, HTTPException
+from fastapi.requests import HTTPConnection
+from starlette.websockets import WebSocketDisconnect
 from app.main import app, lifespan
-from app.database import Base, get_db
+from app.database import Base, get_db, shared_session, enable_sqlite_foreign_keys
 from app.auth import create_access_token
-from app import models, auth
+from app import models, archive, auth, cloning, downloads, idempotency, jobs, metrics, purge, storage, trello
+from app.suggest import suggester
+from app.trigram import index as trigram_index
+from app.cache import response_cache
 from fastapi.security import OAuth2PasswordBearer
 from dotenv import load_dotenv
 import os
 from jose import JWTError, jwt
+import msgpack
+from datetime import datetime, timedelta, timezone
+import hashlib
+import io
+import json
+import tarfile
 
 load_dotenv()
 
@@ -26,6 +37,7 @@ engine = create_engine(
     connect_args={"check_same_thread": False},
     poolclass=StaticPool,
 )
+enable_sqlite_foreign_keys(engine)
 
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
@@ -39,8 +51,16 @@ def test_db():
     finally:
         db.close()
         Base.metadata.drop_all(bind=engine)
+        # Board ids restart with every fresh database, so drop process-local cache entries
+        response_cache.local.clear()
+        suggester.clear()
 
-def override_get_db():
+def override_get_db(connection: HTTPConnection):
+    # Like get_db, /batch sub-requests run on the batch's session
+    shared = shared_session(connection)
+    if shared is not None:
+        yield shared
+        return
     db = TestingSessionLocal()
     try:
         yield db
@@ -48,6 +68,7 @@ def override_get_db():
         db.close()
 
 app.dependency_overrides[get_db] = override_get_db
+idempotency.configure(idempotency.DatabaseStore(TestingSessionLocal))
 
 @pytest.fixture(scope="function")
 def test_user(test_db):
@@ -222,6 +243,105 @@ def test_search(authorized_client, test_db):
     assert any(result["title"] == "Search Test List" for result in results)
     assert any(result["title"] == "Search Test Card" for result in results)
 
+def test_search_ranks_member_boards_and_paginates(authorized_client, test_db):
+    owner = create_test_user("searchowner", "searchowner@example.com", "ownerpassword")
+    member = create_test_user("searchmember", "searchmember@example.com", "memberpassword")
+    board = create_test_board(owner, "Roadmap")
+    list1 = create_test_list(board["id"], "Backlog", authorized_client)
+    client.post(f"/boards/{board['id']}/members", json={"user_id": member["id"], "permission_level": "view"},
+                headers=get_auth_header(owner))
+    for title, description in [("Design review", None), ("Ship", "After the design is approved"), ("Unrelated", "Nothing")]:
+        client.post("/cards/", json={"title": title, "description": description, "list_id": list1["id"]},
+                    headers=get_auth_header(owner))
+
+    headers = get_auth_header(member)
+    results = client.get("/search?query=desig", headers=headers).json()
+    # Prefix match, title hits rank above description hits
+    assert [result["title"] for result in results] == ["Design review", "Ship"]
+
+    page = client.get("/search?query=desig&skip=1&limit=1", headers=headers).json()
+    assert [result["title"] for result in page] == ["Ship"]
+
+    renamed = client.put(f"/cards/{results[0]['id']}", json={"title": "Planning"}, headers=get_auth_header(owner))
+    assert renamed.status_code == 200
+    assert [r["title"] for r in client.get("/search?query=desig", headers=headers).json()] == ["Ship"]
+
+    outsider = create_test_user("searchoutsider", "searchoutsider@example.com", "outsiderpassword")
+    assert client.get("/search?query=desig", headers=get_auth_header(outsider)).json() == []
+
+def test_search_uses_trigram_index_for_substrings(authorized_client, test_db):
+    board = create_test_board(authorized_client, "Trigram Board")
+    list1 = create_test_list(board["id"], "Inbox", authorized_client)
+    card = create_test_card(list1["id"], "Refactoring", authorized_client)
+    create_test_card(list1["id"], "Redesign", authorized_client)
+
+    def substring(query, **params):
+        response = authorized_client.get("/search", params={"query": query, "match": "substring", **params})
+        return [(r["type"], r["title"]) for r in response.json()]
+
+    # Without the index the database answers with the same substring semantics
+    assert substring("factor") == [("card", "Refactoring")]
+    assert substring("sign") == [("card", "Redesign")]
+    assert substring("100%") == []
+    # Word matching stays the default
+    assert authorized_client.get("/search?query=sign").json() == []
+
+    trigram_index.enabled = True
+    try:
+        # Mid-word substrings, now from memory
+        assert substring("factor") == [("card", "Refactoring")]
+        assert substring("sign") == [("card", "Redesign")]
+
+        authorized_client.put(f"/cards/{card['id']}", json={"title": "Cleanup"})
+        assert substring("factor") == []
+        assert substring("leanu") == [("card", "Cleanup")]
+
+        # Card filters still go to the database
+        assert substring("leanu", label="urgent") == []
+        from_memory = substring("e")
+    finally:
+        trigram_index.enabled = False
+        trigram_index.clear()
+    # Both answer with the same hits in the same order
+    assert substring("e") == from_memory
+
+def test_search_suggest_matches_word_prefixes(authorized_client, test_db):
+    board = create_test_board(authorized_client, "Website relaunch")
+    list1 = create_test_list(board["id"], "Release train", authorized_client)
+    first = create_test_card(list1["id"], "Write release notes", authorized_client)
+    second = create_test_card(list1["id"], "Relabel issues", authorized_client)
+    create_test_card(list1["id"], "Unrelated", authorized_client)
+
+    response = authorized_client.get("/search/suggest?query=rel")
+    assert response.status_code == 200
+    # Word starts only ("Unrelated" doesn't match), newest first on equal timestamps
+    assert {(r["type"], r["title"]) for r in response.json()} == {
+        ("board", "Website relaunch"), ("list", "Release train"),
+        ("card", "Write release notes"), ("card", "Relabel issues"),
+    }
+    assert [r["title"] for r in authorized_client.get("/search/suggest?query=release n").json()] == ["Write release notes"]
+    assert len(authorized_client.get("/search/suggest?query=rel&limit=2").json()) == 2
+
+    # Writes are folded into the titles in memory rather than rebuilding the board
+    rebuilds = metrics.snapshot().get("suggest.rebuilds", 0)
+    authorized_client.put(f"/cards/{second['id']}", json={"title": "Triage issues"})
+    created = create_test_card(list1["id"], "Release checklist", authorized_client)
+    titles = [r["title"] for r in authorized_client.get("/search/suggest?query=rel").json()]
+    assert "Relabel issues" not in titles and "Write release notes" in titles
+    assert titles[0] == "Release checklist"
+    authorized_client.delete(f"/cards/{created['id']}")
+    assert "Release checklist" not in [r["title"] for r in authorized_client.get("/search/suggest?query=rel").json()]
+    assert metrics.snapshot().get("suggest.rebuilds", 0) == rebuilds
+
+    # A revision this process didn't see (another worker wrote) means a rebuild
+    test_db.execute(update(models.Board).where(models.Board.id == board["id"]).values(revision=models.Board.revision + 5))
+    test_db.commit()
+    assert [r["title"] for r in authorized_client.get("/search/suggest?query=triage").json()] == ["Triage issues"]
+    assert metrics.snapshot().get("suggest.rebuilds", 0) == rebuilds + 1
+
+    outsider = create_test_user("suggestoutsider", "suggestoutsider@example.com", "outsiderpassword")
+    assert client.get("/search/suggest?query=rel", headers=get_auth_header(outsider)).json() == []
+
 def test_board_permissions(authorized_client, test_db):
     user1 = create_test_user("user1", "user1@example.com", "password1")
     user2 = create_test_user("user2", "user2@example.com", "password2")
@@ -347,3 +467,957 @@ def test_delete_board(authorized_client, test_db):
     get_response = authorized_client.get(f"/boards/{board_id}")
     assert get_response.status_code == 404
 
+
+def test_board_cards_conditional_get(authorized_client, test_db):
+    board = create_test_board(authorized_client, "ETag Board")
+    list1 = create_test_list(board['id'], "List 1", authorized_client)
+    create_test_card(list1['id'], "Card 1", authorized_client)
+
+    response = authorized_client.get(f"/boards/{board['id']}/cards")
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+    assert "Last-Modified" in response.headers
+
+    cached = authorized_client.get(f"/boards/{board['id']}/cards", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.content == b""
+    assert cached.headers["ETag"] == etag
+
+    # Lists of the same board carry a different tag
+    lists_response = authorized_client.get(f"/boards/{board['id']}/lists", headers={"If-None-Match": etag})
+    assert lists_response.status_code == 200
+
+    create_test_card(list1['id'], "Card 2", authorized_client)
+    changed = authorized_client.get(f"/boards/{board['id']}/cards", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+    assert len(changed.json()) == 2
+
+def test_board_etag_changes_on_card_move(authorized_client, test_db):
+    board = create_test_board(authorized_client, "Move ETag Board")
+    list1 = create_test_list(board['id'], "List 1", authorized_client)
+    list2 = create_test_list(board['id'], "List 2", authorized_client)
+    card = create_test_card(list1['id'], "Card", authorized_client)
+
+    etag = authorized_client.get(f"/boards/{board['id']}").headers["ETag"]
+    assert authorized_client.get(f"/boards/{board['id']}", headers={"If-None-Match": etag}).status_code == 304
+
+    response = authorized_client.put(f"/cards/{card['id']}/move?new_list_id={list2['id']}")
+    assert response.status_code == 200
+    assert authorized_client.get(f"/boards/{board['id']}", headers={"If-None-Match": etag}).status_code == 200
+
+def test_board_cards_sparse_fields(authorized_client, test_db):
+    board = create_test_board(authorized_client, "Sparse Board")
+    list1 = create_test_list(board['id'], "List 1", authorized_client)
+    create_test_card(list1['id'], "Card 1", authorized_client)
+
+    response = authorized_client.get(f"/boards/{board['id']}/cards?fields=id,title,list_id,due_date")
+    assert response.status_code == 200
+    assert "ETag" in response.headers
+    cards = response.json()
+    assert len(cards) == 1
+    assert set(cards[0]) == {"id", "title", "list_id", "due_date"}
+    assert cards[0]["title"] == "Card 1"
+
+    card_response = authorized_client.get(f"/cards/{cards[0]['id']}?fields=title")
+    assert card_response.json() == {"title": "Card 1"}
+
+    lists_response = authorized_client.get(f"/boards/{board['id']}/lists?fields=id")
+    assert lists_response.json() == [{"id": list1['id']}]
+
+    search_response = authorized_client.get("/search?query=Card&fields=id,type")
+    assert search_response.status_code == 200
+    assert all(set(result) == {"id", "type"} for result in search_response.json())
+
+def test_sparse_fields_rejects_unknown_field(authorized_client, test_db):
+    board = create_test_board(authorized_client, "Sparse Board")
+    response = authorized_client.get(f"/boards/{board['id']}/cards?fields=id,owner_password")
+    assert response.status_code == 400
+    assert "owner_password" in response.json()["message"]
+
+def test_board_cards_msgpack(authorized_client, test_db):
+    board = create_test_board(authorized_client, "MessagePack Board")
+    list1 = create_test_list(board['id'], "List 1", authorized_client)
+    create_test_card(list1['id'], "Card 1", authorized_client)
+
+    response = authorized_client.get(f"/boards/{board['id']}/cards", headers={"Accept": "application/msgpack"})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/msgpack"
+    cards = msgpack.unpackb(response.content)
+    assert [card["title"] for card in cards] == ["Card 1"]
+
+    json_response = authorized_client.get(f"/boards/{board['id']}/cards")
+    assert json_response.headers["content-type"] == "application/json"
+    assert json_response.json() == cards
+
+def test_collections_stream_ndjson(authorized_client, test_db):
+    board = create_test_board(authorized_client, "NDJSON Board")
+    list1 = create_test_list(board['id'], "List 1", authorized_client)
+    for title in ("Card 1", "Card 2", "Card 3"):
+        create_test_card(list1['id'], title, authorized_client)
+    ndjson = {"Accept": "application/x-ndjson"}
+
+    response = authorized_client.get(f"/boards/{board['id']}/cards", headers=ndjson)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert "Accept" in response.headers["vary"]
+    cards = [json.loads(line) for line in response.text.splitlines()]
+    assert [card["title"] for card in cards] == ["Card 1", "Card 2", "Card 3"]
+    assert cards == authorized_client.get(f"/boards/{board['id']}/cards").json()
+    # Conditional requests still apply
+    etag = response.headers["etag"]
+    assert authorized_client.get(f"/boards/{board['id']}/cards",
+                                 headers={**ndjson, "If-None-Match": etag}).status_code == 304
+
+    response = authorized_client.get(f"/lists/{list1['id']}/cards", params={"fields": "id,title"}, headers=ndjson)
+    assert [json.loads(line) for line in response.text.splitlines()] == [
+        {"id": card["id"], "title": card["title"]} for card in cards
+    ]
+
+    response = authorized_client.get(f"/boards/{board['id']}/activity", headers=ndjson)
+    streamed = [json.loads(line) for line in response.text.splitlines()]
+    assert streamed == authorized_client.get(f"/boards/{board['id']}/activity").json()
+    # JSON stays the default when it ranks higher
+    response = authorized_client.get(f"/boards/{board['id']}/activity",
+                                     headers={"Accept": "application/json, application/x-ndjson;q=0.5"})
+    assert response.headers["content-type"] == "application/json"
+
+def test_cards_batch_accepts_msgpack_body(authorized_client, test_db):
+    board = create_test_board(authorized_client, "MessagePack Batch Board")
+    list1 = create_test_list(board['id'], "List 1", authorized_client)
+    body = msgpack.packb([{"title": f"Card {i}", "list_id": list1['id']} for i in range(3)])
+
+    response = authorized_client.post(
+        "/cards/batch",
+        content=body,
+        headers={"Content-Type": "application/msgpack", "Accept": "application/msgpack"}
+    )
+    assert response.status_code == 200, response.text
+    cards = msgpack.unpackb(response.content)
+    assert [card["title"] for card in cards] == ["Card 0", "Card 1", "Card 2"]
+
+    invalid = authorized_client.post("/cards/batch", content=b"\xc1", headers={"Content-Type": "application/msgpack"})
+    assert invalid.status_code == 400
+
+def test_board_cards_gzip_compression(authorized_client, test_db):
+    board = create_test_board(authorized_client, "Compressed Board")
+    list1 = create_test_list(board['id'], "List 1", authorized_client)
+    for i in range(20):
+        create_test_card(list1['id'], f"Card {i}", authorized_client)
+
+    response = authorized_client.get(f"/boards/{board['id']}/cards", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert len(response.json()) == 20
+
+    assert response.headers["vary"].count("Accept-Encoding") == 1
+
+    # Responses below the size threshold go out as-is, but could have been encoded
+    small = authorized_client.get(f"/boards/{board['id']}", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in small.headers
+    assert "Accept-Encoding" in small.headers["vary"]
+
+    identity = authorized_client.get(f"/boards/{board['id']}/cards", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in identity.headers
+    assert "Accept-Encoding" in identity.headers["vary"]
+
+def test_cached_reads_keep_their_compressed_body_until_invalidated(authorized_client, test_db, monkeypatch):
+    from app.compression import CompressionMiddleware
+    board = create_test_board(authorized_client, "Compressed Statistics")
+    lists = [create_test_list(board['id'], f"A rather long list title, number {i}", authorized_client) for i in range(30)]
+    compressed = []
+    compress = CompressionMiddleware.compress
+    monkeypatch.setattr(CompressionMiddleware, "compress",
+                        lambda self, *args: compressed.append(1) or compress(self, *args))
+
+    def statistics():
+        # No ETag on this route: the encoded body is kept in its response cache entry
+        response = authorized_client.get(f"/boards/{board['id']}/statistics", headers={"Accept-Encoding": "gzip"})
+        assert response.headers["content-encoding"] == "gzip" and "etag" not in response.headers
+        return response.json()
+
+    assert statistics()["total_cards"] == 0
+    assert statistics()["total_cards"] == 0
+    assert len(compressed) == 1
+
+    create_test_card(lists[0]['id'], "Card", authorized_client)
+    assert statistics()["total_cards"] == 1
+    assert len(compressed) == 2
+
+def test_metrics_counts_board_reads(authorized_client, test_db):
+    board = create_test_board(authorized_client, "Metrics Board")
+    before = authorized_client.get("/metrics").json().get("single_flight.board_reads.executed", 0)
+
+    assert authorized_client.get(f"/boards/{board['id']}/statistics").status_code == 200
+    assert authorized_client.get(f"/boards/{board['id']}/cards").status_code == 200
+
+    after = authorized_client.get("/metrics").json()
+    assert after["single_flight.board_reads.executed"] == before + 2
+
+def test_metrics_require_authentication(test_db):
+    assert client.get("/metrics").status_code == 401
+
+def test_board_reads_are_cached_until_board_changes(authorized_client, test_db):
+    board = create_test_board(authorized_client, "Cached Board")
+    list1 = create_test_list(board['id'], "List 1", authorized_client)
+    create_test_card(list1['id'], "Card 1", authorized_client)
+
+    assert len(authorized_client.get(f"/boards/{board['id']}/cards").json()) == 1
+    hits = authorized_client.get("/metrics").json().get("cache.local_hits", 0)
+    assert len(authorized_client.get(f"/boards/{board['id']}/cards").json()) == 1
+    assert authorized_client.get("/metrics").json()["cache.local_hits"] == hits + 1
+
+    create_test_card(list1['id'], "Card 2", authorized_client)
+    assert len(response_cache.local) == 0
+    assert len(authorized_client.get(f"/boards/{board['id']}/cards").json()) == 2
+
+def test_board_websocket_receives_committed_changes(authorized_client, test_db, test_token):
+    board = create_test_board(authorized_client, "Live Board")
+    list1 = create_test_list(board['id'], "List 1", authorized_client)
+
+    with authorized_client.websocket_connect(f"/boards/{board['id']}/ws?token={test_token}") as websocket:
+        card = create_test_card(list1['id'], "Live Card", authorized_client)
+        message = websocket.receive_json()
+
+    assert message["type"] == "changes"
+    assert message["board_id"] == board['id']
+    created = [event for event in message["events"] if event["entity"] == "card"]
+    assert created == [{
+        "board_id": board['id'],
+        "entity": "card",
+        "id": card['id'],
+        "op": "created",
+        "revision": created[0]["revision"],
+        "data": created[0]["data"],
+    }]
+    assert created[0]["data"]["title"] == "Live Card"
+
+def test_board_websocket_rejects_invalid_token(authorized_client, test_db):
+    board = create_test_board(authorized_client, "Private Board")
+    with pytest.raises(WebSocketDisconnect) as excinfo:
+        with authorized_client.websocket_connect(f"/boards/{board['id']}/ws?token=invalid") as websocket:
+            websocket.receive_json()
+    assert excinfo.value.code == 1008
+
+def test_board_changes_since_revision(authorized_client, test_db):
+    board = create_test_board(authorized_client, "Sync Board")
+    list1 = create_test_list(board['id'], "List 1", authorized_client)
+    card1 = create_test_card(list1['id'], "Card 1", authorized_client)
+    card2 = create_test_card(list1['id'], "Card 2", authorized_client)
+    since = authorized_client.get(f"/boards/{board['id']}/changes", params={"since": 0}).json()["revision"]
+
+    authorized_client.put(f"/cards/{card1['id']}", json={"title": "Card 1 renamed"})
+    transient = create_test_card(list1['id'], "Transient", authorized_client)
+    authorized_client.delete(f"/cards/{transient['id']}")
+    authorized_client.delete(f"/cards/{card2['id']}")
+
+    response = authorized_client.get(f"/boards/{board['id']}/changes", params={"since": since})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["resync"] is False
+    assert body["revision"] == since + 4
+    assert [card["title"] for card in body["changed"]["card"]] == ["Card 1 renamed"]
+    # Created and deleted within the window, so never reported
+    assert body["deleted"] == {"card": [card2['id']]}
+
+    assert authorized_client.get(f"/boards/{board['id']}/changes", params={"since": body["revision"]}).json()["changed"] == {}
+
+def test_board_changes_resync_after_log_truncation(authorized_client, test_db, monkeypatch):
+    from app import board_revisions
+    monkeypatch.setattr(board_revisions, "CHANGE_LOG_RETENTION", 2)
+    monkeypatch.setattr(board_revisions, "CHANGE_LOG_PRUNE_EVERY", 1)
+    board = create_test_board(authorized_client, "Busy Board")
+    list1 = create_test_list(board['id'], "List 1", authorized_client)
+    for i in range(4):
+        create_test_card(list1['id'], f"Card {i}", authorized_client)
+
+    assert authorized_client.get(f"/boards/{board['id']}/changes", params={"since": 0}).json()["resync"] is True
+    body = authorized_client.get(f"/boards/{board['id']}/changes", params={"since": 3}).json()
+    assert body["resync"] is False
+    assert [card["title"] for card in body["changed"]["card"]] == ["Card 2", "Card 3"]
+    assert test_db.query(models.BoardChange).filter(models.BoardChange.revision <= 3).count() == 0
+
+def test_cards_batch_move_update_label_delete(authorized_client, test_db):
+    board = create_test_board(authorized_client, "Batch Board")
+    list1 = create_test_list(board['id'], "List 1", authorized_client)
+    list2 = create_test_list(board['id'], "List 2", authorized_client)
+    created = authorized_client.post("/cards/batch", json=[{"title": f"Card {i}", "list_id": list1['id']} for i in range(5)])
+    assert created.status_code == 200
+    ids = [card["id"] for card in created.json()]
+    since = authorized_client.get(f"/boards/{board['id']}/changes", params={"since": 0}).json()["revision"]
+
+    moved = authorized_client.post("/cards/batch/move", json=[{"card_id": card_id, "list_id": list2['id']} for card_id in ids[:3]])
+    assert moved.status_code == 200
+    assert [card["id"] for card in moved.json()] == ids[:3]
+    assert {card["list_id"] for card in moved.json()} == {list2['id']}
+
+    updated = authorized_client.post("/cards/batch/update", json=[
+        {"id": ids[0], "title": "Renamed"},
+        {"id": ids[3], "description": "Only the description"},
+    ])
+    assert updated.status_code == 200
+    assert [(card["title"], card["description"]) for card in updated.json()] == [
+        ("Renamed", None),
+        ("Card 3", "Only the description"),
+    ]
+
+    labels = authorized_client.post("/cards/batch/labels", json={"card_ids": ids[:2], "labels": [{"name": "urgent", "color": "red"}]})
+    assert labels.status_code == 200
+    assert sorted(label["card_id"] for label in labels.json()) == sorted(ids[:2])
+    removed = authorized_client.post("/cards/batch/labels/delete", json={"label_ids": [labels.json()[0]["id"]]})
+    assert removed.status_code == 200
+
+    # Label names come from the palette in a fixed number of queries, however many labels
+    def selects_for(call):
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append(statement.startswith("SELECT"))
+        event.listen(engine, "before_cursor_execute", listener)
+        try:
+            assert call().status_code == 200
+        finally:
+            event.remove(engine, "before_cursor_execute", listener)
+        return sum(statements)
+    few = selects_for(lambda: authorized_client.post("/cards/batch/labels", json={"card_ids": ids[:1], "labels": [{"name": "a", "color": "red"}]}))
+    many = selects_for(lambda: authorized_client.post("/cards/batch/labels", json={"card_ids": ids, "labels": [{"name": n, "color": "red"} for n in "bcd"]}))
+    assert many == few
+
+    deleted = authorized_client.post("/cards/batch/delete", json={"card_ids": ids[3:]})
+    assert deleted.status_code == 200
+    remaining = authorized_client.get(f"/boards/{board['id']}/cards").json()
+    assert sorted(card["id"] for card in remaining) == sorted(ids[:3])
+
+    changes = authorized_client.get(f"/boards/{board['id']}/changes", params={"since": since}).json()
+    assert changes["deleted"]["card"] == sorted(ids[3:])
+    assert sorted(card["id"] for card in changes["changed"]["card"]) == sorted(ids[:3])
+
+def test_cards_batch_rejects_inaccessible_lists(authorized_client, test_db):
+    other = create_test_user("batchother", "batchother@example.com", "password123")
+    foreign_board = create_test_board(other, "Foreign Board")
+    foreign_list = client.post("/lists/", json={"title": "Theirs", "board_id": foreign_board['id']}, headers=get_auth_header(other)).json()
+    board = create_test_board(authorized_client, "Mine")
+    list1 = create_test_list(board['id'], "List 1", authorized_client)
+
+    response = authorized_client.post("/cards/batch", json=[
+        {"title": "Mine", "list_id": list1['id']},
+        {"title": "Theirs", "list_id": foreign_list['id']},
+    ])
+    assert response.status_code == 404
+    # Nothing from the rejected batch was written
+    assert authorized_client.get(f"/boards/{board['id']}/cards").json() == []
+
+def test_batch_runs_sub_requests_with_one_authentication(authorized_client, test_db):
+    board = create_test_board(authorized_client, "Batch View")
+    list1 = create_test_list(board['id'], "List 1", authorized_client)
+    card = create_test_card(list1['id'], "Card 1", authorized_client)
+
+    response = authorized_client.post("/batch", json={
+        "concurrent": True,
+        "requests": [
+            {"path": f"/boards/{board['id']}"},
+            {"path": f"/boards/{board['id']}/lists"},
+            {"path": f"/cards/{card['id']}?fields=title"},
+            {"method": "POST", "path": "/cards/", "body": {"title": "Card 2", "list_id": list1['id']}},
+            {"path": "/cards/999999"},
+        ],
+    })
+    assert response.status_code == 200
+    results = response.json()["responses"]
+    assert [result["status"] for result in results] == [200, 200, 200, 200, 404]
+    assert results[0]["body"]["title"] == "Batch View"
+    assert results[1]["body"][0]["title"] == "List 1"
+    assert results[2]["body"] == {"title": "Card 1"}
+    assert results[3]["body"]["title"] == "Card 2"
+
+def test_batch_authenticates_once_with_the_real_dependency(authorized_client, test_db, monkeypatch):
+    board = create_test_board(authorized_client, "Batch Auth")
+    monkeypatch.delitem(app.dependency_overrides, auth.get_current_user)
+    decoded = []
+    decode = auth.jwt.decode
+    monkeypatch.setattr(auth.jwt, "decode", lambda *args, **kwargs: decoded.append(1) or decode(*args, **kwargs))
+
+    response = authorized_client.post("/batch", json={"concurrent": True, "requests": [
+        {"path": f"/boards/{board['id']}"},
+        {"path": f"/boards/{board['id']}/lists"},
+        {"method": "POST", "path": "/lists/", "body": {"title": "List 1", "board_id": board["id"]}},
+    ]})
+    assert [r["status"] for r in response.json()["responses"]] == [200, 200, 200]
+    assert len(decoded) == 1
+    assert client.post("/batch", json={"requests": [{"path": "/boards/"}]}).status_code == 401
+
+def test_batch_rejects_streaming_paths(authorized_client, test_db):
+    board = create_test_board(authorized_client, "Batch Stream")
+    for path in (f"/boards/{board['id']}/events", f"/boards/{board['id']}/export", "/users/me/export?format=tar.gz"):
+        response = authorized_client.post("/batch", json={"requests": [{"path": path}]})
+        assert response.status_code == 400
+
+def test_batch_atomic_rolls_back_on_failure(authorized_client, test_db):
+    board = create_test_board(authorized_client, "Atomic Board")
+    list1 = create_test_list(board['id'], "List 1", authorized_client)
+
+    response = authorized_client.post("/batch", json={
+        "atomic": True,
+        "requests": [
+            {"method": "POST", "path": "/cards/", "body": {"title": "Kept?", "list_id": list1['id']}},
+            {"method": "POST", "path": "/cards/", "body": {"title": "Broken", "list_id": 999999}},
+            {"method": "POST", "path": "/cards/", "body": {"title": "Never run", "list_id": list1['id']}},
+        ],
+    })
+    assert response.status_code == 200
+    assert [result["status"] for result in response.json()["responses"]] == [424, 404, 424]
+    assert authorized_client.get(f"/boards/{board['id']}/cards").json() == []
+
+    response = authorized_client.post("/batch", json={
+        "atomic": True,
+        "requests": [
+            {"method": "POST", "path": "/cards/", "body": {"title": "One", "list_id": list1['id']}},
+            {"method": "POST", "path": "/cards/", "body": {"title": "Two", "list_id": list1['id']}},
+        ],
+    })
+    assert [result["status"] for result in response.json()["responses"]] == [200, 200]
+    assert len(authorized_client.get(f"/boards/{board['id']}/cards").json()) == 2
+
+def test_batch_reads_see_the_batch_writes_and_skip_the_cache(authorized_client, test_db):
+    board = create_test_board(authorized_client, "Atomic Reads")
+    list1 = create_test_list(board['id'], "List 1", authorized_client)
+    response_cache.local.clear()
+
+    response = authorized_client.post("/batch", json={
+        "atomic": True,
+        "requests": [
+            {"method": "POST", "path": "/cards/", "body": {"title": "Pending", "list_id": list1['id']}},
+            {"path": f"/boards/{board['id']}/cards"},
+            {"path": f"/boards/{board['id']}/statistics"},
+            {"method": "POST", "path": "/cards/", "body": {"title": "Broken", "list_id": 999999}},
+        ],
+    })
+    results = response.json()["responses"]
+    assert [result["status"] for result in results] == [424, 424, 424, 404]
+    assert len(response_cache.local) == 0
+
+    response = authorized_client.post("/batch", json={
+        "atomic": True,
+        "requests": [
+            {"method": "POST", "path": "/cards/", "body": {"title": "Kept", "list_id": list1['id']}},
+            {"path": f"/boards/{board['id']}/cards"},
+            {"path": f"/boards/{board['id']}/statistics"},
+        ],
+    })
+    results = response.json()["responses"]
+    assert [card["title"] for card in results[1]["body"]] == ["Kept"]
+    assert results[2]["body"]["total_cards"] == 1
+    assert len(response_cache.local) == 0
+
+def test_batch_requires_authentication(test_db):
+    response = client.post("/batch", json={"requests": [{"path": "/boards/"}]})
+    assert response.status_code == 401
+
+def test_mutations_log_activity_without_extra_commits(authorized_client, test_db):
+    from sqlalchemy import event as sa_event
+    board = create_test_board(authorized_client, "Activity Board")
+    list1 = create_test_list(board['id'], "List 1", authorized_client)
+    list2 = create_test_list(board['id'], "List 2", authorized_client)
+
+    commits = []
+    listener = lambda session: commits.append(session)
+    sa_event.listen(Session, "after_commit", listener)
+    try:
+        card = create_test_card(list1['id'], "Card 1", authorized_client)
+    finally:
+        sa_event.remove(Session, "after_commit", listener)
+    assert len(commits) == 1
+
+    assert authorized_client.put(f"/cards/{card['id']}/move", params={"new_list_id": list2['id']}).status_code == 200
+    authorized_client.post(f"/cards/{card['id']}/comments", json={"content": "Looks good"})
+
+    activity = authorized_client.get(f"/boards/{board['id']}/activity").json()
+    assert [entry["activity_type"] for entry in activity] == [
+        "comment_added", "card_moved", "card_created", "list_created", "list_created", "board_created",
+    ]
+    assert activity[1]["details"] == "Card 'Card 1' moved from 'List 1' to 'List 2'"
+
+def test_idempotency_key_replays_first_response(authorized_client, test_db):
+    board = create_test_board(authorized_client, "Idempotent Board")
+    list1 = create_test_list(board['id'], "List 1", authorized_client)
+    card_data = {"title": "Once", "list_id": list1['id']}
+
+    first = authorized_client.post("/cards/", json=card_data, headers={"Idempotency-Key": "card-1"})
+    retry = authorized_client.post("/cards/", json=card_data, headers={"Idempotency-Key": "card-1"})
+    assert first.status_code == retry.status_code == 200
+    assert retry.json() == first.json()
+    assert retry.headers["idempotent-replayed"] == "true"
+    assert "idempotent-replayed" not in first.headers
+    assert len(authorized_client.get(f"/boards/{board['id']}/cards").json()) == 1
+
+    reused = authorized_client.post("/cards/", json={**card_data, "title": "Other"}, headers={"Idempotency-Key": "card-1"})
+    assert reused.status_code == 422
+
+    fresh = authorized_client.post("/cards/", json=card_data, headers={"Idempotency-Key": "card-2"})
+    assert fresh.status_code == 200
+    assert fresh.json()["id"] != first.json()["id"]
+
+def test_board_template_round_trip(authorized_client, test_db):
+    response = authorized_client.post("/board-templates", json={
+        "name": "Sprint",
+        "description": "Two-week sprint",
+        "lists": [
+            "Done",
+            {"name": "To do", "cards": [{"title": "Plan", "labels": [{"name": "meta", "color": "grey"}]}]},
+        ],
+    })
+    assert response.status_code == 200
+    template = response.json()
+    assert [l["name"] for l in template["lists"]] == ["Done", "To do"]
+    assert template["lists"][1]["cards"][0]["labels"][0]["name"] == "meta"
+
+    board_response = authorized_client.post(f"/boards/from-template/{template['id']}", params={"board_name": "Sprint 1"})
+    assert board_response.status_code == 200
+    board = board_response.json()
+    lists = authorized_client.get(f"/boards/{board['id']}/lists").json()
+    assert [l["title"] for l in lists] == ["Done", "To do"]
+    cards = authorized_client.get(f"/boards/{board['id']}/cards").json()
+    assert [(c["title"], c["list_id"]) for c in cards] == [("Plan", lists[1]["id"])]
+    labels = test_db.query(models.CardLabel).filter(models.CardLabel.card_id == cards[0]["id"]).all()
+    assert [(l.name, l.color) for l in labels] == [("meta", "grey")]
+
+    # And back: a board saved as a template keeps its cards and labels
+    saved = authorized_client.post(f"/boards/{board['id']}/template", json={"name": "Sprint copy"}).json()
+    assert [(l["name"], [c["title"] for c in l["cards"]]) for l in saved["lists"]] == [("Done", []), ("To do", ["Plan"])]
+
+def test_duplicate_board_copies_the_tree(authorized_client, test_db):
+    board = create_test_board(authorized_client, "Original")
+    list1 = create_test_list(board["id"], "List 1", authorized_client)
+    list2 = create_test_list(board["id"], "List 2", authorized_client)
+    card1 = create_test_card(list1["id"], "Card 1", authorized_client)
+    create_test_card(list2["id"], "Card 2", authorized_client)
+    authorized_client.post(f"/cards/{card1['id']}/labels", json={"name": "urgent", "color": "red"})
+    authorized_client.post(f"/cards/{card1['id']}/comments", json={"content": "First!"})
+
+    response = authorized_client.post(f"/boards/{board['id']}/duplicate", json={"include_comments": True})
+    assert response.status_code == 200
+    copy = response.json()
+    assert copy["title"] == "Original (copy)" and copy["id"] != board["id"]
+
+    lists = authorized_client.get(f"/boards/{copy['id']}/lists").json()
+    assert [l["title"] for l in lists] == ["List 1", "List 2"]
+    cards = authorized_client.get(f"/boards/{copy['id']}/cards").json()
+    assert sorted((c["title"], c["list_id"]) for c in cards) == [("Card 1", lists[0]["id"]), ("Card 2", lists[1]["id"])]
+    copied = next(c for c in cards if c["title"] == "Card 1")
+    assert [l.name for l in test_db.query(models.CardLabel).filter(models.CardLabel.card_id == copied["id"])] == ["urgent"]
+    assert [c["content"] for c in authorized_client.get(f"/cards/{copied['id']}/comments").json()] == ["First!"]
+    # The source is untouched
+    assert len(authorized_client.get(f"/boards/{board['id']}/cards").json()) == 2
+
+    empty = authorized_client.post(f"/boards/{board['id']}/duplicate", json={"title": "Skeleton", "include_cards": False}).json()
+    assert authorized_client.get(f"/boards/{empty['id']}/cards").json() == []
+    # The palette comes along either way
+    palette = authorized_client.get(f"/boards/{empty['id']}/labels").json()
+    assert [(l["name"], l["color"]) for l in palette] == [("urgent", "red")]
+
+def test_large_duplicate_runs_in_background(authorized_client, test_db, monkeypatch):
+    board = create_test_board(authorized_client, "Big")
+    list1 = create_test_list(board["id"], "List 1", authorized_client)
+    for i in range(3):
+        create_test_card(list1["id"], f"Card {i}", authorized_client)
+    monkeypatch.setattr(cloning, "COPY_BACKGROUND_CARDS", 2)
+
+    response = authorized_client.post(f"/boards/{board['id']}/duplicate", json={})
+    assert response.status_code == 202
+    assert authorized_client.get(f"/boards/{response.json()['id']}/cards").json() == []
+
+    assert jobs.runner.run_pending(TestingSessionLocal) == 1
+    assert len(authorized_client.get(f"/boards/{response.json()['id']}/cards").json()) == 3
+    status = authorized_client.get(response.headers["location"]).json()
+    assert (status["type"], status["status"]) == ("board.fill", "succeeded")
+
+def test_rows_added_before_the_background_fill_keep_their_own_cards(authorized_client, test_db, monkeypatch):
+    board = create_test_board(authorized_client, "Big")
+    lists = [create_test_list(board["id"], f"List {i}", authorized_client) for i in range(2)]
+    for db_list in lists:
+        card = create_test_card(db_list["id"], f"Card in {db_list['title']}", authorized_client)
+        authorized_client.post(f"/cards/{card['id']}/labels", json={"name": db_list["title"], "color": "red"})
+    monkeypatch.setattr(cloning, "COPY_BACKGROUND_CARDS", 1)
+
+    copy = authorized_client.post(f"/boards/{board['id']}/duplicate", json={}).json()
+    early_list = create_test_list(copy["id"], "Added early", authorized_client)
+    early_card = create_test_card(early_list["id"], "Early card", authorized_client)
+    authorized_client.post(f"/cards/{early_card['id']}/labels", json={"name": "List 0", "color": "red"})
+    assert jobs.runner.run_pending(TestingSessionLocal) == 1
+
+    lists_by_id = {l["id"]: l["title"] for l in authorized_client.get(f"/boards/{copy['id']}/lists").json()}
+    cards = authorized_client.get(f"/boards/{copy['id']}/cards").json()
+    placed = sorted(
+        (lists_by_id[card["list_id"]], card["title"],
+         [label.name for label in test_db.query(models.CardLabel).filter(models.CardLabel.card_id == card["id"])])
+        for card in cards
+    )
+    assert placed == [
+        ("Added early", "Early card", ["List 0"]),
+        ("List 0", "Card in List 0", ["List 0"]),
+        ("List 1", "Card in List 1", ["List 1"]),
+    ]
+
+def test_delete_board_cascades_to_its_rows(authorized_client, test_db):
+    board = create_test_board(authorized_client, "Doomed")
+    list1 = create_test_list(board["id"], "List 1", authorized_client)
+    card = create_test_card(list1["id"], "Card", authorized_client)
+    authorized_client.post(f"/cards/{card['id']}/labels", json={"name": "bug", "color": "red"})
+    authorized_client.post(f"/cards/{card['id']}/comments", json={"content": "hello"})
+
+    assert authorized_client.delete(f"/boards/{board['id']}").status_code == 200
+    for model in (models.List, models.Card, models.CardLabel, models.Comment, models.Activity, models.BoardChange):
+        assert test_db.query(model).count() == 0, model.__name__
+
+def test_delete_list_reports_its_cards_deleted(authorized_client, test_db):
+    board = create_test_board(authorized_client, "Board")
+    list1 = create_test_list(board["id"], "List 1", authorized_client)
+    card = create_test_card(list1["id"], "Card", authorized_client)
+    since = authorized_client.get(f"/boards/{board['id']}/changes", params={"since": 0}).json()["revision"]
+
+    assert authorized_client.delete(f"/lists/{list1['id']}").status_code == 200
+    body = authorized_client.get(f"/boards/{board['id']}/changes", params={"since": since}).json()
+    assert body["deleted"] == {"list": [list1["id"]], "card": [card["id"]]}
+
+def test_new_palette_entries_appear_in_changes(authorized_client, test_db):
+    board = create_test_board(authorized_client, "Board")
+    other = create_test_board(authorized_client, "Other")
+    list1 = create_test_list(board["id"], "List 1", authorized_client)
+    other_list = create_test_list(other["id"], "Other list", authorized_client)
+    card = create_test_card(list1["id"], "Card", authorized_client)
+    since = authorized_client.get(f"/boards/{board['id']}/changes", params={"since": 0}).json()["revision"]
+
+    authorized_client.post(f"/cards/{card['id']}/labels", json={"name": "bug", "color": "red"})
+    body = authorized_client.get(f"/boards/{board['id']}/changes", params={"since": since}).json()
+    assert [(l["name"], l["color"]) for l in body["changed"]["board_label"]] == [("bug", "red")]
+
+    # Moving the card gives the other board a palette entry of its own
+    since = authorized_client.get(f"/boards/{other['id']}/changes", params={"since": 0}).json()["revision"]
+    assert authorized_client.put(f"/cards/{card['id']}", json={"list_id": other_list["id"]}).status_code == 200
+    body = authorized_client.get(f"/boards/{other['id']}/changes", params={"since": since}).json()
+    assert [(l["name"], l["color"]) for l in body["changed"]["board_label"]] == [("bug", "red")]
+
+    # An entry that already exists is not reported again
+    since = body["revision"]
+    second = create_test_card(other_list["id"], "Second", authorized_client)
+    authorized_client.post(f"/cards/{second['id']}/labels", json={"name": "bug", "color": "red"})
+    body = authorized_client.get(f"/boards/{other['id']}/changes", params={"since": since}).json()
+    assert "board_label" not in body["changed"]
+
+def test_large_board_is_soft_deleted_then_purged(authorized_client, test_db, monkeypatch):
+    board = create_test_board(authorized_client, "Huge")
+    list1 = create_test_list(board["id"], "List 1", authorized_client)
+    for i in range(5):
+        create_test_card(list1["id"], f"Card {i}", authorized_client)
+    monkeypatch.setattr(purge, "BOARD_PURGE_THRESHOLD", 3)
+    monkeypatch.setattr(purge, "PURGE_BATCH_SIZE", 2)
+
+    response = authorized_client.delete(f"/boards/{board['id']}")
+    assert response.status_code == 202
+    assert authorized_client.get(f"/boards/{board['id']}").status_code == 404
+    assert board["id"] not in [b["id"] for b in authorized_client.get("/boards/").json()]
+    assert board["id"] not in [b["id"] for b in authorized_client.get("/users/me/boards").json()]
+    assert board["id"] not in [b["id"] for b in authorized_client.get("/users/me/boards", params={"fields": "id,title"}).json()]
+
+    assert jobs.runner.run_pending(TestingSessionLocal) == 1
+    status = authorized_client.get(response.headers["location"]).json()
+    assert status["status"] == "succeeded"
+    assert status["progress_done"] == status["progress_total"]
+    test_db.expire_all()
+    assert test_db.get(models.Board, board["id"]) is None
+    assert test_db.query(models.Card).count() == 0
+
+def test_inactive_board_is_archived_and_rehydrated_on_access(authorized_client, test_db):
+    board = create_test_board(authorized_client, "Dormant")
+    list1 = create_test_list(board["id"], "List 1", authorized_client)
+    card = create_test_card(list1["id"], "Card", authorized_client)
+    authorized_client.post(f"/cards/{card['id']}/labels", json={"name": "bug", "color": "red"})
+    authorized_client.post(f"/cards/{card['id']}/comments", json={"content": "hello"})
+    activity_count = len(authorized_client.get(f"/boards/{board['id']}/activity").json())
+    since = authorized_client.get(f"/boards/{board['id']}/changes", params={"since": 0}).json()["revision"]
+
+    later = datetime.now(timezone.utc) + timedelta(days=archive.BOARD_ARCHIVE_AFTER_DAYS + 1)
+    assert archive.sweep(TestingSessionLocal, now=later) == 1
+    for model in (models.List, models.Card, models.CardLabel, models.Comment, models.Activity):
+        assert test_db.query(model).count() == 0, model.__name__
+    assert test_db.query(models.ArchivedBoard).count() == 1
+    # Still listed; nothing more to archive
+    assert board["id"] in [b["id"] for b in authorized_client.get("/boards/").json()]
+    assert archive.sweep(TestingSessionLocal, now=later) == 0
+
+    cards = authorized_client.get(f"/boards/{board['id']}/cards").json()
+    assert [(c["id"], c["title"]) for c in cards] == [(card["id"], "Card")]
+    assert [label.name for label in test_db.query(models.CardLabel)] == ["bug"]
+    assert [c["content"] for c in authorized_client.get(f"/cards/{card['id']}/comments").json()] == ["hello"]
+    assert len(authorized_client.get(f"/boards/{board['id']}/activity").json()) == activity_count
+    assert test_db.query(models.ArchivedBoard).count() == 0
+    assert authorized_client.get(f"/boards/{board['id']}/changes", params={"since": since}).json()["resync"] is True
+
+def test_labels_share_the_board_palette_and_follow_moved_cards(authorized_client, test_db):
+    board = create_test_board(authorized_client, "Source")
+    other = create_test_board(authorized_client, "Target")
+    list1 = create_test_list(board["id"], "List 1", authorized_client)
+    card1 = create_test_card(list1["id"], "Fix login", authorized_client)
+    card2 = create_test_card(list1["id"], "Fix signup", authorized_client)
+    for card in (card1, card2, card1):
+        authorized_client.post(f"/cards/{card['id']}/labels", json={"name": "urgent", "color": "red"})
+
+    palette = authorized_client.get(f"/boards/{board['id']}/labels").json()
+    assert [(l["name"], l["color"]) for l in palette] == [("urgent", "red")]
+    assert sorted(cl.card_id for cl in test_db.query(models.CardLabel)) == sorted([card1["id"], card2["id"]])
+    found = authorized_client.get("/search", params={"query": "fix", "label": "urgent"}).json()
+    assert sorted(r["id"] for r in found) == sorted([card1["id"], card2["id"]])
+
+    # The list moves boards; its cards' labels move into the target palette
+    authorized_client.put(f"/lists/{list1['id']}", json={"board_id": other["id"]})
+    target = authorized_client.get(f"/boards/{other['id']}/labels").json()
+    assert [(l["name"], l["color"]) for l in target] == [("urgent", "red")]
+    test_db.expire_all()
+    assert {cl.label_id for cl in test_db.query(models.CardLabel)} == {target[0]["id"]}
+    authorized_client.delete(f"/boards/{board['id']}")
+    assert test_db.query(models.CardLabel).count() == 2
+
+def test_board_export_streams_ndjson_and_tarball(authorized_client, test_db, monkeypatch, tmp_path):
+    monkeypatch.setattr(storage, "UPLOAD_DIR", str(tmp_path))
+    board = create_test_board(authorized_client, "Export me")
+    list1 = create_test_list(board["id"], "List 1", authorized_client)
+    card = create_test_card(list1["id"], "Card", authorized_client)
+    authorized_client.post(f"/cards/{card['id']}/labels", json={"name": "bug", "color": "red"})
+    attachment = authorized_client.post(
+        f"/cards/{card['id']}/attachments", files={"file": ("notes.txt", b"hello export", "text/plain")}
+    ).json()
+
+    response = authorized_client.get(f"/boards/{board['id']}/export")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    records = [json.loads(line) for line in response.text.splitlines()]
+    types = [r["type"] for r in records]
+    for table in ("boards", "lists", "cards", "board_labels", "card_labels", "attachments", "attachment_content"):
+        assert table in types, table
+    content = next(r for r in records if r["type"] == "attachment_content")
+    assert content["id"] == attachment["id"]
+
+    response = authorized_client.get(f"/boards/{board['id']}/export", params={"format": "tar.gz"})
+    assert response.headers["content-type"] == "application/gzip"
+    with tarfile.open(fileobj=io.BytesIO(response.content), mode="r:gz") as tar:
+        lines = tar.extractfile("export.ndjson").read().splitlines()
+        assert [json.loads(line)["type"] for line in lines] == [t for t in types if t != "attachment_content"]
+        assert tar.extractfile(f"attachments/{attachment['id']}/notes.txt").read() == b"hello export"
+
+    assert authorized_client.get(f"/boards/{board['id']}/export", params={"format": "zip"}).status_code == 422
+
+def test_account_export_leaves_out_password_hash(authorized_client, test_db, test_user):
+    board = create_test_board(authorized_client, "Mine")
+    create_test_list(board["id"], "List 1", authorized_client)
+    records = [json.loads(line) for line in authorized_client.get("/users/me/export").text.splitlines()]
+    user = next(r["data"] for r in records if r["type"] == "users")
+    assert user["username"] == test_user.username
+    assert "hashed_password" not in user
+    assert [r["data"]["title"] for r in records if r["type"] == "lists"] == ["List 1"]
+
+def test_trello_export_is_imported_by_a_job(authorized_client, test_db, monkeypatch, tmp_path):
+    monkeypatch.setattr(trello, "IMPORT_DIR", str(tmp_path))
+    monkeypatch.setattr(trello, "IMPORT_BATCH", 2)
+    # The export is streamed one top-level array at a time
+    streamed = []
+    items = trello.ijson.items
+    monkeypatch.setattr(trello.ijson, "items", lambda f, prefix: streamed.append(prefix) or items(f, prefix))
+    export_json = {
+        "name": "From Trello",
+        "labels": [{"id": "l1", "name": "bug", "color": "red"}, {"id": "l2", "name": "", "color": None}],
+        "lists": [
+            {"id": "b", "name": "Doing", "pos": 2, "closed": False},
+            {"id": "a", "name": "To do", "pos": 1, "closed": False},
+            {"id": "x", "name": "Old", "pos": 3, "closed": True},
+        ],
+        "cards": [
+            {"id": "c1", "name": "One", "desc": "first", "idList": "a", "idLabels": ["l1", "l2"],
+             "due": "2024-05-01T12:00:00.000Z", "closed": False},
+            {"id": "c2", "name": "Two", "desc": "", "idList": "b", "idLabels": ["l1"], "closed": False},
+            {"id": "c3", "name": "Three", "idList": "a", "idLabels": [], "closed": False},
+            {"id": "c4", "name": "Archived", "idList": "a", "closed": True},
+            {"id": "c5", "name": "In old list", "idList": "x", "closed": False},
+        ],
+        "actions": [
+            {"type": "commentCard", "date": "2024-04-01T09:30:00.000Z", "data": {"text": "hi", "card": {"id": "c2"}}},
+            {"type": "updateCard", "data": {"card": {"id": "c1"}}},
+            {"type": "commentCard", "data": {"text": "gone", "card": {"id": "c4"}}},
+        ],
+    }
+    response = authorized_client.post(
+        "/boards/import/trello", files={"file": ("export.json", json.dumps(export_json).encode(), "application/json")}
+    )
+    assert response.status_code == 202
+    assert jobs.runner.run_pending(TestingSessionLocal) == 1
+    status = authorized_client.get(response.headers["location"]).json()
+    assert status["status"] == "succeeded"
+    result = status["result"]
+    assert result == {"board_id": result["board_id"], "lists": 2, "cards": 3, "labels": 2, "comments": 1}
+    assert status["progress_done"] == 2 + 3 + 1
+    assert streamed == ["name", "labels.item", "lists.item", "cards.item", "actions.item"]
+    assert list(tmp_path.iterdir()) == []
+
+    board_id = result["board_id"]
+    assert authorized_client.get(f"/boards/{board_id}").json()["title"] == "From Trello"
+    lists = authorized_client.get(f"/boards/{board_id}/lists").json()
+    assert [l["title"] for l in lists] == ["To do", "Doing"]
+    cards = authorized_client.get(f"/boards/{board_id}/cards").json()
+    assert sorted(c["title"] for c in cards) == ["One", "Three", "Two"]
+    one = next(c for c in cards if c["title"] == "One")
+    assert one["due_date"].startswith("2024-05-01T12:00:00")
+    palette = authorized_client.get(f"/boards/{board_id}/labels").json()
+    assert sorted((l["name"], l["color"]) for l in palette) == [("", ""), ("bug", "red")]
+    assert test_db.query(models.CardLabel).count() == 3
+    two = next(c for c in cards if c["title"] == "Two")
+    assert [c["content"] for c in authorized_client.get(f"/cards/{two['id']}/comments").json()] == ["hi"]
+
+def test_failed_trello_import_removes_the_staged_export(authorized_client, test_db, monkeypatch, tmp_path):
+    monkeypatch.setattr(trello, "IMPORT_DIR", str(tmp_path))
+    monkeypatch.setattr(jobs, "JOB_RETRY_BACKOFF", 0)
+    response = authorized_client.post(
+        "/boards/import/trello", files={"file": ("export.json", b'{"name": "Broken", "lists": [', "application/json")}
+    )
+    assert response.status_code == 202
+    assert jobs.runner.run_pending(TestingSessionLocal) == 3
+    assert authorized_client.get(response.headers["location"]).json()["status"] == "failed"
+    assert list(tmp_path.iterdir()) == []
+
+def test_attachments_are_stored_once_by_content(authorized_client, test_db, monkeypatch, tmp_path):
+    monkeypatch.setattr(storage, "UPLOAD_DIR", str(tmp_path))
+    monkeypatch.setattr(storage, "MAX_UPLOAD_BYTES", 16)
+    board = create_test_board(authorized_client, "Files")
+    list1 = create_test_list(board["id"], "List 1", authorized_client)
+    card = create_test_card(list1["id"], "Card", authorized_client)
+
+    first = authorized_client.post(f"/cards/{card['id']}/attachments", files={"file": ("a.txt", b"same bytes", "text/plain")}).json()
+    second = authorized_client.post(f"/cards/{card['id']}/attachments", files={"file": ("b.txt", b"same bytes", "text/plain")}).json()
+    digest = hashlib.sha256(b"same bytes").hexdigest()
+    assert first["sha256"] == second["sha256"] == digest
+    paths = {a.file_path for a in test_db.query(models.Attachment)}
+    assert paths == {storage.object_path(digest)}
+    assert (first["size"], first["content_type"]) == (10, "text/plain")
+    assert [p.name for p in (tmp_path / "objects").rglob("*") if p.is_file()] == [digest]
+
+    response = authorized_client.post(f"/cards/{card['id']}/attachments", files={"file": ("big.bin", b"x" * 17)})
+    assert response.status_code == 413
+    assert list((tmp_path / "tmp").iterdir()) == []
+    assert len(authorized_client.get(f"/cards/{card['id']}/attachments").json()) == 2
+
+    # Bodies past the limit are refused before anything is spooled, declared length or not
+    monkeypatch.setattr(storage, "MULTIPART_OVERHEAD", 1024)
+    spooled = []
+    monkeypatch.setattr(storage, "save_upload", lambda upload: spooled.append(upload))
+    body = b"--b\r\nContent-Disposition: form-data; name=\"file\"; filename=\"huge.bin\"\r\n\r\n" + b"x" * 4096 + b"\r\n--b--\r\n"
+    headers = {"Content-Type": "multipart/form-data; boundary=b"}
+    assert authorized_client.post(f"/cards/{card['id']}/attachments", content=body, headers=headers).status_code == 413
+    chunked = authorized_client.post(f"/cards/{card['id']}/attachments", content=iter([body[:1000], body[1000:]]), headers=headers)
+    assert chunked.status_code == 413
+    assert spooled == []
+
+def test_resumable_upload_becomes_an_attachment(authorized_client, test_db, monkeypatch, tmp_path):
+    monkeypatch.setattr(storage, "UPLOAD_DIR", str(tmp_path))
+    board = create_test_board(authorized_client, "Files")
+    list1 = create_test_list(board["id"], "List 1", authorized_client)
+    card = create_test_card(list1["id"], "Card", authorized_client)
+    content = b"0123456789" * 3
+
+    response = authorized_client.post(f"/cards/{card['id']}/uploads", json={"filename": "big.bin", "size": len(content)})
+    assert response.status_code == 201
+    location = response.headers["location"]
+
+    response = authorized_client.patch(location, content=content[:12], headers={"Upload-Offset": "0"})
+    assert response.json()["offset"] == 12 and response.json()["attachment"] is None
+    # A retried chunk from the wrong offset is refused with the offset to resume from
+    response = authorized_client.patch(location, content=content[:12], headers={"Upload-Offset": "0"})
+    assert response.status_code == 409
+    assert authorized_client.get(location).headers["upload-offset"] == "12"
+    assert authorized_client.patch(location, content=content[12:] + b"!", headers={"Upload-Offset": "12"}).status_code == 400
+    # While another request holds the upload, a second writer at the same offset is turned away
+    upload = test_db.get(models.UploadSession, location.rsplit("/", 1)[1])
+    upload.locked_until = datetime.now(timezone.utc) + timedelta(minutes=5)
+    test_db.commit()
+    response = authorized_client.patch(location, content=content[12:], headers={"Upload-Offset": "12"})
+    assert response.status_code == 409
+    upload.locked_until = None
+    test_db.commit()
+
+    response = authorized_client.patch(location, content=content[12:], headers={"Upload-Offset": "12"})
+    assert response.status_code == 200
+    attachment = response.json()["attachment"]
+    assert attachment["sha256"] == hashlib.sha256(content).hexdigest()
+    assert open(storage.object_path(attachment["sha256"]), "rb").read() == content
+    assert [a["id"] for a in authorized_client.get(f"/cards/{card['id']}/attachments").json()] == [attachment["id"]]
+    assert authorized_client.get(location).status_code == 404
+    assert list((tmp_path / "parts").iterdir()) == []
+
+def test_attachment_download_ranges_and_signed_urls(authorized_client, test_db, monkeypatch, tmp_path):
+    monkeypatch.setattr(storage, "UPLOAD_DIR", str(tmp_path))
+    board = create_test_board(authorized_client, "Files")
+    list1 = create_test_list(board["id"], "List 1", authorized_client)
+    card = create_test_card(list1["id"], "Card", authorized_client)
+    content = bytes(range(256)) * 4
+    attachment = authorized_client.post(
+        f"/cards/{card['id']}/attachments", files={"file": ("pic.png", content, "image/png")}
+    ).json()
+
+    response = authorized_client.get(attachment["url"])
+    assert response.status_code == 200
+    assert response.content == content
+    assert response.headers["content-type"] == "image/png"
+    assert response.headers["etag"] == f'"{attachment["sha256"]}"'
+    assert "immutable" in response.headers["cache-control"]
+    assert response.headers["content-disposition"] == "inline; filename*=UTF-8''pic.png"
+    assert authorized_client.get(attachment["url"], headers={"If-None-Match": response.headers["etag"]}).status_code == 304
+
+    response = authorized_client.get(attachment["url"], headers={"Range": "bytes=10-19"})
+    assert response.status_code == 206
+    assert response.content == content[10:20]
+    assert response.headers["content-range"] == f"bytes 10-19/{len(content)}"
+    assert authorized_client.get(attachment["url"], headers={"Range": "bytes=-4"}).content == content[-4:]
+    assert authorized_client.get(attachment["url"], headers={"Range": "bytes=5000-"}).status_code == 416
+    # A stale If-Range gets the whole file
+    response = authorized_client.get(attachment["url"], headers={"Range": "bytes=0-1", "If-Range": '"other"'})
+    assert response.status_code == 200 and response.content == content
+
+    # Text attachments go out unencoded, so byte ranges and the sha256 ETag stay valid
+    text = authorized_client.post(
+        f"/cards/{card['id']}/attachments", files={"file": ("notes.txt", b"a" * 4096, "text/plain")}
+    ).json()
+    response = authorized_client.get(text["url"], headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+    assert response.headers["accept-ranges"] == "bytes"
+
+    signed = authorized_client.get(f"/attachments/{attachment['id']}/url").json()
+    anonymous = TestClient(app)
+    assert anonymous.get(signed["url"]).content == content
+    assert anonymous.get(signed["url"].replace("signature=", "signature=0")).status_code == 403
+    assert anonymous.get(attachment["url"]).status_code == 401
+    monkeypatch.setattr(downloads.time, "time", lambda: 1e12)
+    assert anonymous.get(signed["url"]).status_code == 403
+
+def test_archived_board_is_rehydrated_by_any_lookup(authorized_client, test_db, monkeypatch, tmp_path):
+    monkeypatch.setattr(storage, "UPLOAD_DIR", str(tmp_path))
+    board = create_test_board(authorized_client, "Dormant")
+    list1 = create_test_list(board["id"], "List 1", authorized_client)
+    card = create_test_card(list1["id"], "Quarterly report", authorized_client)
+    attachment = authorized_client.post(f"/cards/{card['id']}/attachments", files={"file": ("a.txt", b"data")}).json()
+    later = datetime.now(timezone.utc) + timedelta(days=archive.BOARD_ARCHIVE_AFTER_DAYS + 1)
+
+    lookups = [
+        lambda: authorized_client.get(f"/cards/{card['id']}"),
+        lambda: authorized_client.get(f"/lists/{list1['id']}/cards"),
+        lambda: authorized_client.post("/cards/batch/update", json=[{"id": card["id"], "description": "x"}]),
+        lambda: authorized_client.post("/cards/", json={"title": "New", "list_id": list1["id"]}),
+        lambda: authorized_client.get(attachment["url"]),
+        lambda: authorized_client.get("/search", params={"query": "quarterly"}),
+        lambda: authorized_client.get("/search/suggest", params={"query": "quart"}),
+    ]
+    for lookup in lookups:
+        assert archive.sweep(TestingSessionLocal, now=later) == 1
+        assert test_db.query(models.ArchivedRow).count() > 0
+        response = lookup()
+        assert response.status_code == 200, response.text
+        if "search" in str(response.url):
+            assert [r["id"] for r in response.json() if r["type"] == "card"] == [card["id"]]
+        test_db.expire_all()
+        assert test_db.get(models.Board, board["id"]).archived_at is None
+        assert test_db.query(models.ArchivedRow).count() == 0
@@ -0,0 +1,50 @@
+# test_realtime.py
+
+import asyncio
+from app.realtime import Broker, coalesce
+
+
+def event(entity_id, op, title=None, entity="card", board_id=1):
+    return {"board_id": board_id, "entity": entity, "id": entity_id, "op": op, "data": {"title": title}}
+
+
+def test_coalesce_keeps_latest_state_per_entity():
+    events = coalesce([event(1, "updated", "a"), event(2, "created", "b"), event(1, "updated", "c")])
+    assert events == [event(2, "created", "b"), event(1, "updated", "c")]
+
+
+def test_coalesce_folds_create_then_update_and_drops_create_then_delete():
+    events = coalesce([event(1, "created", "a"), event(1, "updated", "b"), event(2, "created"), event(2, "deleted")])
+    assert events == [event(1, "created", "b")]
+
+
+def test_subscription_batches_a_burst_into_one_message():
+    async def scenario():
+        broker = Broker(max_pending=100, coalesce_window=0.01)
+        subscription = broker.subscribe(1)
+        broker.deliver([event(1, "created", "a"), event(9, "created", board_id=2)])
+        broker.deliver([event(1, "updated", "b")])
+        message = await subscription.next_message(timeout=1)
+        broker.unsubscribe(subscription)
+        return message
+
+    message = asyncio.run(scenario())
+    assert message == {"type": "changes", "board_id": 1, "events": [event(1, "created", "b")]}
+
+
+def test_slow_subscriber_is_told_to_resync():
+    async def scenario():
+        broker = Broker(max_pending=3, coalesce_window=0)
+        subscription = broker.subscribe(1)
+        broker.deliver([event(entity_id, "updated") for entity_id in range(5)])
+        await asyncio.sleep(0)
+        first = await subscription.next_message(timeout=1)
+        broker.deliver([event(7, "updated")])
+        second = await subscription.next_message(timeout=1)
+        idle = await subscription.next_message(timeout=0.01)
+        return first, second, idle
+
+    first, second, idle = asyncio.run(scenario())
+    assert first == {"type": "resync", "board_id": 1}
+    assert second["type"] == "changes" and [e["id"] for e in second["events"]] == [7]
+    assert idle is None
@@ -0,0 +1,101 @@
+# test_trigram.py
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app import models
+from app.board_revisions import ChangeEvent
+from app.database import Base
+from app.trigram import BoardPartition, TrigramIndex
+
+
+def make_session():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)
+
+
+def add_board(db, title, cards):
+    user = db.query(models.User).first()
+    if user is None:
+        user = models.User(username="owner", email="owner@example.com", hashed_password="x")
+        db.add(user)
+        db.flush()
+    board = models.Board(title=title, owner_id=user.id)
+    db.add(board)
+    db.flush()
+    board_list = models.List(title="To do", board_id=board.id)
+    db.add(board_list)
+    db.flush()
+    db.add_all(models.Card(title=card_title, description=description, list_id=board_list.id)
+               for card_title, description in cards)
+    db.commit()
+    return user, board
+
+
+def test_partition_matches_substrings_and_ranks_titles_first():
+    partition = BoardPartition(1, 0)
+    partition.put("card", 1, "Quarterly planning", None)
+    partition.put("card", 2, "Retro", "Notes from the planning session")
+    partition.put("card", 3, "Plan B", None)
+
+    hits = partition.search("lanning")
+    assert sorted((hit.id, hit.rank) for hit in hits) == [(1, 2), (2, 1)]
+    assert {hit.id for hit in partition.search("pl")} == {1, 2, 3}
+
+    partition.apply("card", 1, "updated", {"title": "Quarterly review"})
+    assert [hit.id for hit in partition.search("lanning")] == [2]
+    partition.apply("card", 2, "deleted", None)
+    assert partition.search("lanning") == []
+    assert partition.postings.keys() == {gram for text in ("quarterly review", "plan b")
+                                         for gram in (text[i:i + 3] for i in range(len(text) - 2))}
+
+
+def test_index_searches_readable_boards_and_follows_committed_changes():
+    Session = make_session()
+    index = TrigramIndex(enabled=True, max_bytes=10 ** 6, max_board_bytes=10 ** 6)
+    with Session() as db:
+        user, board = add_board(db, "Launch", [("Write release notes", None), ("Announce", "Post the release blog")])
+        assert [(hit.type, hit.title) for hit in index.search(db, user, "eleas")] == [
+            ("card", "Write release notes"), ("card", "Announce"),
+        ]
+        card = db.query(models.Card).filter(models.Card.title == "Announce").one()
+        card_id, revision = card.id, board.revision
+
+    # Another process renames the card: the revision moves on and the partition catches up
+    with Session() as db:
+        db.get(models.Card, card_id).description = "Tweet it"
+        db.commit()
+    with Session() as db:
+        user = db.query(models.User).first()
+        assert [hit.title for hit in index.search(db, user, "eleas")] == ["Write release notes"]
+
+    # Events from local commits are applied directly
+    with Session() as db:
+        partition = index.partition(db, db.get(models.Board, board.id))
+    assert partition.revision == revision + 1
+    index.apply([ChangeEvent(board.id, "card", card_id, "updated", revision + 2, {"title": "Release party"})])
+    assert partition.revision == revision + 2
+    hits = sorted(partition.search("releas"), key=lambda hit: -hit.rank)
+    assert [hit.title for hit in hits] == ["Release party", "Write release notes"]
+    # Events past a gap are left for the next read to catch up on
+    index.apply([ChangeEvent(board.id, "card", card_id, "deleted", revision + 4)])
+    assert partition.revision == revision + 2
+
+
+def test_index_evicts_least_recently_used_boards():
+    Session = make_session()
+    with Session() as db:
+        user, first = add_board(db, "First", [("Card one", "x" * 2000)])
+        _, second = add_board(db, "Second", [("Card two", "y" * 2000)])
+        size = TrigramIndex(True, 10 ** 6, 10 ** 6).load(db, first).size
+        index = TrigramIndex(enabled=True, max_bytes=size + size // 2, max_board_bytes=10 ** 6)
+
+        index.partition(db, first)
+        index.partition(db, second)
+        assert list(index._partitions) == [second.id]
+        assert index.size == index._partitions[second.id].size
+
+        # Boards over the per-board cap are left to the database
+        small = TrigramIndex(enabled=True, max_bytes=10 ** 6, max_board_bytes=size // 2)
+        assert small.search(db, user, "card") is None